@@ -21,6 +21,7 @@ import { getArg, hasFlag, parseSegmentFilter, buildSegmentKey, chunkArray } from
 import { loadDemoSlides } from './utils/demo-discovery';
 import { loadNarrationJson, getNarrationText } from './utils/narration-loader';
 import { loadWhisperUrl } from './utils/server-config';
+import { waitForServerReady } from './utils/server-health';
 import { getAlignmentPath, loadAlignmentData, saveAlignmentData } from './utils/alignment-io';
 
 // Re-export for external importers (e.g., generate-tts.ts previously imported from here)
@@ -104,8 +105,7 @@ export async function generateAlignment(config: AlignConfig) {
   // Health check
   console.log(`Connecting to WhisperX server at ${config.whisperUrl}...`);
   try {
-    const healthResponse = await axios.get(`${config.whisperUrl}/health`, { timeout: 5000 });
-    const health = healthResponse.data;
+    const health = await waitForServerReady(config.whisperUrl);
     console.log(`\u2705 Server is healthy`);
     console.log(`   Engine: ${health.engine}`);
     console.log(`   Model: ${health.model_size}`);
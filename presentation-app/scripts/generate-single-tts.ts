@@ -13,6 +13,7 @@ import { dirname } from 'path';
 import { TtsCacheStore } from './utils/tts-cache';
 import axios from 'axios';
 import { loadTtsServerUrl } from './utils/server-config';
+import { waitForServerReady } from './utils/server-health';
 import { stripMarkers } from './utils/marker-parser';
 import {
   loadNarrationCache,
@@ -53,8 +54,7 @@ async function generateSingleSegment(config: SingleSegmentConfig): Promise<void>
   // Check server health
   try {
     console.log('🔍 Checking TTS server...');
-    const healthResponse = await axios.get(`${config.serverUrl}/health`, { timeout: 5000 });
-    const health = healthResponse.data;
+    const health = await waitForServerReady(config.serverUrl);
     console.log(`✅ Server is healthy (GPU: ${health.gpu_name || 'Unknown'})\n`);
   } catch (error: any) {
     console.error(`❌ Cannot connect to TTS server at ${config.serverUrl}`);
@@ -1,5 +1,6 @@
 import * as fs from 'fs';
 import * as path from 'path';
+import * as readline from 'readline';
 import { fileURLToPath } from 'url';
 import { dirname } from 'path';
 import axios from 'axios';
@@ -8,6 +9,7 @@ import { AudioSegment, SlideComponentWithMetadata } from '@framework/slides/Slid
 import { runDurationCalculation } from './calculate-durations';
 import { generateAlignment } from './generate-alignment';
 import { loadTtsServerUrl, loadWhisperUrl } from './utils/server-config';
+import { waitForServerReady } from './utils/server-health';
 import { stripMarkers } from './utils/marker-parser';
 import { TtsCacheStore, normalizeCachePath } from './utils/tts-cache';
 import {
@@ -412,8 +414,32 @@ interface BatchResult {
 }
 
 /**
- * Send segments to the TTS server in batches, grouped by resolved instruct,
- * write the resulting audio files to disk, and update the cache in-place.
+ * Ask the server's batch planner how long a batch should take, so the request
+ * timeout can be sized to the work instead of a fixed worst case. Falls back
+ * to the 3-hour default when the server has no /estimate endpoint.
+ */
+async function estimateBatchTimeout(
+  serverUrl: string,
+  texts: string[],
+  instructs: string[]
+): Promise<number> {
+  const fallbackMs = 10800000; // 3 hours
+  try {
+    const response = await axios.post(`${serverUrl}/estimate`, { texts, instructs }, { timeout: 5000 });
+    const etaSeconds: number = response.data.eta_seconds;
+    if (typeof etaSeconds !== 'number') return fallbackMs;
+    console.log(`   Server estimate: ${response.data.sub_batches.length} sub-batch(es), ~${Math.ceil(etaSeconds)}s`);
+    // Generous headroom: queueing behind other clients and a cold GPU both stretch the estimate
+    return Math.max(10 * 60 * 1000, etaSeconds * 3 * 1000);
+  } catch {
+    return fallbackMs;
+  }
+}
+
+/**
+ * Send segments to the TTS server in batches (the server groups items by
+ * instruct and length itself), write the resulting audio files to disk, and
+ * update the cache in-place.
  */
 async function generateBatches(
   segmentsToGenerate: SegmentToGenerate[],
@@ -423,33 +449,17 @@ async function generateBatches(
   let generatedCount = 0;
   let errorCount = 0;
 
-  // Group segments by resolved instruct, then process in batches
-  // (each batch call sends a single instruct to the server)
-  const byInstruct = new Map<string | undefined, SegmentToGenerate[]>();
-  for (const seg of segmentsToGenerate) {
-    const key = seg.instruct;
-    if (!byInstruct.has(key)) {
-      byInstruct.set(key, []);
-    }
-    byInstruct.get(key)!.push(seg);
-  }
-
-  const allBatches: { batch: SegmentToGenerate[]; instruct?: string }[] = [];
-  for (const [instruct, segments] of byInstruct) {
-    const chunks = chunkArray(segments, config.batchSize);
-    for (const chunk of chunks) {
-      allBatches.push({ batch: chunk, instruct });
-    }
-  }
+  const allBatches = chunkArray(segmentsToGenerate, config.batchSize);
 
   console.log(`Processing ${allBatches.length} batches (${config.batchSize} segments per batch)...\n`);
 
   for (let batchIdx = 0; batchIdx < allBatches.length; batchIdx++) {
-    const { batch, instruct } = allBatches[batchIdx];
+    const batch = allBatches[batchIdx];
     const batchNum = batchIdx + 1;
+    const instructCount = new Set(batch.map(item => item.instruct).filter(Boolean)).size;
 
     console.log(`\n${'='.repeat(60)}`);
-    console.log(`📦 Batch ${batchNum}/${allBatches.length} (${batch.length} segments${instruct ? `, instruct: "${instruct.substring(0, 40)}..."` : ''})`);
+    console.log(`📦 Batch ${batchNum}/${allBatches.length} (${batch.length} segments${instructCount ? `, ${instructCount} instruct(s)` : ''})`);
     console.log('='.repeat(60));
 
     // Show what's in this batch
@@ -458,54 +468,62 @@ async function generateBatches(
       console.log(`  ${idx + 1}. Ch${item.chapter}/S${item.slide} (${item.segment.id}): "${preview}..."`);
     });
 
+    let savedInBatch = 0;
     try {
       console.log(`\n🔊 Sending batch request to server...`);
 
       // Prepare texts for batch request (strip {#markers} before TTS)
       const texts = batch.map(item => `Speaker 0: ${stripMarkers(item.segment.narrationText!)}`);
+      const instructs = batch.map(item => item.instruct ?? '');
+      const timeout = await estimateBatchTimeout(config.serverUrl, texts, instructs);
 
-      // Call batch endpoint
+      // Call batch endpoint in streaming mode: one NDJSON record per segment as soon as it is ready
       const response = await axios.post(`${config.serverUrl}/generate_batch`, {
         texts,
-        ...(instruct ? { instruct } : {})
+        stream: true,
+        ...(instructs.some(Boolean) ? { instructs } : {})
       }, {
-        timeout: 10800000 // 3 hour timeout for batch
+        timeout,
+        responseType: 'stream'
       });
 
-      if (response.data.success) {
-        const audios = response.data.audios;
-        const sampleRate = response.data.sample_rate;
-
-        console.log(`✅ Received ${audios.length} audio files from server`);
-        console.log(`   Sample rate: ${sampleRate} Hz\n`);
+      let streamError: string | undefined;
+      const lines = readline.createInterface({ input: response.data, crlfDelay: Infinity });
 
-        // Save each audio file
-        for (let i = 0; i < batch.length; i++) {
-          const item = batch[i];
-          const audioBase64 = audios[i];
-          const audioBuffer = Buffer.from(audioBase64, 'base64');
-
-          fs.writeFileSync(item.filepath, audioBuffer);
-          console.log(`  ✅ [${i + 1}/${batch.length}] Saved: ${item.filename}`);
-          generatedCount++;
-
-          // Update cache
-          const relativeFilepath = normalizeCachePath(path.relative(path.join(config.outputDir, item.demoId), item.filepath));
-          store.setEntry(item.demoId, relativeFilepath, item.segment.narrationText!, item.instruct);
+      for await (const line of lines) {
+        if (!line.trim()) continue;
+        const record = JSON.parse(line);
+        if (record.error) {
+          streamError = record.error;
+          break;
         }
+        if (record.done) break;
+
+        // Save each audio file as it arrives
+        const item = batch[record.index];
+        fs.writeFileSync(item.filepath, Buffer.from(record.audio, 'base64'));
+        savedInBatch++;
+        generatedCount++;
+        console.log(`  ✅ [${savedInBatch}/${batch.length}] Saved: ${item.filename}${record.cached ? ' (server cache)' : ''}`);
+
+        // Update and persist the cache so an interrupted run keeps finished segments
+        const relativeFilepath = normalizeCachePath(path.relative(path.join(config.outputDir, item.demoId), item.filepath));
+        store.setEntry(item.demoId, relativeFilepath, item.segment.narrationText!, item.instruct);
+        store.save();
+      }
 
-      } else {
-        console.error(`❌ Server error: ${response.data.error || 'Unknown error'}`);
-        errorCount += batch.length;
+      if (savedInBatch < batch.length) {
+        console.error(`❌ Server error: ${streamError || 'stream ended before all segments were received'}`);
+        errorCount += batch.length - savedInBatch;
       }
 
     } catch (error: any) {
       if (error.code === 'ECONNABORTED') {
-        console.error(`❌ Batch timeout (took > 15 minutes)`);
+        console.error(`❌ Batch timeout (took longer than the server's estimate allowed)`);
       } else {
         console.error(`❌ Error: ${error.message}`);
       }
-      errorCount += batch.length;
+      errorCount += batch.length - savedInBatch;
     }
 
     // Show progress
@@ -597,8 +615,7 @@ async function generateTTS(config: TTSConfig) {
   // Check server health
   console.log(`Connecting to TTS server at ${config.serverUrl}...`);
   try {
-    const healthResponse = await axios.get(`${config.serverUrl}/health`, { timeout: 5000 });
-    const health = healthResponse.data;
+    const health = await waitForServerReady(config.serverUrl);
     console.log(`✅ Server is healthy`);
     console.log(`   Model loaded: ${health.model_loaded}`);
     console.log(`   GPU: ${health.gpu_name || 'Unknown'}\n`);
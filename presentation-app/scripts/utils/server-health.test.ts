@@ -0,0 +1,65 @@
+import { describe, it, expect, vi, beforeEach } from 'vitest';
+import axios from 'axios';
+import { waitForServerReady } from './server-health';
+
+vi.mock('axios');
+
+const mockedGet = vi.mocked(axios.get);
+
+function healthResponse(data: object) {
+  return { data } as any;
+}
+
+beforeEach(() => {
+  vi.clearAllMocks();
+});
+
+describe('waitForServerReady', () => {
+  it('resolves immediately for a ready server', async () => {
+    mockedGet.mockResolvedValueOnce(healthResponse({ status: 'ok', state: 'ready', gpu_name: 'GPU' }));
+
+    const health = await waitForServerReady('http://tts:5000', { pollMs: 0 });
+
+    expect(health.gpu_name).toBe('GPU');
+    expect(mockedGet).toHaveBeenCalledTimes(1);
+    expect(mockedGet).toHaveBeenCalledWith('http://tts:5000/health', { timeout: 5000 });
+  });
+
+  it('treats servers without a state field as ready', async () => {
+    mockedGet.mockResolvedValueOnce(healthResponse({ status: 'ok', model_loaded: true }));
+
+    await expect(waitForServerReady('http://tts:5000', { pollMs: 0 })).resolves.toMatchObject({ model_loaded: true });
+  });
+
+  it('polls while loading and warming, reporting progress', async () => {
+    mockedGet
+      .mockResolvedValueOnce(healthResponse({ state: 'loading', startup: { progress: 0.2, detail: 'Loading', error: null } }))
+      .mockResolvedValueOnce(healthResponse({ state: 'warming', startup: { progress: 0.9, detail: 'Warm-up', error: null } }))
+      .mockResolvedValueOnce(healthResponse({ state: 'ready', startup: { progress: 1, detail: 'Ready', error: null } }));
+    const onProgress = vi.fn();
+
+    const health = await waitForServerReady('http://tts:5000', { pollMs: 0, onProgress });
+
+    expect(health.state).toBe('ready');
+    expect(onProgress.mock.calls.map(([h]) => h.state)).toEqual(['loading', 'warming']);
+  });
+
+  it('rejects when the model failed to load', async () => {
+    mockedGet.mockResolvedValueOnce(healthResponse({ state: 'failed', startup: { progress: 0.1, detail: 'Startup failed', error: 'CUDA is not available' } }));
+
+    await expect(waitForServerReady('http://tts:5000', { pollMs: 0 })).rejects.toThrow('CUDA is not available');
+  });
+
+  it('rejects after the timeout', async () => {
+    mockedGet.mockResolvedValue(healthResponse({ state: 'loading', startup: { progress: 0, detail: '', error: null } }));
+
+    await expect(waitForServerReady('http://tts:5000', { pollMs: 0, timeoutMs: 0, onProgress: () => {} }))
+      .rejects.toThrow('not ready');
+  });
+
+  it('propagates connection errors', async () => {
+    mockedGet.mockRejectedValueOnce(new Error('connect ECONNREFUSED'));
+
+    await expect(waitForServerReady('http://tts:5000')).rejects.toThrow('ECONNREFUSED');
+  });
+});
@@ -0,0 +1,54 @@
+/**
+ * Readiness check for the TTS and WhisperX servers.
+ *
+ * The servers bind their port immediately and load the model on a background
+ * thread. `/health` reports `state` (loading → warming → ready, or failed)
+ * with `startup.progress`, and model endpoints answer 503 until ready.
+ * Servers without a `state` field are ready as soon as `/health` answers.
+ */
+import axios from 'axios';
+
+export interface ServerHealth {
+  state?: 'loading' | 'warming' | 'ready' | 'failed';
+  startup?: { progress: number; detail: string; error: string | null };
+  [key: string]: any;
+}
+
+export interface WaitOptions {
+  /** Give up after this long (default: 15 minutes). */
+  timeoutMs?: number;
+  /** Delay between /health polls while loading (default: 2 s). */
+  pollMs?: number;
+  /** Called on every poll while the server is not ready yet. */
+  onProgress?: (health: ServerHealth) => void;
+}
+
+function logProgress(health: ServerHealth): void {
+  const progress = Math.round((health.startup?.progress ?? 0) * 100);
+  console.log(`   Server is ${health.state} (${progress}%): ${health.startup?.detail ?? ''}`);
+}
+
+/**
+ * GET `${url}/health`, polling while the model loads. Resolves with the
+ * health payload once ready; rejects if the server is unreachable, failed
+ * to load its model, or is not ready within the timeout.
+ */
+export async function waitForServerReady(url: string, options: WaitOptions = {}): Promise<ServerHealth> {
+  const { timeoutMs = 15 * 60 * 1000, pollMs = 2000, onProgress = logProgress } = options;
+  const deadline = Date.now() + timeoutMs;
+
+  for (;;) {
+    const health: ServerHealth = (await axios.get(`${url}/health`, { timeout: 5000 })).data;
+    if (health.state === 'failed') {
+      throw new Error(`Server failed to load its model: ${health.startup?.error ?? 'unknown error'}`);
+    }
+    if (health.state !== 'loading' && health.state !== 'warming') {
+      return health;
+    }
+    if (Date.now() >= deadline) {
+      throw new Error(`Server at ${url} was not ready within ${Math.round(timeoutMs / 1000)}s`);
+    }
+    onProgress(health);
+    await new Promise(resolve => setTimeout(resolve, pollMs));
+  }
+}
@@ -9,6 +9,7 @@ import { getArg, hasFlag, parseSegmentFilter, buildSegmentKey, chunkArray } from
 import { loadDemoSlides } from './utils/demo-discovery.js';
 import { loadNarrationJson, getNarrationText } from './utils/narration-loader.js';
 import { loadWhisperUrl } from './utils/server-config';
+import { waitForServerReady } from './utils/server-health';
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = dirname(__filename);
@@ -97,8 +98,7 @@ async function verifyTTS(config: VerifyConfig) {
   // Health check
   console.log(`Connecting to Whisper server at ${config.whisperUrl}...`);
   try {
-    const healthResponse = await axios.get(`${config.whisperUrl}/health`, { timeout: 5000 });
-    const health = healthResponse.data;
+    const health = await waitForServerReady(config.whisperUrl);
     console.log(`\u2705 Server is healthy`);
     console.log(`   Engine: ${health.engine}`);
     console.log(`   Model: ${health.model_size}`);
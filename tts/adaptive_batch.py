@@ -0,0 +1,156 @@
+"""
+Out-of-memory resilient batch execution for the TTS servers.
+
+A sub-batch that runs the GPU out of memory is split in half and each half
+is retried (recursively, down to single items), so one oversized request no
+longer fails as a whole. Each failure teaches the executor a safe batch size
+for that length bucket: later sub-batches of the same (or longer) items are
+cut to that size up front instead of failing again. After ``probe_every``
+clean batches in a bucket, its size is raised by one to find the real limit
+again, but never to a size that has already failed there.
+
+Length buckets are powers of ``bucket_base`` of the longest item's cost in
+characters, because memory grows with batch size times padded length.
+
+Cached GPU memory is only released after an out-of-memory error, or when the
+engine reports that reserved memory exceeds ``pressure_threshold``. It is not
+released after every batch.
+"""
+
+import math
+import threading
+
+
+def is_out_of_memory(exc: BaseException) -> bool:
+    """True for torch.cuda.OutOfMemoryError and the RuntimeErrors older torch versions raise."""
+    return type(exc).__name__ == "OutOfMemoryError" or "out of memory" in str(exc).lower()
+
+
+def cuda_memory_pressure() -> float:
+    """Fraction of the current CUDA device's memory held by the caching allocator (0.0 without CUDA)."""
+    import torch
+    if not torch.cuda.is_available():
+        return 0.0
+    total = torch.cuda.get_device_properties(torch.cuda.current_device()).total_memory
+    return torch.cuda.memory_reserved() / total
+
+
+def cuda_release_memory():
+    import torch
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class AdaptiveBatchExecutor:
+    """Runs sub-batches, halving them on out-of-memory errors and remembering safe sizes."""
+
+    def __init__(self, release_memory=None, memory_pressure=None, pressure_threshold: float = 0.9,
+                 bucket_base: float = 2.0, probe_every: int = 50):
+        self.release_memory = release_memory or (lambda: None)
+        self.memory_pressure = memory_pressure or (lambda: 0.0)
+        self.pressure_threshold = pressure_threshold
+        self.bucket_base = max(1.1, bucket_base)
+        self.probe_every = max(1, probe_every)
+
+        self._limits: dict[int, int] = {}   # bucket -> largest batch size believed safe
+        self._failed: dict[int, int] = {}   # bucket -> smallest batch size that ran out of memory
+        self._good: dict[int, int] = {}     # bucket -> largest batch size that has succeeded
+        self._clean: dict[int, int] = {}    # bucket -> clean batches since the limit last changed
+        self._lock = threading.Lock()
+        self.ooms = 0
+        self.splits = 0
+        self.releases = 0
+
+    # ── Learned limits ──────────────────────────────────────────────
+
+    def bucket(self, max_cost: int) -> int:
+        return int(math.log(max(1, max_cost), self.bucket_base))
+
+    def limit(self, max_cost: int) -> int | None:
+        """Largest batch size currently allowed for items up to max_cost (None = no limit yet)."""
+        bucket = self.bucket(max_cost)
+        with self._lock:
+            # Longer items need at least as much memory, so shorter buckets' limits apply too
+            limits = [n for b, n in self._limits.items() if b <= bucket]
+        return min(limits) if limits else None
+
+    def _record_oom(self, bucket: int, size: int):
+        with self._lock:
+            self.ooms += 1
+            self._failed[bucket] = min(size, self._failed.get(bucket, size))
+            # A failed probe falls back to the last size that worked; otherwise halve
+            good = self._good.get(bucket, 0)
+            safe = max(1, good if 0 < good < size else size // 2)
+            if self._limits.get(bucket, math.inf) > safe:
+                self._limits[bucket] = safe
+                self._clean[bucket] = 0
+
+    def _record_success(self, bucket: int, size: int):
+        with self._lock:
+            self._good[bucket] = max(size, self._good.get(bucket, 0))
+            limit = self._limits.get(bucket)
+            if limit is None:
+                return
+            self._clean[bucket] = self._clean.get(bucket, 0) + 1
+            if self._clean[bucket] >= self.probe_every and limit + 1 < self._failed.get(bucket, math.inf):
+                self._limits[bucket] = limit + 1
+                self._clean[bucket] = 0
+
+    # ── Execution ───────────────────────────────────────────────────
+
+    def run(self, items: list, costs: list[int], run_batch) -> list:
+        """Outputs of run_batch for items, in order, splitting on out-of-memory errors."""
+        max_cost = max(costs)
+        limit = self.limit(max_cost)
+        if limit is not None and len(items) > limit:
+            # Even chunks of at most `limit` items
+            chunks = -(-len(items) // limit)
+            bounds = [round(i * len(items) / chunks) for i in range(chunks + 1)]
+            outputs = []
+            for start, end in zip(bounds, bounds[1:]):
+                outputs.extend(self._run_split(items[start:end], costs[start:end], run_batch))
+            return outputs
+        return self._run_split(items, costs, run_batch)
+
+    def _run_split(self, items: list, costs: list[int], run_batch) -> list:
+        bucket = self.bucket(max(costs))
+        try:
+            outputs = run_batch(items)
+        except Exception as e:
+            if not is_out_of_memory(e) or len(items) == 1:
+                raise
+            self._record_oom(bucket, len(items))
+            print(f"  Out of memory on a batch of {len(items)} (up to {max(costs)} chars); splitting in half")
+            outputs = None
+        if outputs is not None:
+            self._record_success(bucket, len(items))
+            self._release_under_pressure()
+            return outputs
+
+        # Retry outside the except block so the failed batch's tensors can be freed first
+        self.release()
+        self.splits += 1
+        half = len(items) // 2
+        return self.run(items[:half], costs[:half], run_batch) + self.run(items[half:], costs[half:], run_batch)
+
+    def release(self):
+        self.releases += 1
+        self.release_memory()
+
+    def _release_under_pressure(self):
+        try:
+            pressure = self.memory_pressure()
+        except Exception:
+            return
+        if pressure > self.pressure_threshold:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            limits = {f"<{int(self.bucket_base ** (b + 1))} chars": n for b, n in sorted(self._limits.items())}
+        return {
+            "ooms": self.ooms,
+            "splits": self.splits,
+            "releases": self.releases,
+            "safe_batch_sizes": limits,
+        }
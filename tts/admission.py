@@ -0,0 +1,146 @@
+"""
+Admission control and backpressure for the model servers.
+
+Every request declares a cost up front (text characters for TTS, audio
+samples for WhisperX) and must be admitted before it touches the model. The
+controller bounds both the number of in-flight requests and their summed
+cost; when either bound would be exceeded the request is rejected with
+``Overloaded`` so the server can answer ``429`` with a ``Retry-After`` hint
+instead of piling up threads until CUDA runs out of memory.
+
+A single request costlier than the whole budget is still admitted when
+nothing else is in flight, otherwise it could never run.
+"""
+
+import math
+import threading
+import time
+
+from flask import jsonify
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("cost", "admitted_at")
+
+    def __init__(self, cost: float):
+        self.cost = cost
+        self.admitted_at = time.monotonic()
+
+
+class AdmissionController:
+    """Bounded in-flight queue with per-request cost accounting."""
+
+    def __init__(self, max_requests: int = 64, max_cost: float = 200_000, cost_unit: str = "chars",
+                 seconds_per_unit: float = 0.05, smoothing: float = 0.2):
+        self.max_requests = max(1, max_requests)
+        self.max_cost = max_cost
+        self.cost_unit = cost_unit
+        self.seconds_per_unit = seconds_per_unit
+        self.smoothing = smoothing
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.in_flight_cost = 0.0
+        self.admitted = 0
+        self.rejected = 0
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.in_flight_cost * self.seconds_per_unit / max(1, self.in_flight)))
+
+    def acquire(self, cost: float) -> _Ticket:
+        """Admit a request of the given cost or raise Overloaded."""
+        with self._lock:
+            if self.in_flight >= self.max_requests:
+                reason = f"Server busy: {self.in_flight} requests in flight (max {self.max_requests})"
+            elif self.in_flight and self.in_flight_cost + cost > self.max_cost:
+                reason = (f"Server busy: {self.in_flight_cost:.0f} + {cost:.0f} {self.cost_unit} "
+                          f"would exceed the in-flight budget of {self.max_cost:.0f}")
+            else:
+                self.in_flight += 1
+                self.in_flight_cost += cost
+                self.admitted += 1
+                return _Ticket(cost)
+            self.rejected += 1
+            raise Overloaded(self._retry_after(), reason)
+
+    def release(self, ticket: _Ticket):
+        """Return a ticket's budget and learn the server's cost throughput."""
+        elapsed = time.monotonic() - ticket.admitted_at
+        with self._lock:
+            self.in_flight -= 1
+            self.in_flight_cost -= ticket.cost
+            if ticket.cost > 0:
+                sample = elapsed / ticket.cost
+                self.seconds_per_unit += self.smoothing * (sample - self.seconds_per_unit)
+
+    def admit(self, cost: float):
+        """Context manager: hold an admission ticket for the duration of a block."""
+        return _Admission(self, cost)
+
+    def hold(self, ticket: _Ticket, body):
+        """Wrap a streaming response body so the ticket is released when it ends."""
+        try:
+            yield from body
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        """Queue depth and counters, for /health."""
+        with self._lock:
+            return {
+                "queue_depth": self.in_flight,
+                "max_requests": self.max_requests,
+                "queued_cost": round(self.in_flight_cost),
+                "max_cost": self.max_cost,
+                "cost_unit": self.cost_unit,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+class _Admission:
+    def __init__(self, controller: AdmissionController, cost: float):
+        self.controller = controller
+        self.cost = cost
+        self.ticket = None
+
+    def __enter__(self):
+        self.ticket = self.controller.acquire(self.cost)
+        return self.ticket
+
+    def __exit__(self, *exc):
+        self.controller.release(self.ticket)
+        return False
+
+
+def overloaded_response(e: Overloaded):
+    """429 response for a rejected request."""
+    print(f"Rejected: {e}")
+    response = jsonify({"error": str(e), "retry_after": e.retry_after, "success": False})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+# Typical size of PCM_16 relative to a compressed upload, by the base64 of its magic bytes
+_COMPRESSION_RATIOS = {
+    "ZkxhQ": 2,    # fLaC
+    "T2dnU": 10,   # OggS (Opus/Vorbis)
+}
+
+
+def estimate_samples(audio_b64: str, bytes_per_sample: int = 2) -> int:
+    """
+    Approximate decoded sample count of a base64 PCM_16 WAV without decoding it
+    (FLAC and Ogg uploads are scaled by their typical compression ratio).
+    """
+    ratio = _COMPRESSION_RATIOS.get(audio_b64[:5], 1)
+    return len(audio_b64) * 3 // 4 // bytes_per_sample * ratio
@@ -0,0 +1,117 @@
+"""
+Per-language pool of alignment models for the WhisperX server.
+
+Forced alignment needs a wav2vec2 model for the request's language. The pool
+keeps loaded models by language code, least recently used first, and evicts
+the oldest ones once their parameters exceed ``max_bytes``. The model just
+loaded is never evicted, so a single oversized model still works.
+
+Models load on a background thread, one at a time. ``get(language)`` starts
+the load on first use and waits up to ``timeout`` seconds for it. Concurrent
+requests for the same language share one load, and requests for languages
+that are already loaded are not held up. On timeout it raises ``NotReady``,
+so the server answers 503 with a Retry-After hint. ``preload(languages)``
+queues loads at startup.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from startup import NotReady
+
+
+def parameter_bytes(model) -> int:
+    """Bytes held by a torch model's parameters and buffers (0 for anything else)."""
+    tensors = [*getattr(model, "parameters", list)(), *getattr(model, "buffers", list)()]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class AlignModelPool:
+    """Alignment models by language, LRU-evicted under a memory cap."""
+
+    def __init__(self, load, release=None, size_of=parameter_bytes, max_bytes: int = 4 * 1024 ** 3):
+        self.load = load            # language -> (model, metadata)
+        self.release = release      # called after a model is evicted
+        self.size_of = size_of
+        self.max_bytes = max_bytes
+
+        self._models: OrderedDict[str, tuple] = OrderedDict()  # language -> (model, metadata)
+        self._sizes: dict[str, int] = {}
+        self._loading: dict[str, Future] = {}
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="align-loader")
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds: dict[str, float] = {}
+
+    def get(self, language: str, timeout: float | None = None) -> tuple:
+        """(model, metadata) for language, loading it in the background if needed. Raises NotReady on timeout."""
+        with self._lock:
+            entry = self._models.get(language)
+            if entry is not None:
+                self._models.move_to_end(language)
+                return entry
+            future = self._start(language)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            raise NotReady(5, f"Loading the alignment model for '{language}'") from None
+
+    def preload(self, languages: list[str]):
+        """Queue background loads for languages that are not loaded yet."""
+        with self._lock:
+            for language in languages:
+                if language not in self._models:
+                    self._start(language)
+
+    def _start(self, language: str) -> Future:
+        future = self._loading.get(language)
+        if future is None:
+            future = self._loading[language] = self._loader.submit(self._load, language)
+        return future
+
+    def _load(self, language: str) -> tuple:
+        started = time.monotonic()
+        print(f"Loading alignment model for language: {language}...")
+        try:
+            entry = self.load(language)
+            size = self.size_of(entry[0])
+        except Exception:
+            with self._lock:
+                del self._loading[language]  # a later request retries
+            raise
+        seconds = round(time.monotonic() - started, 2)
+        print(f"Alignment model for '{language}' loaded in {seconds:.1f}s ({size / 1024 ** 2:.0f} MB)")
+
+        evicted = []
+        with self._lock:
+            self._models[language] = entry
+            self._sizes[language] = size
+            del self._loading[language]
+            self.loads += 1
+            self.load_seconds[language] = seconds
+            while len(self._models) > 1 and sum(self._sizes.values()) > self.max_bytes:
+                oldest = self._models.popitem(last=False)[0]
+                del self._sizes[oldest]
+                evicted.append(oldest)
+                self.evictions += 1
+        if evicted:
+            print(f"Evicted alignment models {evicted} (memory cap {self.max_bytes / 1024 ** 3:.1f} GB)")
+            if self.release is not None:
+                self.release()  # in-flight alignments may still hold an evicted model until they finish
+        return entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": {language: round(self._sizes[language] / 1024 ** 2, 1) for language in self._models},
+                "loading": list(self._loading),
+                "used_mb": round(sum(self._sizes.values()) / 1024 ** 2, 1),
+                "max_mb": round(self.max_bytes / 1024 ** 2, 1),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "load_seconds": dict(self.load_seconds),
+            }
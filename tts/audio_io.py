@@ -0,0 +1,248 @@
+"""
+Audio encoding and binary transport helpers shared by the model servers and client.
+
+``encode_wav`` writes a PCM_16 WAV header and the converted samples straight
+into one preallocated buffer (no soundfile/BytesIO round trip), and the
+result is used as-is for cache entries, raw ``audio/wav`` response bodies and
+binary batch frames.
+
+Batches can be sent as a length-prefixed binary stream (``FRAMES_MIMETYPE``)
+instead of base64 inside JSON. Each frame is an 8-byte little-endian header
+``(index: uint32, length: uint32)`` followed by ``length`` bytes of WAV data,
+in completion order. A frame with index ``ERROR_INDEX`` carries a UTF-8 error
+message and ends the stream.
+
+Responses can also be compressed (``AudioFormat``): lossless FLAC (about half
+the size of WAV) or Ogg Opus at a chosen bitrate (about 10x smaller at
+32 kbps). Generated audio is always produced and cached as WAV and transcoded
+per response; ``decode_audio`` reads any of the formats back.
+"""
+
+import io
+import struct
+from dataclasses import dataclass
+
+import numpy as np
+import soundfile as sf
+
+WAV_MIMETYPE = "audio/wav"
+FORMAT_MIMETYPES = {"wav": WAV_MIMETYPE, "flac": "audio/flac", "opus": "audio/ogg"}
+FORMAT_EXTENSIONS = {"wav": ".wav", "flac": ".flac", "opus": ".opus"}
+DEFAULT_OPUS_KBPS = 32
+FRAMES_MIMETYPE = "application/x-wav-frames"
+
+FRAME_HEADER = struct.Struct("<II")
+ERROR_INDEX = 0xFFFFFFFF
+
+_WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+WAV_HEADER_SIZE = _WAV_HEADER.size  # 44
+
+
+def to_float32(audio) -> np.ndarray:
+    """Model output (tensor or array, any float dtype) as a 1-D float32 array."""
+    if hasattr(audio, "detach"):
+        audio = audio.detach().float().cpu().numpy()
+    audio = np.asarray(audio).squeeze()
+    if audio.dtype != np.float32:
+        audio = audio.astype(np.float32)
+    return audio
+
+
+def encode_wav(audio, sample_rate: int) -> bytes:
+    """Encode mono float audio as a PCM_16 WAV, written directly into one buffer."""
+    audio = to_float32(audio)
+    data_size = audio.size * 2
+
+    buf = bytearray(WAV_HEADER_SIZE + data_size)
+    _WAV_HEADER.pack_into(
+        buf, 0,
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", data_size,
+    )
+
+    # Scale, round and clip in float32, then cast into the buffer's sample area
+    pcm = np.frombuffer(buf, dtype="<i2", offset=WAV_HEADER_SIZE)
+    scaled = np.multiply(audio, 32767.0, dtype=np.float32)
+    np.rint(scaled, out=scaled)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    pcm[:] = scaled
+    del pcm  # release the export so the buffer can be frozen
+    return bytes(buf)  # WSGI servers only accept immutable bytes
+
+
+def decode_wav(data: bytes) -> np.ndarray:
+    """Samples of a WAV written by encode_wav, as float32 in [-1, 1]."""
+    pcm = np.frombuffer(data, dtype="<i2", offset=WAV_HEADER_SIZE)
+    return pcm.astype(np.float32) / 32767.0
+
+
+def wav_sample_rate(data: bytes) -> int:
+    return _WAV_HEADER.unpack_from(data)[7]
+
+
+def wav_duration(data: bytes) -> float:
+    """Seconds of audio in a WAV written by encode_wav."""
+    return round((len(data) - WAV_HEADER_SIZE) / (2 * wav_sample_rate(data)), 3)
+
+
+def wants(request, *mimetypes: str) -> bool:
+    """True if the request's Accept header prefers one of mimetypes over JSON."""
+    return request.accept_mimetypes.best_match(["application/json", *mimetypes]) in mimetypes
+
+
+# ── Compressed formats ──────────────────────────────────────────────
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    name: str = "wav"
+    bitrate: int | None = None  # kbps, Opus only
+
+    @property
+    def mimetype(self) -> str:
+        return FORMAT_MIMETYPES[self.name]
+
+    @property
+    def extension(self) -> str:
+        return FORMAT_EXTENSIONS[self.name]
+
+    @property
+    def spec(self) -> str:
+        """Compact form for storage, e.g. "opus:32" (see parse_format)."""
+        return f"{self.name}:{self.bitrate}" if self.bitrate else self.name
+
+
+WAV = AudioFormat()
+
+
+def parse_format(name: str | None, bitrate=None) -> AudioFormat:
+    """
+    AudioFormat for a request's "format" ("wav", "flac", "opus" or "opus:<kbps>")
+    and optional "bitrate" in kbps. Raises UnsupportedFormat.
+    """
+    name = (name or "wav").lower()
+    if ":" in name:
+        name, bitrate = name.split(":", 1)
+    if name not in FORMAT_MIMETYPES:
+        raise UnsupportedFormat(f"Unsupported audio format '{name}' (expected one of: {', '.join(FORMAT_MIMETYPES)})")
+    if name != "opus":
+        return AudioFormat(name)
+    try:
+        bitrate = int(bitrate or DEFAULT_OPUS_KBPS)
+    except ValueError:
+        raise UnsupportedFormat(f"Invalid bitrate '{bitrate}'")
+    if not 6 <= bitrate <= 256:
+        raise UnsupportedFormat(f"Opus bitrate must be 6-256 kbps, got {bitrate}")
+    return AudioFormat("opus", bitrate)
+
+
+def encode_audio(audio, sample_rate: int, fmt: AudioFormat) -> bytes:
+    """Encode mono float audio in fmt (WAV goes through encode_wav)."""
+    if fmt.name == "wav":
+        return encode_wav(audio, sample_rate)
+    buf = io.BytesIO()
+    if fmt.name == "flac":
+        sf.write(buf, to_float32(audio), sample_rate, format="FLAC", subtype="PCM_16")
+    else:
+        # libsndfile maps compression level 0..1 linearly onto roughly 256..6 kbps
+        level = min(1.0, max(0.0, 1.0 - (fmt.bitrate - 6) / 250))
+        sf.write(buf, to_float32(audio), sample_rate, format="OGG", subtype="OPUS", compression_level=level)
+    return buf.getvalue()
+
+
+def transcode_wav(wav: bytes, fmt: AudioFormat) -> bytes:
+    """Re-encode a WAV from encode_wav in fmt (returned as-is for WAV)."""
+    if fmt.name == "wav":
+        return wav
+    return encode_audio(decode_wav(wav), wav_sample_rate(wav), fmt)
+
+
+def decode_audio(data: bytes) -> tuple[np.ndarray, int]:
+    """
+    Decode WAV, FLAC or Ogg Opus/Vorbis bytes to (mono float32 samples, sample rate).
+    Raises UnsupportedFormat for data libsndfile cannot read.
+    """
+    try:
+        audio, sample_rate = sf.read(io.BytesIO(data), dtype="float32")
+    except sf.SoundFileError:
+        raise UnsupportedFormat("Unreadable audio file (expected WAV, FLAC or Ogg Opus/Vorbis)") from None
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1, dtype=np.float32)
+    return audio, sample_rate
+
+
+# Headerless mono PCM accepted by the WhisperX server, by encoding name
+RAW_ENCODINGS = {"f32le": np.dtype("<f4"), "s16le": np.dtype("<i2")}
+
+
+def decode_raw(data: bytes, encoding: str) -> np.ndarray:
+    """
+    Headerless mono PCM ("f32le" or "s16le") as float32 samples. Raises
+    UnsupportedFormat if the data is not a whole number of samples.
+    """
+    dtype = RAW_ENCODINGS.get(encoding)
+    if dtype is None:
+        raise UnsupportedFormat(f"Unsupported raw encoding: {encoding} (expected one of {', '.join(RAW_ENCODINGS)})")
+    if len(data) % dtype.itemsize:
+        raise UnsupportedFormat(
+            f"{encoding} payload of {len(data)} bytes is not a whole number of {dtype.itemsize}-byte samples")
+    samples = np.frombuffer(data, dtype=dtype)
+    if encoding == "s16le":
+        return np.multiply(samples, 1.0 / 32768, dtype=np.float32)
+    return samples.astype(np.float32)  # native byte order, writable
+
+
+# ── Length-prefixed frames ──────────────────────────────────────────
+
+def frame_header(index: int, length: int) -> bytes:
+    return FRAME_HEADER.pack(index, length)
+
+
+def error_frame(message: str) -> bytes:
+    payload = message.encode("utf-8")
+    return FRAME_HEADER.pack(ERROR_INDEX, len(payload)) + payload
+
+
+def _read_exact(stream, n: int) -> bytes:
+    data = stream.read(n)
+    while len(data) < n:
+        more = stream.read(n - len(data))
+        if not more:
+            raise EOFError(f"Stream ended mid-frame ({len(data)}/{n} bytes)")
+        data += more
+    return data
+
+
+def iter_frames(stream):
+    """
+    Yield (index, length) for each frame of a binary batch response.
+    The caller must consume exactly ``length`` payload bytes (e.g. with
+    copy_payload) before advancing. Raises RuntimeError on an error frame.
+    """
+    while True:
+        header = stream.read(FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER.size:
+            header += _read_exact(stream, FRAME_HEADER.size - len(header))
+        index, length = FRAME_HEADER.unpack(header)
+        if index == ERROR_INDEX:
+            raise RuntimeError(_read_exact(stream, length).decode("utf-8", "replace"))
+        yield index, length
+
+
+def copy_payload(stream, fileobj, length: int, chunk_size: int = 1 << 20):
+    """Copy exactly length bytes from stream to fileobj through one reusable buffer."""
+    buf = bytearray(min(chunk_size, max(length, 1)))
+    view = memoryview(buf)
+    remaining = length
+    while remaining:
+        n = stream.readinto(view[:min(remaining, len(buf))])
+        if not n:
+            raise EOFError(f"Stream ended mid-frame ({length - remaining}/{length} bytes)")
+        fileobj.write(view[:n])
+        remaining -= n
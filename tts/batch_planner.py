@@ -0,0 +1,147 @@
+"""
+Cost-model batch planner for TTS batches.
+
+Autoregressive TTS pads every item in a batch up to the longest one, so a
+batch costs roughly ``overhead + seconds_per_char * longest_item``. The planner
+estimates each item's cost from its text length, groups items that must not
+share a model call (e.g. different instructs), sorts each group by length and
+cuts it into sub-batches whose lengths stay within ``bucket_ratio`` of each
+other (items less than ``min_gap_chars`` apart always share one, so very short
+items are not split by the ratio alone). Results are always returned in the
+caller's original order.
+
+The overhead and per-character rate start from conservative defaults and are
+fitted to observed batch timings (least squares over exponentially weighted
+samples), which keeps the ETA that ``/estimate`` reports close to what the GPU
+actually does. Until the observed batches differ enough in length to separate
+the two, only the rate is refined, and a batch faster than the assumed
+overhead lowers the overhead instead of driving the rate to zero.
+"""
+
+import threading
+import time
+
+MIN_FIT_SPREAD_CHARS = 20.0  # std-dev of observed batch lengths needed to fit overhead and rate together
+
+
+def estimate_cost(text: str) -> int:
+    """Cost of one item in characters of speakable text (never zero)."""
+    return max(1, len(text.strip()))
+
+
+class BatchPlanner:
+    """Plans, runs and times sub-batches for a list of TTS items."""
+
+    def __init__(self, max_batch_size: int = 16, bucket_ratio: float = 1.5, min_gap_chars: int = 40,
+                 seconds_per_char: float = 0.07, overhead_seconds: float = 2.0,
+                 smoothing: float = 0.2, log=None):
+        self.log = log  # SampledLog for per-call "planned" events (optional)
+        self.max_batch_size = max(1, max_batch_size)
+        self.bucket_ratio = max(1.0, bucket_ratio)
+        self.min_gap_chars = max(0, min_gap_chars)
+        self.seconds_per_char = seconds_per_char
+        self.overhead_seconds = overhead_seconds
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._sums = [0.0] * 5  # decayed sums of 1, cost, seconds, cost², cost·seconds
+        self.observed_batches = 0
+
+    # ── Planning ────────────────────────────────────────────────────
+
+    def plan(self, costs: list[int], groups: list | None = None) -> list[list[int]]:
+        """
+        Split item indices into sub-batches.
+        Items with different group keys never share a sub-batch; within a group,
+        items are sorted by cost and bucketed so the longest item in a sub-batch
+        is at most bucket_ratio times the shortest, or at most min_gap_chars longer.
+        """
+        if groups is None:
+            groups = [None] * len(costs)
+
+        by_group: dict = {}
+        for idx, group in enumerate(groups):
+            by_group.setdefault(group, []).append(idx)
+
+        batches = []
+        for indices in by_group.values():
+            indices.sort(key=lambda i: costs[i])
+            current: list[int] = []
+            for idx in indices:
+                shortest = costs[current[0]] if current else 0
+                if current and (len(current) >= self.max_batch_size
+                                or (costs[idx] > shortest * self.bucket_ratio
+                                    and costs[idx] - shortest > self.min_gap_chars)):
+                    batches.append(current)
+                    current = []
+                current.append(idx)
+            if current:
+                batches.append(current)
+        return batches
+
+    @staticmethod
+    def padding_waste(costs: list[int], batches: list[list[int]]) -> float:
+        """Fraction of padded positions that carry no speech (0.0 = no waste)."""
+        padded = sum(len(b) * max(costs[i] for i in b) for b in batches)
+        return round(1.0 - sum(costs) / padded, 4) if padded else 0.0
+
+    def batch_seconds(self, max_cost: int) -> float:
+        """Predicted wall time of one sub-batch whose longest item costs max_cost."""
+        return self.overhead_seconds + self.seconds_per_char * max_cost
+
+    def estimate(self, costs: list[int], groups: list | None = None) -> dict:
+        """Plan summary for /estimate: sub-batches, padding waste and ETA."""
+        batches = self.plan(costs, groups)
+        eta = sum(self.batch_seconds(max(costs[i] for i in b)) for b in batches)
+        return {
+            "count": len(costs),
+            "total_chars": sum(costs),
+            "sub_batches": [
+                {"size": len(b), "max_chars": max(costs[i] for i in b)} for b in batches
+            ],
+            "padding_waste": self.padding_waste(costs, batches),
+            "unplanned_padding_waste": self.padding_waste(costs, [list(range(len(costs)))]) if costs else 0.0,
+            "eta_seconds": round(eta, 1),
+            "seconds_per_char": round(self.seconds_per_char, 4),
+            "overhead_seconds": round(self.overhead_seconds, 3),
+        }
+
+    # ── Execution ───────────────────────────────────────────────────
+
+    def observe(self, max_cost: int, seconds: float):
+        """Refine the overhead and per-character rate from one measured sub-batch."""
+        with self._lock:
+            decay = 1.0 - self.smoothing
+            sample = (1.0, max_cost, seconds, max_cost * max_cost, max_cost * seconds)
+            self._sums = [decay * s + v for s, v in zip(self._sums, sample)]
+            self.observed_batches += 1
+
+            n, x, y, xx, xy = self._sums
+            variance = xx / n - (x / n) ** 2
+            if variance >= MIN_FIT_SPREAD_CHARS ** 2:
+                rate = (xy / n - x / n * y / n) / variance
+                overhead = y / n - rate * x / n
+                if rate > 0 and overhead >= 0:
+                    self.seconds_per_char, self.overhead_seconds = rate, overhead
+                    return
+
+            # Not enough spread to fit both: a batch faster than the assumed overhead shows it is smaller
+            overhead = min(self.overhead_seconds, seconds / 2)
+            self.overhead_seconds += self.smoothing * (overhead - self.overhead_seconds)
+            rate = (seconds - overhead) / max_cost
+            self.seconds_per_char += self.smoothing * (rate - self.seconds_per_char)
+
+    def run(self, items: list, run_batch, costs: list[int], groups: list | None = None) -> list:
+        """Run items through run_batch one planned sub-batch at a time, in original order."""
+        results = [None] * len(items)
+        batches = self.plan(costs, groups)
+        if len(batches) > 1 and self.log is not None:
+            self.log.event("planned", items=len(items), sub_batches=len(batches),
+                           padding_waste=round(self.padding_waste(costs, batches), 3))
+
+        for batch in batches:
+            started = time.monotonic()
+            outputs = run_batch([items[i] for i in batch])
+            self.observe(max(costs[i] for i in batch), time.monotonic() - started)
+            for idx, output in zip(batch, outputs):
+                results[idx] = output
+        return results
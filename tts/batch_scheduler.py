@@ -0,0 +1,200 @@
+"""
+Dynamic micro-batching for model servers.
+
+Flask runs each request on its own thread. Instead of letting every thread call
+the model concurrently, request threads submit their items to a MicroBatcher.
+A single worker thread owns the model: it takes the first queued job, waits up
+to ``max_wait_ms`` for more jobs to arrive, merges them into one native batch
+of at most ``max_batch_size`` items, runs it, and hands each caller back its
+own slice of the results.
+
+``run_batch`` is any callable ``list[item] -> list[result]``, so the scheduler
+can be exercised with a CPU stub instead of a GPU model. The optional
+``on_batch(size, queue_waits, seconds)`` callback receives every batch's item
+count, the queue wait of each merged job and the run time (for metrics).
+
+A job can be submitted with a ``cancelled()`` callable. Cancelled jobs are
+dropped (their future raises ``Cancelled``) instead of taking a slot in the
+next batch, and ``batch_cancelled()`` tells the running model call when every
+job in its batch has been cancelled, so it can stop early.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from cancellation import Cancelled
+
+
+class _Job:
+    __slots__ = ("items", "merge", "future", "enqueued_at", "cancelled")
+
+    def __init__(self, items: list, merge: bool, cancelled=None):
+        self.items = items
+        self.merge = merge
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+        self.cancelled = cancelled
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled is not None and self.cancelled()
+
+
+class MicroBatcher:
+    """Single inference worker that merges concurrent requests into batches."""
+
+    def __init__(self, run_batch, max_wait_ms: float = 25, max_batch_size: int = 8,
+                 name: str = "inference-worker", on_batch=None):
+        self.run_batch = run_batch
+        self.on_batch = on_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._queue: queue.Queue[_Job | None] = queue.Queue()
+        self._carry: _Job | None = None
+        self._running: list[_Job] = []
+        self._lock = threading.Lock()
+
+        self.batches_run = 0
+        self.items_run = 0
+        self.jobs_merged = 0
+        self.largest_batch = 0
+        self.jobs_cancelled = 0
+        self.items_cancelled = 0
+
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    # ── Public API ──────────────────────────────────────────────────
+
+    def submit_async(self, items: list, merge: bool = True, cancelled=None) -> Future:
+        """
+        Queue items for the worker; the future resolves to their results.
+        ``cancelled()`` returning true drops the job (the future raises Cancelled).
+        """
+        job = _Job(list(items), merge, cancelled)
+        if not job.items:
+            job.future.set_result([])
+        else:
+            self._queue.put(job)
+        return job.future
+
+    def submit(self, items: list, merge: bool = True, timeout: float | None = None) -> list:
+        """Queue items and block until their results are ready (re-raises model errors)."""
+        return self.submit_async(items, merge).result(timeout)
+
+    def batch_cancelled(self) -> bool:
+        """True while the running batch's jobs have all been cancelled (called from the worker)."""
+        jobs = self._running
+        return bool(jobs) and all(job.is_cancelled() for job in jobs)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() + (1 if self._carry is not None else 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth(),
+                "batches_run": self.batches_run,
+                "items_run": self.items_run,
+                "jobs_merged": self.jobs_merged,
+                "mean_batch_size": round(self.items_run / self.batches_run, 2) if self.batches_run else 0.0,
+                "largest_batch": self.largest_batch,
+                "jobs_cancelled": self.jobs_cancelled,
+                "items_cancelled": self.items_cancelled,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+    def stop(self):
+        """Stop the worker after the jobs already queued have run."""
+        self._queue.put(None)
+        self._worker.join()
+
+    # ── Worker ──────────────────────────────────────────────────────
+
+    def _next_job(self, timeout: float | None) -> _Job | None:
+        """The next job that has not been cancelled (cancelled ones are dropped on the way)."""
+        while True:
+            if self._carry is not None:
+                job, self._carry = self._carry, None
+            else:
+                job = self._queue.get(timeout=timeout) if timeout is not None else self._queue.get()
+            if job is None or not job.is_cancelled():
+                return job
+            self._drop(job)
+
+    def _drop(self, job: _Job):
+        with self._lock:
+            self.jobs_cancelled += 1
+            self.items_cancelled += len(job.items)
+        job.future.set_exception(Cancelled("Cancelled before it ran"))
+
+    def _collect(self, first: _Job) -> list[_Job]:
+        """Merge jobs that arrive within the batching window into one batch."""
+        jobs = [first]
+        if not first.merge:
+            return jobs
+
+        count = len(first.items)
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._next_job(remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                # Stop signal: finish this batch, then let the loop see it
+                self._queue.put(None)
+                break
+            if not job.merge or count + len(job.items) > self.max_batch_size:
+                # Doesn't fit: run it in the next round
+                self._carry = job
+                break
+            jobs.append(job)
+            count += len(job.items)
+        return jobs
+
+    def _run(self):
+        while True:
+            first = self._next_job(None)
+            if first is None:
+                return
+
+            jobs = self._collect(first)
+            for job in [job for job in jobs if job.is_cancelled()]:  # cancelled while collecting
+                jobs.remove(job)
+                self._drop(job)
+            if not jobs:
+                continue
+            items = [item for job in jobs for item in job.items]
+            started = time.monotonic()
+
+            try:
+                self._running = jobs
+                results = self.run_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"run_batch returned {len(results)} results for {len(items)} items")
+            except BaseException as e:
+                for job in jobs:
+                    job.future.set_exception(e)
+                continue
+            finally:
+                self._running = []
+                with self._lock:
+                    self.batches_run += 1
+                    self.items_run += len(items)
+                    self.jobs_merged += len(jobs) - 1
+                    self.largest_batch = max(self.largest_batch, len(items))
+                if self.on_batch is not None:
+                    self.on_batch(len(items), [started - job.enqueued_at for job in jobs],
+                                  time.monotonic() - started)
+
+            offset = 0
+            for job in jobs:
+                job.future.set_result(results[offset:offset + len(job.items)])
+                offset += len(job.items)
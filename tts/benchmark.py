@@ -0,0 +1,376 @@
+"""
+Load-generation benchmark for the TTS and WhisperX servers.
+
+Replays a narration corpus against /generate, /generate_batch,
+/transcribe_batch and /align_batch at several concurrency levels and batch
+sizes, and reports latency percentiles (p50/p95/p99), items per second and
+real-time factor (seconds of audio produced or processed per wall second).
+
+Corpus:
+    - TTS texts come from an SRT transcript (default: full.srt).
+    - WhisperX clips are the narration WAVs under presentation-app/public/audio,
+      paired with their narration text from presentation-app/public/narration
+      (clips without a matching narration entry are aligned against SRT text).
+
+Usage:
+    # CI / no GPU: start stub servers on free local ports, benchmark, stop them
+    python benchmark.py --start-stubs
+
+    # Against running servers (start them with --no-cache to measure the model)
+    python benchmark.py --tts-url http://gpu-box:5000 --scenarios generate,generate_batch \\
+        --concurrency 1,4,8 --batch-sizes 4,16 --requests 40
+    python benchmark.py --whisperx-url http://gpu-box:5001 --scenarios transcribe_batch,align_batch
+
+    # Fail (exit 1) on regressions, and keep the numbers
+    python benchmark.py --start-stubs --max-p95 5 --max-error-rate 0 --json bench.json
+
+Requests answered with 429 (admission control) are counted as rejected, not
+as errors, and are excluded from the latency percentiles.
+"""
+
+import argparse
+import base64
+import glob
+import io
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+import soundfile as sf
+
+from client import parse_transcript_file
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PUBLIC_DIR = os.path.join(HERE, "..", "presentation-app", "public")
+
+TTS_SCENARIOS = ("generate", "generate_batch")
+WHISPERX_SCENARIOS = ("transcribe_batch", "align_batch")
+SEGMENT_RE = re.compile(r"c(\d+)[\\/]s(\d+)_segment_(\d+)\.wav$")
+
+
+# ── Corpus ──────────────────────────────────────────────────────────
+
+def load_texts(srt_path: str) -> list[str]:
+    return [text for _, _, _, text in parse_transcript_file(srt_path)]
+
+
+def load_narration_texts(narration_dir: str, demo: str) -> dict[tuple[int, int, int], str]:
+    """(chapter, slide, segment) -> narration text for one demo, if it has a narration.json."""
+    path = os.path.join(narration_dir, demo, "narration.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        narration = json.load(f)
+    texts = {}
+    for slide in narration.get("slides", []):
+        for seg in slide.get("segments", []):
+            texts[(slide.get("chapter"), slide.get("slide"), seg.get("id"))] = seg.get("narrationText", "")
+    return texts
+
+
+def load_clips(audio_dir: str, narration_dir: str, fallback_texts: list[str]) -> list[dict]:
+    """Every narration WAV as {"path", "audio" (base64), "seconds", "text"}."""
+    clips = []
+    narrations = {}
+    paths = sorted(glob.glob(os.path.join(audio_dir, "**", "*.wav"), recursive=True))
+    for i, path in enumerate(paths):
+        info = sf.info(path)
+        if info.duration < 0.5:
+            continue  # skip silence fillers
+        demo = os.path.relpath(path, audio_dir).split(os.sep)[0]
+        if demo not in narrations:
+            narrations[demo] = load_narration_texts(narration_dir, demo)
+        text = None
+        match = SEGMENT_RE.search(path)
+        if match:
+            text = narrations[demo].get(tuple(int(g) for g in match.groups()))
+        if not text:
+            text = fallback_texts[i % len(fallback_texts)] if fallback_texts else "hello"
+        with open(path, "rb") as f:
+            audio_b64 = base64.b64encode(f.read()).decode("utf-8")
+        clips.append({"path": path, "audio": audio_b64, "seconds": info.duration, "text": text})
+    return clips
+
+
+def wav_seconds(audio_b64: str) -> float:
+    return sf.info(io.BytesIO(base64.b64decode(audio_b64))).duration
+
+
+# ── Requests ────────────────────────────────────────────────────────
+
+def make_request(scenario: str, corpus: list, start: int, batch_size: int, args) -> tuple[str, dict, float]:
+    """(path, JSON body, input audio seconds) for request number `start` of a scenario."""
+    items = [corpus[(start + i) % len(corpus)] for i in range(batch_size)]
+    if scenario == "generate":
+        body = {"text": items[0]}
+    elif scenario == "generate_batch":
+        body = {"texts": items}
+    elif scenario == "transcribe_batch":
+        body = {"audios": [c["audio"] for c in items], "language": args.language}
+    else:
+        body = {"items": [{"audio": c["audio"], "text": c["text"]} for c in items], "language": args.language}
+    if scenario in TTS_SCENARIOS and args.voice:
+        body["voice"] = args.voice
+    input_seconds = sum(c["seconds"] for c in items) if scenario in WHISPERX_SCENARIOS else 0.0
+    return f"/{scenario}", body, input_seconds
+
+
+def output_seconds(scenario: str, payload: dict) -> float:
+    """Seconds of audio a TTS response contains."""
+    if scenario == "generate":
+        return wav_seconds(payload["audio"])
+    return sum(wav_seconds(a) for a in payload.get("audios", []))
+
+
+def run_level(url: str, scenario: str, corpus: list, concurrency: int, batch_size: int, args) -> dict:
+    """Send args.requests requests from `concurrency` threads and summarize them."""
+    counter = iter(range(args.requests))
+    lock = threading.Lock()
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=max(10, concurrency)))
+    results = []
+
+    def worker():
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            path, body, input_seconds = make_request(scenario, corpus, n * batch_size, batch_size, args)
+            started = time.perf_counter()
+            try:
+                resp = session.post(url + path, json=body, timeout=args.timeout)
+                latency = time.perf_counter() - started
+                if resp.status_code == 429:
+                    results.append({"status": "rejected", "latency": latency})
+                    continue
+                if resp.status_code >= 400:
+                    raise RuntimeError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+                payload = resp.json()
+                seconds = input_seconds if scenario in WHISPERX_SCENARIOS else output_seconds(scenario, payload)
+                results.append({"status": "ok", "latency": latency, "items": batch_size, "audio_seconds": seconds})
+            except Exception as e:
+                results.append({"status": "error", "latency": time.perf_counter() - started, "error": str(e)})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == "ok"]
+    errors = [r for r in results if r["status"] == "error"]
+    latencies = np.array([r["latency"] for r in ok]) if ok else np.zeros(1)
+    items = sum(r["items"] for r in ok)
+    audio_seconds = sum(r["audio_seconds"] for r in ok)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "requests": len(results),
+        "ok": len(ok),
+        "rejected": sum(1 for r in results if r["status"] == "rejected"),
+        "errors": len(errors),
+        "first_error": errors[0]["error"] if errors else None,
+        "wall_seconds": round(wall, 3),
+        "p50": round(float(np.percentile(latencies, 50)), 4),
+        "p95": round(float(np.percentile(latencies, 95)), 4),
+        "p99": round(float(np.percentile(latencies, 99)), 4),
+        "items_per_second": round(items / wall, 3) if wall > 0 else 0.0,
+        "audio_seconds": round(audio_seconds, 2),
+        "real_time_factor": round(audio_seconds / wall, 3) if wall > 0 else 0.0,
+    }
+
+
+def warm_up(url: str, scenario: str, corpus: list, args):
+    path, body, _ = make_request(scenario, corpus, 0, 1, args)
+    try:
+        requests.post(url + path, json=body, timeout=args.timeout)
+    except requests.RequestException as e:
+        print(f"Warm-up request to {url}{path} failed: {e}")
+
+
+# ── Stub servers ────────────────────────────────────────────────────
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(url: str, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server for {url} exited with code {proc.returncode}")
+        try:
+            resp = requests.get(f"{url}/health", timeout=2)
+            state = resp.json().get("state", "ready") if resp.status_code == 200 else None
+            if state == "ready":
+                return
+            if state == "failed":
+                raise RuntimeError(f"Server for {url} failed to start: {resp.json()['startup']['error']}")
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server for {url} did not become ready within {timeout:.0f}s")
+
+
+def start_stub_servers(workdir: str, args) -> tuple[str, str, list]:
+    """Start server_stub.py and server_whisperx.py --stub on free ports; returns (tts_url, whisperx_url, procs)."""
+    tts_port, whisperx_port = free_port(), free_port()
+    commands = [
+        [sys.executable, os.path.join(HERE, "server_stub.py"), "--host", "127.0.0.1", "--port", str(tts_port),
+         "--no-cache", "--jobs-db", os.path.join(workdir, "jobs.sqlite3"), *args.stub_args.split()],
+        [sys.executable, os.path.join(HERE, "server_whisperx.py"), "--stub", "--host", "127.0.0.1",
+         "--port", str(whisperx_port), "--no-cache"],
+    ]
+    procs = []
+    for i, command in enumerate(commands):
+        log = open(os.path.join(workdir, f"server-{i}.log"), "w")
+        procs.append(subprocess.Popen(command, cwd=HERE, stdout=log, stderr=subprocess.STDOUT))
+    tts_url, whisperx_url = f"http://127.0.0.1:{tts_port}", f"http://127.0.0.1:{whisperx_port}"
+    try:
+        wait_healthy(tts_url, procs[0])
+        wait_healthy(whisperx_url, procs[1])
+    except Exception:
+        stop_servers(procs)
+        raise
+    return tts_url, whisperx_url, procs
+
+
+def stop_servers(procs: list):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# ── Report ──────────────────────────────────────────────────────────
+
+def print_table(results: list[dict]):
+    header = (f"{'scenario':<17}{'conc':>5}{'batch':>6}{'ok':>5}{'429':>5}{'err':>5}"
+              f"{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'items/s':>9}{'RTF':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<17}{r['concurrency']:>5}{r['batch_size']:>6}{r['ok']:>5}{r['rejected']:>5}"
+              f"{r['errors']:>5}{r['p50']:>9.3f}{r['p95']:>9.3f}{r['p99']:>9.3f}"
+              f"{r['items_per_second']:>9.2f}{r['real_time_factor']:>8.2f}")
+
+
+def check_thresholds(results: list[dict], args) -> list[str]:
+    failures = []
+    for r in results:
+        name = f"{r['scenario']} (concurrency {r['concurrency']}, batch {r['batch_size']})"
+        if args.max_p95 is not None and r["ok"] and r["p95"] > args.max_p95:
+            failures.append(f"{name}: p95 {r['p95']:.3f}s > {args.max_p95}s")
+        if args.max_error_rate is not None and r["requests"]:
+            rate = r["errors"] / r["requests"]
+            if rate > args.max_error_rate:
+                failures.append(f"{name}: error rate {rate:.2%} > {args.max_error_rate:.2%} ({r['first_error']})")
+    return failures
+
+
+def int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TTS and WhisperX servers")
+    parser.add_argument("--tts-url", type=str, default=None, help="TTS server URL (e.g. http://localhost:5000)")
+    parser.add_argument("--whisperx-url", type=str, default=None, help="WhisperX server URL (e.g. http://localhost:5001)")
+    parser.add_argument("--start-stubs", action="store_true",
+                        help="Start server_stub.py and server_whisperx.py --stub on free local ports")
+    parser.add_argument("--stub-args", type=str, default="",
+                        help="Extra arguments for server_stub.py, e.g. \"--seconds-per-char 0.005\"")
+    parser.add_argument("--scenarios", type=str, default=",".join(TTS_SCENARIOS + WHISPERX_SCENARIOS),
+                        help="Comma-separated scenarios (default: all four endpoints)")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4],
+                        help="Comma-separated concurrency levels (default: 1,4)")
+    parser.add_argument("--batch-sizes", type=int_list, default=[8],
+                        help="Comma-separated items per request for *_batch scenarios (default: 8)")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per level (default: 20)")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-request timeout in seconds (default: 600)")
+    parser.add_argument("--srt", type=str, default=os.path.join(HERE, "full.srt"), help="SRT corpus for TTS texts")
+    parser.add_argument("--audio-dir", type=str, default=os.path.join(PUBLIC_DIR, "audio"),
+                        help="Directory of narration WAVs for WhisperX")
+    parser.add_argument("--narration-dir", type=str, default=os.path.join(PUBLIC_DIR, "narration"),
+                        help="Directory of narration.json files with the WAVs' reference texts")
+    parser.add_argument("--voice", type=str, default=None, help="Voice id for TTS requests (default: server default)")
+    parser.add_argument("--language", type=str, default="en", help="Language for WhisperX requests (default: en)")
+    parser.add_argument("--json", type=str, default=None, help="Write the results to this JSON file")
+    parser.add_argument("--max-p95", type=float, default=None, help="Exit 1 if any level's p95 latency exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=None,
+                        help="Exit 1 if any level's error rate (0-1, 429s excluded) exceeds this")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in TTS_SCENARIOS + WHISPERX_SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    texts = load_texts(args.srt)
+    clips = []
+    if any(s in WHISPERX_SCENARIOS for s in scenarios):
+        clips = load_clips(args.audio_dir, args.narration_dir, texts)
+        print(f"Corpus: {len(texts)} texts, {len(clips)} clips ({sum(c['seconds'] for c in clips):.0f}s of audio)")
+    else:
+        print(f"Corpus: {len(texts)} texts")
+
+    procs = []
+    workdir = tempfile.mkdtemp(prefix="tts-bench-")
+    if args.start_stubs:
+        print("Starting stub servers...")
+        args.tts_url, args.whisperx_url, procs = start_stub_servers(workdir, args)
+        print(f"  TTS: {args.tts_url}  WhisperX: {args.whisperx_url}  (logs in {workdir})")
+
+    results = []
+    try:
+        for scenario in scenarios:
+            is_tts = scenario in TTS_SCENARIOS
+            url = args.tts_url if is_tts else args.whisperx_url
+            if not url:
+                print(f"Skipping {scenario}: no {'--tts-url' if is_tts else '--whisperx-url'}")
+                continue
+            corpus = texts if is_tts else clips
+            if not corpus:
+                print(f"Skipping {scenario}: empty corpus")
+                continue
+            warm_up(url, scenario, corpus, args)
+            batch_sizes = [1] if scenario == "generate" else args.batch_sizes
+            for batch_size in batch_sizes:
+                for concurrency in args.concurrency:
+                    print(f"Running {scenario} (concurrency {concurrency}, batch {batch_size})...")
+                    results.append(run_level(url, scenario, corpus, concurrency, batch_size, args))
+    finally:
+        stop_servers(procs)
+
+    print()
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "started_stubs": args.start_stubs}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    failures = check_thresholds(results, args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
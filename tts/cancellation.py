@@ -0,0 +1,131 @@
+"""
+Request cancellation for the model servers.
+
+Every generate request gets a ``CancelToken``, registered under its
+``X-Request-Id`` (sent by the client, or generated and returned in the
+response header). A token is cancelled when:
+
+* the client disconnects: the request thread polls the connection while it
+  waits for results (``poll``), and a streamed response is cancelled when
+  the server fails to write to it;
+* someone calls ``DELETE /requests/<id>``;
+* the request's generator is abandoned before it finishes.
+
+Cancelled work stops at the next safe point. Queued scheduler jobs are
+dropped before they run and free their slot in the batch. A running batch
+whose requests have all been cancelled stops between sub-batches, and for
+engines with a per-step hook (VibeVoice's ``stop_check_fn``) at the next
+generation step.
+"""
+
+import select
+import socket
+import threading
+import uuid
+
+from flask import jsonify
+
+DISCONNECTED = "client disconnected"
+DELETED = "cancelled by request"
+ABANDONED = "request abandoned"
+
+
+class Cancelled(Exception):
+    """Raised when the requester of some work went away or cancelled it."""
+
+
+def peer_closed(sock) -> bool:
+    """True if the client has closed its end of the connection."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        # Readable with nothing to read is EOF; pipelined request bytes mean the client is still there
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+class CancelToken:
+    """Cancellation state of one request. Worker threads only read it; the request thread polls."""
+
+    def __init__(self, request_id: str | None = None, probe=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.reason = None
+        self._probe = probe
+        self._event = threading.Event()
+
+    def cancel(self, reason: str):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def poll(self) -> bool:
+        """Check the probe (e.g. the client connection) and return whether the request is cancelled."""
+        if not self._event.is_set() and self._probe is not None and self._probe():
+            self.cancel(DISCONNECTED)
+        return self._event.is_set()
+
+    def check(self):
+        """Raise Cancelled if the request has been cancelled (polling the probe first)."""
+        if self.poll():
+            raise Cancelled(f"Request {self.request_id[:12]} {self.reason}")
+
+
+class CancelRegistry:
+    """Tokens of the requests in flight, by request id (for DELETE /requests/<id>)."""
+
+    def __init__(self):
+        self._tokens: dict[str, CancelToken] = {}
+        self._lock = threading.Lock()
+        self.cancelled: dict[str, int] = {}  # reason -> requests
+
+    def open(self, request) -> CancelToken:
+        """Register a token for a Flask request, probing its connection for disconnects."""
+        sock = request.environ.get("werkzeug.socket")
+        probe = (lambda: peer_closed(sock)) if sock is not None else None
+        token = CancelToken(request.headers.get("X-Request-Id"), probe)
+        with self._lock:
+            self._tokens[token.request_id] = token
+        return token
+
+    def close(self, token: CancelToken):
+        with self._lock:
+            if self._tokens.get(token.request_id) is token:
+                del self._tokens[token.request_id]
+            if token.cancelled:
+                self.cancelled[token.reason] = self.cancelled.get(token.reason, 0) + 1
+
+    def cancel(self, request_id: str) -> bool:
+        with self._lock:
+            token = self._tokens.get(request_id)
+        if token is None:
+            return False
+        token.cancel(DELETED)
+        return True
+
+    def hold(self, token: CancelToken, body):
+        """Wrap a streamed body so the token is cancelled if the stream is dropped, and closed at the end."""
+        finished = False
+        try:
+            for chunk in body:
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                token.cancel(DISCONNECTED)  # before closing body, so the reason is the disconnect
+            close = getattr(body, "close", None)
+            if close is not None:
+                close()
+            self.close(token)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"active": len(self._tokens), "cancelled": dict(self.cancelled)}
+
+
+def cancelled_response(e: Cancelled):
+    """499 (client closed request) for work that was cancelled before it finished."""
+    return jsonify({"error": str(e), "cancelled": True, "success": False}), 499
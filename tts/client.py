@@ -1,9 +1,11 @@
 import requests
-import base64
+import shutil
 import soundfile as sf
 import os
 import re
 import json
+import time
+import audio_io
 
 def parse_transcript_file(filepath):
     """
@@ -46,13 +48,23 @@ def parse_transcript_file(filepath):
     
     return utterances
 
-def check_server_health(server_url):
-    """Check if the server is running and healthy."""
+def check_server_health(server_url, wait_ready=True):
+    """Check if the server is running and healthy; optionally wait while its model loads."""
     try:
         response = requests.get(f"{server_url}/health", timeout=5)
+        while wait_ready and response.status_code == 200 and response.json().get('state') in ('loading', 'warming'):
+            startup = response.json().get('startup', {})
+            print(f"  Server is {startup.get('state')} ({startup.get('progress', 0):.0%}): {startup.get('detail', '')}")
+            time.sleep(2)
+            response = requests.get(f"{server_url}/health", timeout=5)
         if response.status_code == 200:
             data = response.json()
+            if data.get('state') == 'failed':
+                print(f"✗ Server failed to load its model: {data.get('startup', {}).get('error')}")
+                return False
             print(f"✓ Server is healthy")
+            if data.get('state'):
+                print(f"  - State: {data['state']}")
             print(f"  - Model loaded: {data.get('model_loaded', False)}")
             print(f"  - Device: {data.get('device', 'unknown')}")
             return True
@@ -66,72 +78,113 @@ def check_server_health(server_url):
         print(f"✗ Error checking server health: {e}")
         return False
 
-def generate_audio_remote(server_url, text):
-    """Send text to server and get generated audio."""
+def format_fields(audio_format):
+    """Request fields selecting an audio_io.AudioFormat (none for WAV)."""
+    if audio_format.name == 'wav':
+        return {}
+    return {"format": audio_format.name, "bitrate": audio_format.bitrate}
+
+def download_audio_remote(server_url, text, output_path, audio_format=audio_io.WAV):
+    """
+    Generate audio for one text and stream the raw audio body straight to output_path
+    (no base64, no in-memory copy of the clip). Returns the sample rate, or None on failure.
+    """
     try:
-        response = requests.post(
+        with requests.post(
             f"{server_url}/generate",
-            json={"text": text},
+            json={"text": text, **format_fields(audio_format)},
+            headers={"Accept": audio_format.mimetype},
+            stream=True,
             timeout=90000  # 25 hours timeout for generation
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success'):
-                # Decode base64 audio
-                audio_b64 = data.get('audio')
-                audio_bytes = base64.b64decode(audio_b64)
-                return audio_bytes, data.get('sample_rate', 24000)
-            else:
-                print(f"Server returned error: {data.get('error', 'Unknown error')}")
-                return None, None
-        else:
-            print(f"Server returned status code: {response.status_code}")
-            print(f"Response: {response.text}")
-            return None, None
+        ) as response:
+            if response.status_code != 200:
+                print(f"Server returned status code: {response.status_code}")
+                print(f"Response: {response.text}")
+                return None
+            
+            response.raw.decode_content = True
+            with open(output_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, 1 << 20)
+            return int(response.headers.get('X-Sample-Rate', 24000))
             
     except requests.exceptions.Timeout:
         print("Request timed out. The server might be processing, but took too long.")
-        return None, None
+        return None
     except Exception as e:
         print(f"Error generating audio: {e}")
-        return None, None
+        return None
 
-def generate_audio_batch_remote(server_url, texts):
-    """Send multiple texts to server and get generated audio files in batch."""
-    try:
-        response = requests.post(
-            f"{server_url}/generate_batch",
-            json={"texts": texts},
-            timeout=900  # 15 minutes timeout for batch generation
-        )
+def download_audio_batch_remote(server_url, texts, output_paths, audio_format=audio_io.WAV):
+    """
+    Generate a batch and write each item to output_paths[index] as soon as its binary
+    frame arrives, copying from the socket to disk through one reusable buffer.
+    Yields each index as its file is complete. Raises RuntimeError on server errors.
+    """
+    with requests.post(
+        f"{server_url}/generate_batch",
+        json={"texts": texts, **format_fields(audio_format)},
+        headers={"Accept": audio_io.FRAMES_MIMETYPE},
+        stream=True,
+        timeout=(10, 900)  # connect timeout, then max silence between items
+    ) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Server returned status code {response.status_code}: {response.text}")
+        if response.headers.get('Content-Type', '') != audio_io.FRAMES_MIMETYPE:
+            raise RuntimeError("Server does not support binary batch responses")
         
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success'):
-                # Decode base64 audio files
-                audios_b64 = data.get('audios', [])
-                audio_files = []
-                for audio_b64 in audios_b64:
-                    audio_bytes = base64.b64decode(audio_b64)
-                    audio_files.append(audio_bytes)
-                return audio_files, data.get('sample_rate', 24000)
-            else:
-                print(f"Server returned error: {data.get('error', 'Unknown error')}")
-                return None, None
-        else:
-            print(f"Server returned status code: {response.status_code}")
-            print(f"Response: {response.text}")
-            return None, None
-            
-    except requests.exceptions.Timeout:
-        print("Request timed out. The server might be processing, but took too long.")
-        return None, None
-    except Exception as e:
-        print(f"Error generating batch audio: {e}")
-        return None, None
+        response.raw.decode_content = True
+        for idx, length in audio_io.iter_frames(response.raw):
+            with open(output_paths[idx], 'wb') as f:
+                audio_io.copy_payload(response.raw, f, length)
+            yield idx
 
-def process_transcript(server_url, transcript_path, output_dir="output", concatenate=False, batch=False):
+def run_job_remote(server_url, texts, output_paths, job_id=None, poll_interval=5, audio_format=audio_io.WAV):
+    """
+    Run a batch through the durable /jobs API and download each finished item to
+    output_paths[index]. Pass job_id to reconnect to an existing job instead of
+    submitting a new one. Yields each index as its file is saved.
+    Raises RuntimeError if the job fails or is cancelled.
+    """
+    if job_id is None:
+        response = requests.post(f"{server_url}/jobs", json={"texts": texts, **format_fields(audio_format)},
+                                 timeout=60)
+        if response.status_code != 202:
+            raise RuntimeError(f"Server returned status code {response.status_code}: {response.text}")
+        job_id = response.json()['job_id']
+        print(f"Submitted job {job_id} (resume with --resume-job {job_id})")
+    
+    saved = set()
+    while True:
+        try:
+            response = requests.get(f"{server_url}/jobs/{job_id}", timeout=30)
+        except requests.exceptions.ConnectionError:
+            print(f"  Lost connection, retrying in {poll_interval}s...")
+            time.sleep(poll_interval)
+            continue
+        if response.status_code != 200:
+            raise RuntimeError(f"Server returned status code {response.status_code}: {response.text}")
+        job = response.json()
+        
+        for item in job['items']:
+            idx = item['index']
+            if item['status'] != 'done' or idx in saved:
+                continue
+            with requests.get(f"{server_url}/jobs/{job_id}/items/{idx}", stream=True, timeout=60) as audio:
+                audio.raise_for_status()
+                audio.raw.decode_content = True
+                with open(output_paths[idx], 'wb') as f:
+                    shutil.copyfileobj(audio.raw, f, 1 << 20)
+            saved.add(idx)
+            yield idx
+        
+        if job['status'] == 'done':
+            return
+        if job['status'] in ('failed', 'cancelled'):
+            raise RuntimeError(f"Job {job['status']}: {job.get('error') or 'no error message'}")
+        time.sleep(poll_interval)
+
+def process_transcript(server_url, transcript_path, output_dir="output", concatenate=False, batch=False,
+                       job=False, resume_job=None, audio_format=audio_io.WAV):
     """Process entire transcript file and generate audio for each utterance."""
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
@@ -157,27 +210,34 @@ def process_transcript(server_url, transcript_path, output_dir="output", concate
         print(f"Generating {len(utterances)} audio files in one batch request...")
         print(f"Total utterances: {len(utterances)}\n")
         
-        # Generate all audio files in batch
-        audio_files, sample_rate = generate_audio_batch_remote(server_url, all_texts)
+        # Stream the batch as binary frames (or run it as a durable job),
+        # writing each file as soon as it arrives
+        ext = audio_format.extension
+        output_filenames = [f"batch_utterance_{utterance_id.zfill(2)}{ext}" for utterance_id, _, _, _ in utterances]
+        output_paths = [os.path.join(output_dir, name) for name in output_filenames]
+        if job or resume_job:
+            results = run_job_remote(server_url, all_texts, output_paths, job_id=resume_job,
+                                     audio_format=audio_format)
+        else:
+            results = download_audio_batch_remote(server_url, all_texts, output_paths, audio_format)
+        saved_count = 0
+        try:
+            for idx in results:
+                saved_count += 1
+                print(f"  [{saved_count}/{len(utterances)}] ✓ Saved: {output_filenames[idx]}")
+        except requests.exceptions.Timeout:
+            print("Request timed out. The server might be processing, but took too long.")
+        except Exception as e:
+            print(f"Error generating batch audio: {e}")
         
-        if audio_files:
-            print(f"\nSaving {len(audio_files)} audio files...")
-            for idx, ((utterance_id, _, _, text), audio_bytes) in enumerate(zip(utterances, audio_files), 1):
-                output_filename = f"batch_utterance_{utterance_id.zfill(2)}.wav"
-                output_path = os.path.join(output_dir, output_filename)
-                
-                with open(output_path, 'wb') as f:
-                    f.write(audio_bytes)
-                
-                print(f"  [{idx}/{len(audio_files)}] ✓ Saved: {output_filename}")
-            
+        if saved_count == len(utterances):
             print(f"\n{'='*50}")
             print(f"Batch generation completed successfully!")
-            print(f"Generated {len(audio_files)} separate audio files")
+            print(f"Generated {saved_count} separate audio files")
             print(f"Output directory: {output_dir}")
             print(f"{'='*50}")
         else:
-            print(f"✗ Failed to generate batch audio")
+            print(f"✗ Batch incomplete: saved {saved_count}/{len(utterances)} audio files to {output_dir}")
     
     elif concatenate:
         # CONCATENATED MODE: Generate all utterances in a single request for better quality
@@ -190,19 +250,16 @@ def process_transcript(server_url, transcript_path, output_dir="output", concate
         print(f"Generating single audio file with {len(utterances)} segments...")
         print(f"Total text length: {len(concatenated_text)} characters\n")
         
-        # Generate single audio file
-        audio_bytes, sample_rate = generate_audio_remote(server_url, concatenated_text)
+        # Generate single audio file, streamed straight to disk
+        output_filename = f"combined_utterances{audio_format.extension}"
+        output_path = os.path.join(output_dir, output_filename)
+        sample_rate = download_audio_remote(server_url, concatenated_text, output_path, audio_format)
         
-        if audio_bytes:
-            output_filename = "combined_utterances.wav"
-            output_path = os.path.join(output_dir, output_filename)
-            
-            with open(output_path, 'wb') as f:
-                f.write(audio_bytes)
-            
+        if sample_rate:
             print(f"✓ Saved combined audio: {output_path}")
             print(f"\nNote: This is a single audio file containing all {len(utterances)} utterances.")
-            print(f"The model generated this with full context, which should improve quality.")
+            print(f"The server splits long texts at sentence boundaries, generates the chunks as one batch")
+            print(f"and stitches them (start the server with --chunk-chars 0 for one full-context generation).")
         else:
             print(f"✗ Failed to generate audio")
     else:
@@ -217,18 +274,12 @@ def process_transcript(server_url, transcript_path, output_dir="output", concate
             # Format text with speaker label
             formatted_text = f"Speaker 0: {text}"
             
-            # Generate audio
-            audio_bytes, sample_rate = generate_audio_remote(server_url, formatted_text)
+            # Generate audio, streamed straight to disk
+            output_filename = f"utterance_{utterance_id.zfill(2)}{audio_format.extension}"
+            output_path = os.path.join(output_dir, output_filename)
+            sample_rate = download_audio_remote(server_url, formatted_text, output_path, audio_format)
             
-            if audio_bytes:
-                # Save audio file
-                output_filename = f"utterance_{utterance_id.zfill(2)}.wav"
-                output_path = os.path.join(output_dir, output_filename)
-                
-                # Write bytes to file
-                with open(output_path, 'wb') as f:
-                    f.write(audio_bytes)
-                
+            if sample_rate:
                 print(f"  ✓ Saved: {output_path}\n")
                 success_count += 1
             else:
@@ -266,6 +317,14 @@ def main():
                         help='Generate all utterances in a single audio file for better quality')
     parser.add_argument('--batch', action='store_true',
                         help='Generate all utterances as separate files in one batch request (efficient)')
+    parser.add_argument('--job', action='store_true',
+                        help='With --batch: run the batch as a durable server-side job and poll for results')
+    parser.add_argument('--resume-job', type=str,
+                        help='With --batch: reconnect to an existing job id instead of submitting a new one')
+    parser.add_argument('--format', type=str, default='wav', choices=list(audio_io.FORMAT_MIMETYPES),
+                        help='Audio format to request and save (default: wav)')
+    parser.add_argument('--bitrate', type=int, default=audio_io.DEFAULT_OPUS_KBPS,
+                        help=f'Opus bitrate in kbps (default: {audio_io.DEFAULT_OPUS_KBPS})')
     parser.add_argument('--test', action='store_true',
                         help='Only test server connection without processing')
     
@@ -287,7 +346,7 @@ def main():
     
     if args.test:
         print("Testing server connection...")
-        check_server_health(server_url)
+        check_server_health(server_url, wait_ready=False)
     else:
         # Check if transcript exists
         if not os.path.exists(args.transcript):
@@ -303,7 +362,9 @@ def main():
             return
         
         process_transcript(server_url, args.transcript, args.output,
-                         concatenate=args.concatenate, batch=args.batch)
+                         concatenate=args.concatenate, batch=args.batch,
+                         job=args.job, resume_job=args.resume_job,
+                         audio_format=audio_io.parse_format(args.format, args.bitrate))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
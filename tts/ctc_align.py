@@ -0,0 +1,174 @@
+"""
+Batched CTC forced alignment for the WhisperX server.
+
+``whisperx.align`` runs one wav2vec2 forward pass per segment and aligns it
+before starting the next. ``BatchAligner`` splits the work the other way:
+
+* Clips are sorted by length and zero-padded into batches of ``batch_size``,
+  and each batch gets one emission pass (``emit``, the GPU part).
+* Each clip's trellis and backtrack (Viterbi over its reference text) run on
+  a CPU thread pool, while the next batch's emissions are computed.
+
+The alignment itself follows whisperx: the reference text is lowercased and
+reduced to the characters in the model's dictionary, words are separated by
+``|`` when the dictionary has it, every frame is attributed to the character
+being emitted or the one before it, and a word spans its characters' frames,
+scored by their mean probability. Words with no alignable characters take
+the end of the previous word.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from postprocess import pad_batch
+
+LANGUAGES_WITHOUT_SPACES = ("ja", "zh")  # aligned character by character
+
+
+def blank_id(dictionary: dict) -> int:
+    """The CTC blank token's id: the dictionary's pad token, else 0 (as in whisperx)."""
+    for char in ("[pad]", "<pad>"):
+        if char in dictionary:
+            return dictionary[char]
+    return 0
+
+
+def text_tokens(text: str, dictionary: dict, language: str):
+    """
+    The words of a reference text and its token ids for alignment.
+    Returns (words, tokens, token_words), where token_words[k] is the word
+    index of tokens[k] (-1 for word separators).
+    """
+    words = [c for c in text if not c.isspace()] if language in LANGUAGES_WITHOUT_SPACES else text.split()
+    separator = dictionary.get("|")
+    tokens, token_words = [], []
+    for i, word in enumerate(words):
+        chars = [dictionary[c] for c in word.lower() if c in dictionary]
+        if not chars:
+            continue
+        if tokens and separator is not None:
+            tokens.append(separator)
+            token_words.append(-1)
+        tokens.extend(chars)
+        token_words.extend([i] * len(chars))
+    return words, tokens, token_words
+
+
+def get_trellis(emission: np.ndarray, tokens: list[int], blank: int) -> np.ndarray:
+    """
+    (frames + 1, tokens + 1) log-probabilities of the best path that has
+    emitted the first j tokens after t frames.
+    """
+    num_frames, num_tokens = len(emission), len(tokens)
+    trellis = np.full((num_frames + 1, num_tokens + 1), -np.inf, dtype=np.float32)
+    trellis[0, 0] = 0.0
+    trellis[1:, 0] = np.cumsum(emission[:, blank])
+    token_emission = emission[:, tokens]
+    for t in range(num_frames):
+        np.maximum(trellis[t, 1:] + emission[t, blank], trellis[t, :-1] + token_emission[t],
+                   out=trellis[t + 1, 1:])
+    return trellis
+
+
+def backtrack(trellis: np.ndarray, emission: np.ndarray, tokens: list[int], blank: int):
+    """
+    The best path through every token, as (token index, frame, probability)
+    in frame order, or None if the text needs more frames than the clip has.
+    Like whisperx, the path ends at the most likely frame for the last token
+    (not the clip's last frame), so trailing silence stays out of the last word.
+    """
+    j = trellis.shape[1] - 1
+    t = int(np.argmax(trellis[:, j]))
+    if not np.isfinite(trellis[t, j]):
+        return None
+    path = []
+    while j > 0:
+        stayed = trellis[t - 1, j] + emission[t - 1, blank]
+        changed = trellis[t - 1, j - 1] + emission[t - 1, tokens[j - 1]]
+        token = tokens[j - 1] if changed > stayed else blank
+        path.append((j - 1, t - 1, float(np.exp(emission[t - 1, token]))))
+        if changed > stayed:
+            j -= 1
+        t -= 1
+    return path[::-1]
+
+
+def align_words(emission: np.ndarray, text: str, dictionary: dict, language: str,
+                seconds_per_frame: float) -> list[dict]:
+    """Word timestamps for one clip's (frames, vocab) CTC log-probabilities and its reference text."""
+    words, tokens, token_words = text_tokens(text, dictionary, language)
+    if not tokens:
+        return []
+    blank = blank_id(dictionary)
+    path = backtrack(get_trellis(emission, tokens, blank), emission, tokens, blank)
+    if path is None:
+        return []
+
+    spans = {}  # word index -> [first frame, last frame, probabilities]
+    for token_index, frame, prob in path:
+        word = token_words[token_index]
+        if word < 0:
+            continue
+        span = spans.setdefault(word, [frame, frame, []])
+        span[1] = frame
+        span[2].append(prob)
+
+    aligned, previous_end = [], 0.0
+    for i, word in enumerate(words):
+        if i in spans:
+            first, last, probs = spans[i]
+            start, end = first * seconds_per_frame, (last + 1) * seconds_per_frame
+            score = float(np.mean(probs))
+        else:
+            start = end = previous_end
+            score = 0.0
+        aligned.append({"word": word, "start": round(start, 4), "end": round(end, 4), "score": round(score, 4)})
+        previous_end = end
+    return aligned
+
+
+class BatchAligner:
+    """
+    Align many clips with batched emissions and parallel CPU backtracking.
+
+    ``emit(batch, lengths)`` takes a zero-padded float32 (clips, samples) array
+    and each clip's length and returns each clip's (frames, vocab) CTC
+    log-probabilities as numpy arrays, without the padding frames.
+    """
+
+    def __init__(self, batch_size: int = 8, workers: int = 4):
+        self.batch_size = max(1, batch_size)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="align")
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.clips = 0
+
+    def align(self, emit, clips: list[np.ndarray], texts: list[str], dictionary: dict,
+              language: str, sample_rate: int) -> list[list[dict]]:
+        """Word timestamps for every clip against its reference text, in input order."""
+        order = sorted(range(len(clips)), key=lambda i: len(clips[i]))
+        futures = {}
+        for start in range(0, len(order), self.batch_size):
+            indices = order[start:start + self.batch_size]
+            batch, lengths = pad_batch([clips[i] for i in indices])
+            # Backtracking of this batch overlaps the next batch's emission pass
+            for i, length, emission in zip(indices, lengths, emit(batch, lengths)):
+                seconds_per_frame = length / sample_rate / max(1, len(emission))
+                futures[i] = self.pool.submit(align_words, emission, texts[i], dictionary, language,
+                                              seconds_per_frame)
+            with self._lock:
+                self.batches += 1
+                self.clips += len(indices)
+        return [futures[i].result() for i in range(len(clips))]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batch_size": self.batch_size,
+                "batches": self.batches,
+                "clips": self.clips,
+                "mean_batch_size": round(self.clips / self.batches, 2) if self.batches else 0.0,
+            }
+
@@ -0,0 +1,360 @@
+"""
+Durable asynchronous job API for long TTS batches.
+
+``POST /jobs`` stores the batch in a local SQLite database and returns a job id
+immediately. A background runner works through queued jobs in chunks, saving
+every finished item's audio in the database as it completes, so neither a
+dropped client connection nor a server restart loses finished GPU work:
+on startup, interrupted jobs are re-queued and only their unfinished items
+are generated again.
+
+Endpoints (registered as a Flask blueprint):
+    POST   /jobs                    — Enqueue {"texts": [...], "instruct"/"instructs": ..., "voice"/"voices": ...,
+                                      "format"/"bitrate": ...}
+    GET    /jobs                    — Recent jobs (summaries)
+    GET    /jobs/<id>               — Progress + per-item status (?audio=1 to include base64 audio)
+    GET    /jobs/<id>/items/<index> — One finished item as raw audio in the job's format
+    DELETE /jobs/<id>               — Cancel (finished items are kept)
+"""
+
+import base64
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from flask import Blueprint, Response, jsonify, request
+
+import audio_io
+from cancellation import Cancelled
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id         TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    total      INTEGER NOT NULL,
+    completed  INTEGER NOT NULL DEFAULT 0,
+    error      TEXT,
+    format     TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id   TEXT NOT NULL,
+    idx      INTEGER NOT NULL,
+    text     TEXT NOT NULL,
+    instruct TEXT,
+    voice    TEXT,
+    status   TEXT NOT NULL,
+    audio    BLOB,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+# Job states: queued -> running -> done | failed | cancelled
+FINAL_STATES = ("done", "failed", "cancelled")
+
+
+class JobStore:
+    """SQLite-backed jobs and per-item results (one connection, serialized by a lock)."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(items)")]
+        if "voice" not in columns:  # databases created before voices were per item
+            self._db.execute("ALTER TABLE items ADD COLUMN voice TEXT")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+        if "format" not in columns:  # databases created before compressed formats (all WAV)
+            self._db.execute("ALTER TABLE jobs ADD COLUMN format TEXT")
+
+    def _update_job(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def create(self, texts: list[str], instructs: list[str | None], voices: list[str | None],
+               audio_format: str = "wav") -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT INTO jobs (id, status, created_at, updated_at, total, format) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, now, now, len(texts), audio_format),
+            )
+            self._db.executemany(
+                "INSERT INTO items (job_id, idx, text, instruct, voice, status) VALUES (?, ?, ?, ?, ?, 'queued')",
+                [(job_id, i, text, instruct, voice)
+                 for i, (text, instruct, voice) in enumerate(zip(texts, instructs, voices))],
+            )
+            self._db.execute("COMMIT")
+        return job_id
+
+    def requeue_interrupted(self) -> int:
+        """Put jobs that were running when the server stopped back in the queue."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (time.time(),)
+            )
+            return cursor.rowcount
+
+    def next_queued(self) -> str | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            return row[0] if row else None
+
+    def status(self, job_id: str) -> str | None:
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return row[0] if row else None
+
+    def set_status(self, job_id: str, status: str, error: str | None = None):
+        with self._lock:
+            self._update_job(job_id, status=status, error=error)
+
+    def audio_format(self, job_id: str) -> audio_io.AudioFormat:
+        """The format the job's items are stored in (format spec, see audio_io.parse_format)."""
+        with self._lock:
+            row = self._db.execute("SELECT format FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return audio_io.parse_format(row[0] if row else None)
+
+    def pending_items(self, job_id: str) -> list[tuple[int, str, str | None, str | None]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT idx, text, instruct, voice FROM items WHERE job_id = ? AND status != 'done' ORDER BY idx",
+                (job_id,),
+            ).fetchall()
+
+    def save_item(self, job_id: str, index: int, audio: bytes):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "UPDATE items SET status = 'done', audio = ? WHERE job_id = ? AND idx = ?",
+                (audio, job_id, index),
+            )
+            self._db.execute(
+                "UPDATE jobs SET completed = completed + 1, updated_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+            self._db.execute("COMMIT")
+
+    def cancel(self, job_id: str) -> str | None:
+        """Cancel a job that hasn't finished. Returns the resulting status (None if unknown)."""
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] in FINAL_STATES:
+                return row[0]
+            self._update_job(job_id, status="cancelled")
+            return "cancelled"
+
+    def summary(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, created_at, updated_at, total, completed, error, format FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, status, created_at, updated_at, total, completed, error, audio_format = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "total": total,
+            "completed": completed,
+            "progress": round(completed / total, 4) if total else 1.0,
+            "error": error,
+            "format": audio_io.parse_format(audio_format).name,
+        }
+
+    def recent(self, limit: int = 50) -> list[dict]:
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                "SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            )]
+        return [self.summary(job_id) for job_id in ids]
+
+    def items(self, job_id: str, include_audio: bool) -> list[dict]:
+        column = "audio" if include_audio else "NULL"
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT idx, status, {column} FROM items WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        items = []
+        for index, status, audio in rows:
+            item = {"index": index, "status": status}
+            if audio is not None:
+                item["audio"] = base64.b64encode(audio).decode("utf-8")
+            items.append(item)
+        return items
+
+    def item_audio(self, job_id: str, index: int) -> bytes | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT audio FROM items WHERE job_id = ? AND idx = ?", (job_id, index)
+            ).fetchone()
+        return row[0] if row else None
+
+
+class JobRunner:
+    """
+    Background worker that drains queued jobs.
+    ``synthesize(texts, instructs, voices, cancelled)`` must yield (position, wav_bytes)
+    for the given lists in any order; it is called one chunk at a time, and may
+    raise Cancelled once ``cancelled()`` is true to stop a chunk early. With ``wait_ready``, the worker blocks on it
+    before draining, so jobs queued while the model loads run once it is ready.
+    ``encode(wav, audio_format)`` converts each WAV to the job's format before it is stored.
+    """
+
+    def __init__(self, store: JobStore, synthesize, chunk_size: int = 16, wait_ready=None, encode=None):
+        self.store = store
+        self.synthesize = synthesize
+        self.encode = encode or audio_io.transcode_wav
+        self.chunk_size = max(1, chunk_size)
+        self.wait_ready = wait_ready
+        self._wake = threading.Event()
+
+        requeued = store.requeue_interrupted()
+        if requeued:
+            print(f"Jobs: re-queued {requeued} interrupted job(s)")
+
+        self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: list[str], instructs: list[str | None], voices: list[str | None],
+               audio_format: audio_io.AudioFormat = audio_io.WAV) -> str:
+        job_id = self.store.create(texts, instructs, voices, audio_format.spec)
+        self._wake.set()
+        return job_id
+
+    def _run(self):
+        if self.wait_ready is not None:
+            self.wait_ready()
+        while True:
+            job_id = self.store.next_queued()
+            if job_id is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            self._run_job(job_id)
+
+    def _run_job(self, job_id: str):
+        self.store.set_status(job_id, "running")
+        pending = self.store.pending_items(job_id)
+        audio_format = self.store.audio_format(job_id)
+        print(f"Job {job_id[:8]}: {len(pending)} item(s) to generate")
+
+        def cancelled():
+            return self.store.status(job_id) == "cancelled"
+
+        try:
+            for start in range(0, len(pending), self.chunk_size):
+                if cancelled():
+                    print(f"Job {job_id[:8]}: cancelled")
+                    return
+                chunk = pending[start:start + self.chunk_size]
+                texts = [text for _, text, _, _ in chunk]
+                instructs = [instruct for _, _, instruct, _ in chunk]
+                voices = [voice for _, _, _, voice in chunk]
+                for position, wav in self.synthesize(texts, instructs, voices, cancelled):
+                    self.store.save_item(job_id, chunk[position][0], self.encode(wav, audio_format))
+        except Cancelled:
+            print(f"Job {job_id[:8]}: cancelled")
+            return
+        except Exception as e:
+            print(f"Job {job_id[:8]}: failed: {e}")
+            self.store.set_status(job_id, "failed", str(e))
+            return
+
+        if self.store.status(job_id) != "cancelled":
+            self.store.set_status(job_id, "done")
+            print(f"Job {job_id[:8]}: done")
+
+
+def create_jobs_blueprint(runner: JobRunner, resolve_voice=None) -> Blueprint:
+    """
+    Flask routes for the job API, bound to one runner.
+    ``resolve_voice(voice_id)`` validates voice ids at submission (raising KeyError
+    for unknown ones), so a bad voice is a 400 rather than a failed job.
+    """
+    jobs = Blueprint("jobs", __name__)
+    store = runner.store
+
+    @jobs.route("/jobs", methods=["POST"])
+    def create_job():
+        data = request.get_json()
+        texts = data.get("texts", [])
+        instruct = data.get("instruct") or None
+        instructs = data.get("instructs") or None
+        voice = data.get("voice") or None
+        voices = data.get("voices") or None
+
+        if not texts:
+            return jsonify({"error": "No texts provided"}), 400
+        try:
+            audio_format = audio_io.parse_format(data.get("format"), data.get("bitrate"))
+        except audio_io.UnsupportedFormat as e:
+            return jsonify({"error": str(e)}), 400
+
+        if instructs and len(instructs) == len(texts):
+            item_instructs = [inst or None for inst in instructs]
+        else:
+            item_instructs = [instruct] * len(texts)
+
+        if voices and len(voices) == len(texts):
+            item_voices = [v or None for v in voices]
+        else:
+            item_voices = [voice] * len(texts)
+
+        if resolve_voice is not None:
+            try:
+                item_voices = [resolve_voice(v) for v in item_voices]
+            except KeyError as e:
+                return jsonify({"error": str(e)}), 400
+
+        job_id = runner.submit(texts, item_instructs, item_voices, audio_format)
+        print(f"Job {job_id[:8]}: queued {len(texts)} item(s)")
+        return jsonify({"job_id": job_id, "status": "queued", "total": len(texts), "success": True}), 202
+
+    @jobs.route("/jobs", methods=["GET"])
+    def list_jobs():
+        return jsonify({"jobs": store.recent(), "success": True})
+
+    @jobs.route("/jobs/<job_id>", methods=["GET"])
+    def get_job(job_id):
+        summary = store.summary(job_id)
+        if summary is None:
+            return jsonify({"error": "Job not found"}), 404
+        include_audio = request.args.get("audio", "0") in ("1", "true")  # polls stay small; items have their own route
+        summary["items"] = store.items(job_id, include_audio)
+        summary["sample_rate"] = 24000
+        summary["success"] = True
+        return jsonify(summary)
+
+    @jobs.route("/jobs/<job_id>/items/<int:index>", methods=["GET"])
+    def get_job_item(job_id, index):
+        audio = store.item_audio(job_id, index)
+        if audio is None:
+            return jsonify({"error": "Item not found or not finished"}), 404
+        return Response(audio, mimetype=store.audio_format(job_id).mimetype)
+
+    @jobs.route("/jobs/<job_id>", methods=["DELETE"])
+    def cancel_job(job_id):
+        status = store.cancel(job_id)
+        if status is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"job_id": job_id, "status": status, "success": status == "cancelled"})
+
+    return jobs
@@ -0,0 +1,233 @@
+"""
+Prometheus-style metrics and sampled structured logging for the model servers.
+
+A small dependency-free subset of the Prometheus client: labelled counters and
+histograms, plus gauges (and counters kept by other components) read from a
+callback when the endpoint is scraped.
+``create_metrics_blueprint`` serves them as text exposition format on
+``GET /metrics``.
+
+``SampledLog`` replaces per-item ``print`` calls in hot loops. It writes one
+JSON line for the first event of each kind and then one in every ``every``
+events, with a running count, so logging cost stays flat under load.
+"""
+
+import json
+import math
+import threading
+import time
+
+from flask import Blueprint, Response, g, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+RATIO_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_str(self.labels, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: dict[tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time of its block."""
+        return _Timer(self, labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {_fmt(series[-2])}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        super().__init__(name, help)
+        self.read = read
+
+    def render(self) -> list[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return self.header() + [f"{self.name} {_fmt(value)}"]
+
+
+class CallbackCounter(Gauge):
+    """Monotonic count kept by another component, read from a callback at scrape time."""
+    kind = "counter"
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.histogram.observe(self.elapsed, **self.labels)
+        return False
+
+
+class Metrics:
+    """A named set of metrics, rendered together on /metrics."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._metrics: list[_Metric] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._add(Counter(f"{self.namespace}_{name}", help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(f"{self.namespace}_{name}", help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read) -> Gauge:
+        return self._add(Gauge(f"{self.namespace}_{name}", help, read))
+
+    def counter_from(self, name: str, help: str, read) -> CallbackCounter:
+        return self._add(CallbackCounter(f"{self.namespace}_{name}", help, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def create_metrics_blueprint(metrics: Metrics) -> Blueprint:
+    bp = Blueprint("metrics", __name__)
+
+    @bp.route("/metrics", methods=["GET"])
+    def scrape():
+        return Response(metrics.render(), mimetype=CONTENT_TYPE)
+
+    return bp
+
+
+def instrument_requests(app, metrics: Metrics):
+    """Count requests and time them (to the response headers) per endpoint and status."""
+    requests_total = metrics.counter("http_requests_total", "HTTP requests by endpoint and status",
+                                     ("endpoint", "status"))
+    request_seconds = metrics.histogram("http_request_seconds",
+                                        "Request latency to response headers (streams: time to first byte)",
+                                        ("endpoint",))
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        started = g.pop("metrics_started", None)
+        endpoint = request.endpoint or "unknown"
+        if endpoint != "metrics.scrape":
+            requests_total.inc(endpoint=endpoint, status=response.status_code)
+            if started is not None:
+                request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+        return response
+
+
+class SampledLog:
+    """Structured JSON log lines, sampled per event kind (first, then every Nth)."""
+
+    def __init__(self, every: int = 50):
+        self.every = max(1, every)
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def event(self, kind: str, **fields):
+        with self._lock:
+            n = self._counts.get(kind, 0) + 1
+            self._counts[kind] = n
+        if n == 1 or n % self.every == 0:
+            print(json.dumps({"event": kind, "n": n, **fields}, default=str))
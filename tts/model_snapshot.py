@@ -0,0 +1,137 @@
+"""
+Local weight snapshots for fast model restarts.
+
+Loading through ``from_pretrained(<hub id>)`` resolves the hub cache, reads the
+original checkpoint and casts it to the serving dtype on every start. With
+``--snapshot-dir`` the first start writes the loaded model once, as
+safetensors in the serving dtype, with the processor/tokenizer config alongside
+it. Later starts load from that directory: safetensors are memory-mapped, so
+the weights go from the page cache straight to the device with no conversion
+and no hub lookups.
+
+A snapshot directory is only used once its ``snapshot.json`` manifest exists.
+The manifest is written last and the directory is renamed into place, so an
+interrupted write is never picked up.
+"""
+
+import json
+import os
+import shutil
+import time
+
+MANIFEST = "snapshot.json"
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth", ".ckpt")
+
+
+def snapshot_path(root: str, model_name: str, dtype: str) -> str:
+    """Directory of the snapshot of model_name in dtype under root."""
+    return os.path.join(root, f"{model_name.replace('/', '--')}-{dtype}")
+
+
+def load_manifest(path: str) -> dict | None:
+    """The snapshot's manifest, or None if there is no complete snapshot at path."""
+    try:
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def materialize(path: str, model_name: str, dtype: str, save) -> float:
+    """
+    Write a snapshot: save(directory) writes the model files, then the manifest
+    is added and the directory is moved into place. Returns the seconds taken.
+    """
+    started = time.monotonic()
+    partial = path + ".partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    try:
+        os.makedirs(partial)
+        save(partial)
+        manifest = write_manifest(partial, model_name, dtype)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)  # don't leave a half-written copy on a full disk
+        raise
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(partial, path)
+    seconds = time.monotonic() - started
+    print(f"Snapshot written to {path} ({manifest['bytes'] / 1024 ** 3:.2f} GB in {seconds:.1f}s)")
+    return seconds
+
+
+def write_manifest(path: str, model_name: str, dtype: str) -> dict:
+    """Mark the files under path as a complete snapshot of model_name."""
+    files = {}
+    for dirpath, _, names in os.walk(path):
+        for name in names:
+            full = os.path.join(dirpath, name)
+            files[os.path.relpath(full, path).replace(os.sep, "/")] = os.path.getsize(full)
+    files.pop(MANIFEST, None)
+    manifest = {
+        "model": model_name,
+        "dtype": dtype,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "bytes": sum(files.values()),
+        "files": files,
+    }
+    with open(os.path.join(path, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def copy_repo_files(model_name: str, dest: str, nested_weights: bool = False):
+    """
+    Copy a hub model's files from the local hub cache into dest (resolving the
+    cache's symlinks), without the weight files. With nested_weights, weight
+    files in subdirectories (sub-models the main save_pretrained does not
+    write) are copied too. Used for models whose wrapper has no single
+    save_pretrained (extra configs, sub-models).
+    """
+    source = model_name
+    if not os.path.isdir(model_name):
+        from huggingface_hub import snapshot_download
+        source = snapshot_download(model_name)
+    for dirpath, _, names in os.walk(source):
+        for name in names:
+            nested = dirpath != source
+            if name == MANIFEST or (name.endswith(WEIGHT_SUFFIXES) and not (nested_weights and nested)):
+                continue
+            rel = os.path.relpath(os.path.join(dirpath, name), source)
+            os.makedirs(os.path.dirname(os.path.join(dest, rel)), exist_ok=True)
+            shutil.copyfile(os.path.join(dirpath, name), os.path.join(dest, rel))
+
+
+class SnapshotSource:
+    """Where one engine loads its weights from, and how long loading took (for /health)."""
+
+    def __init__(self, root: str | None, model_name: str, dtype: str):
+        self.model_name = model_name
+        self.dtype = dtype
+        self.path = snapshot_path(root, model_name, dtype) if root else None
+        self.manifest = load_manifest(self.path) if self.path else None
+        self.from_snapshot = self.manifest is not None
+        self.load_seconds = None
+        self.snapshot_seconds = None
+
+    @property
+    def location(self) -> str:
+        """What to pass to from_pretrained / load_model."""
+        return self.path if self.from_snapshot else self.model_name
+
+    @property
+    def should_write(self) -> bool:
+        return self.path is not None and self.manifest is None
+
+    def write(self, save):
+        self.snapshot_seconds = round(materialize(self.path, self.model_name, self.dtype, save), 2)
+        self.manifest = load_manifest(self.path)
+
+    def stats(self) -> dict:
+        return {
+            "source": "snapshot" if self.from_snapshot else "hub",
+            "location": self.location,
+            "dtype": self.dtype,
+            "load_seconds": self.load_seconds,
+            "snapshot_written_seconds": self.snapshot_seconds,
+        }
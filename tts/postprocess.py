@@ -0,0 +1,135 @@
+"""
+Batch post-processing of model output: resampling, silence trimming and
+loudness normalization.
+
+Every output of one model call is processed together, as rows of one
+zero-padded 2-D array, instead of clip by clip:
+
+* Resampling to 24 kHz uses a rational polyphase filter (``scipy.signal.
+  resample_poly``). The FIR filter for each rate pair is designed once and
+  reused.
+* Leading and trailing silence is trimmed with a vectorized frame-energy
+  threshold: frames more than ``trim_db`` below the clip's loudest frame (or
+  below an absolute floor) count as silence. ``pad_ms`` of audio is kept on
+  each side so word onsets and releases are not clipped.
+* Loudness is normalized to ``target_dbfs`` (RMS of the non-silent frames),
+  with the gain limited so peaks stay below ``peak_dbfs``.
+
+The output is the processed clips and their durations in seconds, after trimming.
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+
+SILENCE_FLOOR_DB = -60.0  # frames quieter than this are always silence
+
+
+@lru_cache(maxsize=16)
+def polyphase_filter(up: int, down: int) -> np.ndarray:
+    """Low-pass FIR for resampling by up/down (Kaiser window, as in resample_poly's default)."""
+    from scipy.signal import firwin
+
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    return firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))  # resample_poly scales it by up
+
+
+def resample_batch(batch: np.ndarray, lengths: np.ndarray, orig_sr: int, target_sr: int):
+    """Resample the rows of a padded (clips, samples) array. Returns (batch, lengths)."""
+    if orig_sr == target_sr:
+        return batch, lengths
+    from scipy.signal import resample_poly
+
+    g = math.gcd(orig_sr, target_sr)
+    up, down = target_sr // g, orig_sr // g
+    out = resample_poly(batch, up, down, axis=1, window=polyphase_filter(up, down)).astype(np.float32)
+    return out, -(-lengths * up // down)
+
+
+def resample(audio: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """Resample one 1-D float32 clip with the cached polyphase filter."""
+    batch, lengths = resample_batch(audio[None, :], np.array([len(audio)]), orig_sr, target_sr)
+    return batch[0, :lengths[0]]
+
+
+def pad_batch(audios: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Clips as one zero-padded float32 (clips, samples) array, plus each clip's length."""
+    lengths = np.array([len(a) for a in audios], dtype=np.int64)
+    batch = np.zeros((len(audios), int(lengths.max(initial=0))), dtype=np.float32)
+    for row, audio in zip(batch, audios):
+        row[:len(audio)] = audio
+    return batch, lengths
+
+
+class PostProcessor:
+    """Resample, trim and normalize all clips of one model call together."""
+
+    def __init__(self, sample_rate: int, trim_db: float | None = 40.0, pad_ms: float = 40.0,
+                 target_dbfs: float | None = -20.0, peak_dbfs: float = -1.0, frame_ms: float = 10.0):
+        self.sample_rate = sample_rate
+        self.trim_db = trim_db or None
+        self.pad = int(sample_rate * pad_ms / 1000)
+        self.target_dbfs = target_dbfs
+        self.peak_dbfs = peak_dbfs
+        self.hop = max(1, int(sample_rate * frame_ms / 1000))
+
+    def settings(self) -> tuple:
+        """Everything that changes the output (part of synthesis cache keys)."""
+        return (self.sample_rate, self.trim_db, self.pad, self.target_dbfs, self.peak_dbfs, self.hop)
+
+    def process(self, audios: list[np.ndarray], sample_rate: int) -> tuple[list[np.ndarray], list[float]]:
+        """Processed 1-D float32 clips at self.sample_rate, and their durations in seconds."""
+        batch, lengths = pad_batch(audios)
+        batch, lengths = resample_batch(batch, lengths, sample_rate, self.sample_rate)
+        starts, ends = np.zeros_like(lengths), lengths.copy()
+
+        if batch.shape[1] and (self.trim_db is not None or self.target_dbfs is not None):
+            power_db, active = self._frame_activity(batch, lengths)
+            if self.trim_db is not None:
+                starts, ends = self._trim_bounds(active, lengths)
+            if self.target_dbfs is not None:
+                batch *= self._gains(batch, power_db, active, starts, ends)[:, None]
+
+        clips = [batch[i, starts[i]:ends[i]] for i in range(len(audios))]
+        durations = [round(float(n) / self.sample_rate, 3) for n in ends - starts]
+        return clips, durations
+
+    def _frame_activity(self, batch: np.ndarray, lengths: np.ndarray):
+        """Per-frame power in dB and which frames are non-silent, for every clip."""
+        n_frames = -(-batch.shape[1] // self.hop)
+        frames = np.zeros((batch.shape[0], n_frames * self.hop), dtype=np.float32)
+        frames[:, :batch.shape[1]] = batch
+        frames = frames.reshape(batch.shape[0], n_frames, self.hop)
+        power_db = 10 * np.log10(np.mean(frames * frames, axis=2) + 1e-12)
+
+        valid = np.arange(n_frames)[None, :] * self.hop < lengths[:, None]
+        power_db = np.where(valid, power_db, -np.inf)
+        loudest = power_db.max(axis=1, keepdims=True)
+        threshold = np.maximum(loudest - (self.trim_db or np.inf), SILENCE_FLOOR_DB)
+        return power_db, power_db > threshold
+
+    def _trim_bounds(self, active: np.ndarray, lengths: np.ndarray):
+        """First and last non-silent sample of each clip, padded; silent clips are left whole."""
+        n_frames = active.shape[1]
+        any_active = active.any(axis=1)
+        first = active.argmax(axis=1)
+        last = n_frames - 1 - active[:, ::-1].argmax(axis=1)
+        starts = np.maximum(first * self.hop - self.pad, 0)
+        ends = np.minimum((last + 1) * self.hop + self.pad, lengths)
+        return np.where(any_active, starts, 0), np.where(any_active, ends, lengths)
+
+    def _gains(self, batch, power_db, active, starts, ends) -> np.ndarray:
+        """Linear gain per clip to reach target_dbfs without peaks above peak_dbfs."""
+        power = np.where(active, 10 ** (power_db / 10), 0.0)
+        count = active.sum(axis=1)
+        loudness_db = 10 * np.log10(power.sum(axis=1) / np.maximum(count, 1) + 1e-12)
+
+        positions = np.arange(batch.shape[1])[None, :]
+        inside = (positions >= starts[:, None]) & (positions < ends[:, None])
+        peak_db = 20 * np.log10(np.where(inside, np.abs(batch), 0).max(axis=1) + 1e-12)
+
+        gain_db = np.minimum(self.target_dbfs - loudness_db, self.peak_dbfs - peak_db)
+        gain_db = np.where(count > 0, gain_db, 0.0)  # leave silent clips alone
+        return (10 ** (gain_db / 20)).astype(np.float32)
@@ -0,0 +1,150 @@
+"""
+Two-tier (memory + disk) LRU cache for model server results.
+
+Values are opaque bytes (encoded WAV, JSON, ...) addressed by a content hash
+of everything that influences the result. Recent entries stay in memory;
+every entry is also written to a flat directory on disk, which is capped in
+size and evicted least-recently-used first (file mtime is the recency clock,
+so the order survives restarts).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def hash_key(*parts) -> str:
+    """Build a stable SHA-256 key from JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def hash_bytes(data) -> str:
+    """SHA-256 of a bytes-like object (e.g. a numpy array's buffer)."""
+    return hashlib.sha256(memoryview(data).cast("B")).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe memory + disk LRU cache of bytes values."""
+
+    def __init__(self, cache_dir: str | None, memory_items: int = 256,
+                 max_disk_bytes: int = 2 * 1024 ** 3, suffix: str = ".bin"):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.suffix = suffix
+
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._disk: OrderedDict[str, int] = OrderedDict()  # key -> size, oldest first
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix):
+                continue
+            st = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((st.st_mtime, name[: -len(self.suffix)], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _remember(self, key: str, value: bytes):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key: str) -> bytes | None:
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self.hits += 1
+                return value
+
+            if key not in self._disk:
+                self.misses += 1
+                return None
+
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    value = f.read()
+                os.utime(path)
+            except OSError:
+                self._disk_bytes -= self._disk.pop(key)
+                self.misses += 1
+                return None
+
+            self._disk.move_to_end(key)
+            self._remember(key, value)
+            self.hits += 1
+            self.disk_hits += 1
+            return value
+
+    def put(self, key: str, value: bytes):
+        """Store value under key in memory and (if configured) on disk."""
+        with self._lock:
+            self._remember(key, value)
+            if not self.cache_dir or len(value) > self.max_disk_bytes:
+                return
+
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(value)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Warning: could not write cache entry {key[:12]}: {e}")
+                return
+
+            self._disk_bytes += len(value) - self._disk.pop(key, 0)
+            self._disk[key] = len(value)
+            self._evict_disk()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy, for /health."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "evictions": self.evictions,
+            }
@@ -1,24 +1,30 @@
-import torch
-import soundfile as sf
-import librosa
+"""
+VibeVoice TTS Server
+
+Usage:
+    python server.py --voice-sample path/to/voice.wav --port 5000
+
+Routes, caching, batching and streaming are shared with the other engines
+(see tts_service.py); this file holds the VibeVoice model calls.
+
+torch, vibevoice, librosa and pydub are imported when first needed (on the
+model-loading thread), so --help and the HTTP listener start without them.
+"""
+
 import numpy as np
 import os
-import base64
-import json
-import tempfile
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from vibevoice.processor.vibevoice_processor import VibeVoiceProcessor
-from vibevoice.modular.modeling_vibevoice_inference import VibeVoiceForConditionalGenerationInference
-from pydub import AudioSegment
+import time
+import argparse
+from adaptive_batch import cuda_memory_pressure, cuda_release_memory
+from cancellation import Cancelled
+from model_snapshot import SnapshotSource
+from tts_engine import TTSEngine
+from tts_service import add_server_arguments, serve
+from voice_registry import file_fingerprint
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+DDPM_STEPS = 10
+CFG_SCALE = 1.3
 
-# Global variables for model and processor
-processor = None
-model = None
-voice_sample = None
 def load_voice_sample(voice_path):
     """Load and preprocess voice sample to 24kHz mono.
     
@@ -32,6 +38,7 @@ def load_voice_sample(voice_path):
     if file_ext in video_extensions:
         print(f"Detected video file ({file_ext}), extracting audio...")
         # Extract audio from video file using pydub
+        from pydub import AudioSegment
         audio = AudioSegment.from_file(voice_path)
         
         # Convert to mono
@@ -51,6 +58,7 @@ def load_voice_sample(voice_path):
         print(f"Extracted audio: {len(voice)} samples at {sr} Hz")
     else:
         # Load audio file directly with soundfile
+        import soundfile as sf
         voice, sr = sf.read(voice_path)
         
         if voice.ndim > 1:
@@ -59,232 +67,195 @@ def load_voice_sample(voice_path):
     # Resample to 24kHz if needed
     if sr != 24000:
         print(f"Resampling from {sr} Hz to 24000 Hz...")
+        import librosa
         voice = librosa.resample(voice, orig_sr=sr, target_sr=24000)
     
     return voice
 
-def initialize_model(voice_sample_path, model_name="aoi-ot/VibeVoice-Large"):
-    """Initialize the VibeVoice model and load voice sample."""
-    global processor, model, voice_sample
-    
-    print("Loading voice sample...")
-    voice_sample = load_voice_sample(voice_sample_path)
-    
-    print(f"Loading VibeVoice model: {model_name}...")
-    
-    # Check for CUDA availability
-    if not torch.cuda.is_available():
-        raise RuntimeError("CUDA is not available. This server requires a CUDA-enabled GPU.")
-    
-    processor = VibeVoiceProcessor.from_pretrained(model_name)
+def format_text(text, speaker='Speaker 0'):
+    """Add the speaker prefix VibeVoice expects, unless already present."""
+    text = text.strip()
+    if not text.startswith('Speaker'):
+        return f"{speaker}: {text}"
+    return text
+
+class VibeVoiceEngine(TTSEngine):
+    """VibeVoice: voice cloning from reference clips, one clip per registered voice."""
     
-    # Load model with float16 for GPU compatibility
-    model = VibeVoiceForConditionalGenerationInference.from_pretrained(
-        model_name,
-        torch_dtype=torch.float16,
-        device_map="auto"  # Automatically places model on GPU
-    )
+    name = 'vibevoice'
+    cache_name = 'vibevoice'
     
-    model.eval()
-    model.set_ddpm_inference_steps(10)  # Recommended: 10 for good quality
+    def __init__(self, model_name='aoi-ot/VibeVoice-Large'):
+        super().__init__()
+        self.model_name = model_name
+        self.processor = None
+        self.model = None
+        self.voice_prompts = None
+        self.gpu_name = None
+        self.weights = None
     
-    print(f"Model loaded on CUDA")
-    print(f"GPU: {torch.cuda.get_device_name(0)}")
-    print(f"DDPM inference steps: 10")
-    print(f"Server ready!")
-@app.route('/health', methods=['GET'])
-def health():
-    """Health check endpoint."""
-    return jsonify({
-        'status': 'ok',
-        'model_loaded': model is not None,
-        'engine': 'vibevoice',
-        'device': 'cuda',
-        'gpu_name': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None
-    })
-
-@app.route('/generate', methods=['POST'])
-def generate_audio():
-    """
-    Generate audio from text.
-    Expects JSON: {"text": "Hello!", "speaker": "Speaker 0"} or just {"text": "Hello!"}
-    If speaker is not provided, defaults to "Speaker 0".
-    Returns JSON: {"audio": base64_encoded_wav_data, "sample_rate": 24000}
-    """
-    try:
-        data = request.get_json()
-        text = data.get('text', '')
-        speaker = data.get('speaker', 'Speaker 0')
+    def load(self):
+        """Initialize the VibeVoice model and processor."""
+        print(f"Loading VibeVoice model: {self.model_name}...")
+        self.report_progress(0.0, 'Importing torch and vibevoice')
+        import torch
+        from vibevoice.processor.vibevoice_processor import VibeVoiceProcessor
+        from vibevoice.modular.modeling_vibevoice_inference import VibeVoiceForConditionalGenerationInference
+        from voice_prompts import VoicePromptCache
         
-        if not text:
-            return jsonify({'error': 'No text provided'}), 400
+        # Check for CUDA availability
+        if not torch.cuda.is_available():
+            raise RuntimeError("CUDA is not available. This server requires a CUDA-enabled GPU.")
         
-        if model is None or processor is None:
-            return jsonify({'error': 'Model not initialized'}), 500
+        # A local float16 safetensors snapshot (--snapshot-dir) loads memory-mapped, without casting
+        self.weights = SnapshotSource(self.snapshot_dir, self.model_name, 'float16')
+        source = self.weights.location
+        started = time.monotonic()
         
-        # Format text with speaker prefix if not already present
-        if not text.strip().startswith('Speaker'):
-            formatted_text = f"{speaker}: {text}"
-        else:
-            formatted_text = text
+        self.report_progress(0.2, f'Loading processor from {source}')
+        self.processor = VibeVoiceProcessor.from_pretrained(source)
         
-        print(f"Generating audio for: {formatted_text[:50]}...")
-        
-        # Process inputs
-        inputs = processor(
-            text=[formatted_text],
-            voice_samples=[[voice_sample]],
-            return_tensors="pt"
+        # Load model with float16 for GPU compatibility
+        self.report_progress(0.3, f'Loading model weights from {source}')
+        self.model = VibeVoiceForConditionalGenerationInference.from_pretrained(
+            source,
+            torch_dtype=torch.float16,
+            device_map="auto",  # Automatically places model on GPU
+            use_safetensors=True if self.weights.from_snapshot else None
         )
+        self.weights.load_seconds = round(time.monotonic() - started, 2)
+        print(f"Weights loaded from {'snapshot' if self.weights.from_snapshot else 'hub'} "
+              f"in {self.weights.load_seconds:.1f}s")
         
-        # Move inputs to device
-        device = next(model.parameters()).device
-        inputs = {k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in inputs.items()}
-        
-        # Generate audio
-        with torch.no_grad():
-            audio = model.generate(
-                **inputs,
-                cfg_scale=1.3,
-                tokenizer=processor.tokenizer
-            ).speech_outputs[0]
-        
-        # Convert to numpy and encode as base64
-        audio_np = audio.cpu().numpy().squeeze()
-        
-        # Convert from float16 to float32 for WAV compatibility
-        if audio_np.dtype == np.float16:
-            audio_np = audio_np.astype(np.float32)
-        
-        # Save to temporary buffer and encode
-        import io
-        buffer = io.BytesIO()
-        sf.write(buffer, audio_np, 24000, format='WAV', subtype='PCM_16')
-        buffer.flush()  # Ensure all data is written
-        buffer.seek(0)
-        audio_b64 = base64.b64encode(buffer.read()).decode('utf-8')
-        buffer.close()
-        
-        print("Audio generated successfully")
-        
-        return jsonify({
-            'audio': audio_b64,
-            'sample_rate': 24000,
-            'success': True
-        })
-        
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/generate_batch', methods=['POST'])
-def generate_audio_batch():
-    """
-    Generate audio for multiple texts in a single batch.
-    Expects JSON: {"texts": ["Speaker 0: Hello!", "Speaker 1: Hi!"]}
-    Returns JSON: {"audios": [base64_1, base64_2, ...], "sample_rate": 24000}
-    """
-    try:
-        data = request.get_json()
-        texts = data.get('texts', [])
-        
-        if not texts:
-            return jsonify({'error': 'No texts provided'}), 400
-        
-        if model is None or processor is None:
-            return jsonify({'error': 'Model not initialized'}), 500
-        
-        print(f"Generating audio for {len(texts)} utterances in batch...")
-        
-        # Process all texts at once
-        inputs = processor(
-            text=texts,
-            voice_samples=[[voice_sample]] * len(texts),  # Same voice for all
-            return_tensors="pt"
-        )
+        if self.weights.should_write:
+            self.report_progress(0.8, 'Writing local snapshot (first start only)')
+            try:
+                self.weights.write(self.save_snapshot)
+            except Exception as e:
+                print(f"Snapshot not written (continuing with hub weights): {e}")
         
-        # Move inputs to device
-        device = next(model.parameters()).device
-        inputs = {k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in inputs.items()}
+        self.model.eval()
+        self.model.set_ddpm_inference_steps(DDPM_STEPS)  # Recommended: 10 for good quality
         
-        # Generate audio for all texts
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                cfg_scale=1.3,
-                tokenizer=processor.tokenizer
-            ).speech_outputs
-            
-            # Clear CUDA cache after generation to prevent memory issues
-            torch.cuda.empty_cache()
+        # Process and encode each reference voice once; every request reuses it
+        self.voice_prompts = VoicePromptCache(self.processor, self.model)
         
-        # Convert each audio to base64
-        audios_b64 = []
-        for idx, audio in enumerate(outputs):
-            audio_np = audio.cpu().numpy().squeeze()
+        print(f"Model loaded on CUDA")
+        self.gpu_name = torch.cuda.get_device_name(0)
+        print(f"GPU: {self.gpu_name}")
+        print(f"DDPM inference steps: {DDPM_STEPS}")
+    
+    def save_snapshot(self, directory):
+        """Model weights (float16 safetensors) plus processor and tokenizer config."""
+        self.model.save_pretrained(directory, safe_serialization=True)
+        self.processor.save_pretrained(directory)
+    
+    def is_loaded(self):
+        return self.model is not None
+    
+    def prepare_text(self, text, speaker=None):
+        return format_text(text, speaker or 'Speaker 0')
+    
+    def prepare_voice(self, voice_id, path):
+        """Read a reference clip and cache its conditioning on the GPU."""
+        sample = load_voice_sample(path)
+        self.voice_prompts.register(self.voices.fingerprint(voice_id), sample)
+        return sample
+    
+    def release_voice(self, voice_id, sample):
+        self.voice_prompts.forget(self.voices.fingerprint(voice_id))
+    
+    def voice_fingerprint(self, path):
+        return file_fingerprint(path)
+    
+    def settings(self):
+        return (self.model_name, DDPM_STEPS, CFG_SCALE)
+    
+    def generate(self, texts, voices, options):
+        """Run the model on formatted texts in one voice."""
+        import torch
+        voice_id = voices[0]
+        voice_sample = self.voices.get(voice_id)
+        voice_hash = self.voices.fingerprint(voice_id)
+        with self.voice_prompts.use(voice_hash):
+            inputs = self.processor(
+                text=texts,
+                voice_samples=[[voice_sample]] * len(texts),  # Same voice for all
+                return_tensors="pt"
+            )
             
-            # Convert from float16 to float32 for WAV compatibility
-            if audio_np.dtype == np.float16:
-                audio_np = audio_np.astype(np.float32)
+            # The voice clip is already on the device; broadcast it instead of copying N times
+            inputs['speech_tensors'] = self.voice_prompts.speech_tensors(voice_hash, len(texts))
             
-            # Save to temporary buffer and encode - create fresh buffer for each audio
-            import io
-            buffer = io.BytesIO()
-            try:
-                sf.write(buffer, audio_np, 24000, format='WAV', subtype='PCM_16')
-                buffer.flush()  # Ensure all data is written
-                buffer.seek(0)
-                audio_data = buffer.read()
-                audio_b64 = base64.b64encode(audio_data).decode('utf-8')
-                audios_b64.append(audio_b64)
-                print(f"  Generated audio {idx + 1}/{len(texts)}: {len(audio_data)} bytes, {len(audio_b64)} base64 chars")
-            finally:
-                buffer.close()
+            # Move inputs to device
+            device = next(self.model.parameters()).device
+            inputs = {k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in inputs.items()}
             
-            print(f"  Generated audio {idx + 1}/{len(texts)}")
-        print("Batch generation completed successfully")
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    cfg_scale=CFG_SCALE,
+                    tokenizer=self.processor.tokenizer,
+                    stop_check_fn=options.get('should_stop')  # checked between diffusion steps
+                ).speech_outputs
         
-        return jsonify({
-            'audios': audios_b64,
-            'sample_rate': 24000,
-            'count': len(audios_b64),
-            'success': True
-        })
-        
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        if options.get('should_stop') and options['should_stop']():
+            raise Cancelled("Generation stopped: every request for the batch was cancelled")
+        return outputs, 24000
+    
+    def release_memory(self):
+        cuda_release_memory()
+    
+    def memory_pressure(self):
+        return cuda_memory_pressure()
+    
+    def health(self):
+        return {
+            'device': 'cuda',
+            'gpu_name': self.gpu_name,
+            'weights': self.weights.stats() if self.weights is not None else None,
+            'voice_prompts': self.voice_prompts.stats() if self.voice_prompts is not None else None
+        }
 
 def main():
-    import argparse
-    
     parser = argparse.ArgumentParser(description='VibeVoice TTS Server')
-    parser.add_argument('--voice-sample', type=str, required=True,
-                        help='Path to voice sample WAV file')
+    parser.add_argument('--voice-sample', type=str,
+                        help='Path to voice sample WAV file (registered as voice id "default")')
+    parser.add_argument('--voices-dir', type=str,
+                        help='Directory of reference clips; each file is a voice named after its stem')
+    parser.add_argument('--voices-config', type=str,
+                        help='JSON file mapping voice ids to reference clips (see README)')
+    parser.add_argument('--default-voice', type=str,
+                        help='Voice id used when a request names none (default: --voice-sample, else the first voice)')
+    parser.add_argument('--max-loaded-voices', type=int, default=4,
+                        help='Voices kept prepared on the GPU at once, LRU-evicted (default: 4)')
     parser.add_argument('--model', type=str, default='aoi-ot/VibeVoice-Large',
                         choices=['aoi-ot/VibeVoice-Large', 'FabioSarracino/VibeVoice-Large-Q8'],
                         help='Model to use: aoi-ot/VibeVoice-Large (full) or FabioSarracino/VibeVoice-Large-Q8 (quantized, default: aoi-ot/VibeVoice-Large)')
-    parser.add_argument('--host', type=str, default='0.0.0.0',
-                        help='Host to bind to (default: 0.0.0.0)')
-    parser.add_argument('--port', type=int, default=5000,
-                        help='Port to bind to (default: 5000)')
+    add_server_arguments(parser, 'vibevoice')
     
     args = parser.parse_args()
     
+    engine = VibeVoiceEngine(args.model)
+    voices = engine.create_voices(args.max_loaded_voices)
+    
     # Check if voice sample exists
-    if not os.path.exists(args.voice_sample):
-        print(f"ERROR: Voice sample not found at '{args.voice_sample}'")
+    if args.voice_sample:
+        if not os.path.exists(args.voice_sample):
+            print(f"ERROR: Voice sample not found at '{args.voice_sample}'")
+            return
+        voices.add('default', args.voice_sample)
+    if args.voices_dir:
+        print(f"Voices from {args.voices_dir}: {voices.add_directory(args.voices_dir)}")
+    if args.voices_config:
+        print(f"Voices from {args.voices_config}: {voices.add_config(args.voices_config)}")
+    if args.default_voice:
+        voices.default = args.default_voice
+    if not voices.ids():
+        print("ERROR: No voices given; use --voice-sample, --voices-dir or --voices-config")
         return
     
-    # Initialize model
-    initialize_model(args.voice_sample, args.model)
-    
-    # Start server
-    print(f"\nStarting server on {args.host}:{args.port}")
-    print(f"Health check: http://{args.host}:{args.port}/health")
-    print(f"Generate endpoint: http://{args.host}:{args.port}/generate")
-    
-    app.run(host=args.host, port=args.port, threaded=True)
+    serve(engine, args)
 
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
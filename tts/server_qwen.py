@@ -1,43 +1,22 @@
-import torch
-import soundfile as sf
-import librosa
-import numpy as np
-import io
-import re
-import base64
-import argparse
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
-
-# Global variables
-model = None
-default_speaker = None
-default_language = None
-
-
-def initialize_model(model_name, speaker, language):
-    """Initialize the Qwen3-TTS model."""
-    global model, default_speaker, default_language
-    from qwen_tts import Qwen3TTSModel
-
-    default_speaker = speaker
-    default_language = language
-
-    print(f"Loading Qwen3-TTS model: {model_name}...")
+"""
+Qwen3-TTS Server
 
-    if not torch.cuda.is_available():
-        raise RuntimeError("CUDA is not available. This server requires a CUDA-enabled GPU.")
+Usage:
+    python server_qwen.py --speaker Aiden --language English --port 5000
 
-    model = Qwen3TTSModel.from_pretrained(model_name)
+Routes, caching, batching and streaming are shared with the other engines
+(see tts_service.py); this file holds the Qwen3-TTS model calls.
+torch and qwen_tts are imported on the model-loading thread, not at startup.
+"""
 
-    print(f"Model loaded on CUDA")
-    print(f"GPU: {torch.cuda.get_device_name(0)}")
-    print(f"Speaker: {speaker}")
-    print(f"Language: {language}")
-    print("Server ready!")
+import re
+import time
+import argparse
+from adaptive_batch import cuda_memory_pressure, cuda_release_memory
+from model_snapshot import SnapshotSource, copy_repo_files
+from result_cache import hash_key
+from tts_engine import TTSEngine
+from tts_service import add_server_arguments, serve
 
 
 # ── Text preprocessing ─────────────────────────────────────────────
@@ -56,176 +35,133 @@ def clean_text(text: str) -> str:
     return text.strip()
 
 
-# ── Audio helpers ───────────────────────────────────────────────────
-
-def wav_to_base64(audio_np, sr: int) -> str:
-    """Convert a numpy audio array to base64-encoded WAV at 24 kHz."""
-    if isinstance(audio_np, torch.Tensor):
-        audio_np = audio_np.cpu().numpy()
-    audio_np = audio_np.squeeze().astype(np.float32)
-
-    # Resample to 24 kHz if the model outputs a different rate
-    if sr != 24000:
-        audio_np = librosa.resample(audio_np, orig_sr=sr, target_sr=24000)
-
-    buf = io.BytesIO()
-    sf.write(buf, audio_np, 24000, format="WAV", subtype="PCM_16")
-    buf.seek(0)
-    b64 = base64.b64encode(buf.read()).decode("utf-8")
-    buf.close()
-    return b64
-
-
-def generate_one(text: str, instruct: str | None = None) -> str:
-    """Generate audio for a single text and return base64-encoded WAV."""
-    cleaned = clean_text(text)
-
-    kwargs = dict(
-        text=cleaned,
-        language=default_language,
-        speaker=default_speaker,
-    )
-    if instruct:
-        kwargs["instruct"] = instruct
-
-    wavs, sr = model.generate_custom_voice(**kwargs)
-
-    audio_np = wavs[0] if isinstance(wavs, list) else wavs
-    return wav_to_base64(audio_np, sr)
-
-
-def generate_batch_native(texts: list[str], instruct: str | None = None,
-                          instructs: list[str] | None = None) -> list[str]:
-    """Generate audio for multiple texts using the model's native batch support."""
-    cleaned = [clean_text(t) for t in texts]
-    n = len(cleaned)
-
-    kwargs = dict(
-        text=cleaned,
-        language=[default_language] * n,
-        speaker=[default_speaker] * n,
-    )
-
-    # Per-item instructs take priority over global instruct
-    if instructs and len(instructs) == n:
-        kwargs["instruct"] = [inst or "" for inst in instructs]
-    elif instruct:
-        kwargs["instruct"] = [instruct] * n
-
-    wavs, sr = model.generate_custom_voice(**kwargs)
-
-    return [wav_to_base64(wavs[i], sr) for i in range(n)]
-
-
-# ── Endpoints ───────────────────────────────────────────────────────
-
-@app.route("/health", methods=["GET"])
-def health():
-    """Health check endpoint."""
-    return jsonify({
-        "status": "ok",
-        "model_loaded": model is not None,
-        "engine": "qwen3-tts",
-        "device": "cuda",
-        "gpu_name": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
-        "speaker": default_speaker,
-        "language": default_language,
-    })
-
-
-@app.route("/generate", methods=["POST"])
-def generate_audio():
-    """
-    Generate audio from text.
-    Expects JSON: {"text": "Hello!", "instruct": "speak slowly"}  (instruct is optional)
-    Returns JSON: {"audio": base64_wav, "sample_rate": 24000, "success": true}
-    """
-    try:
-        data = request.get_json()
-        text = data.get("text", "")
-        instruct = data.get("instruct") or None
-
-        if not text:
-            return jsonify({"error": "No text provided"}), 400
-        if model is None:
-            return jsonify({"error": "Model not initialized"}), 500
-
-        print(f"Generating audio for: {clean_text(text)[:80]}...")
-        if instruct:
-            print(f"Instruct: {instruct}")
-        audio_b64 = generate_one(text, instruct)
-        print("Audio generated successfully")
-
-        return jsonify({
-            "audio": audio_b64,
-            "sample_rate": 24000,
-            "success": True,
-        })
-
-    except Exception as e:
-        print(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
-
-
-@app.route("/generate_batch", methods=["POST"])
-def generate_audio_batch():
-    """
-    Generate audio for multiple texts.
-    Expects JSON:
-      {"texts": ["Speaker 0: Hello!", "Speaker 0: Hi!"], "instruct": "speak clearly"}
-      or with per-item instructs:
-      {"texts": [...], "instructs": ["instruct1", "instruct2"]}
-    When "batch" is true (default for >1 texts), uses native model batch inference.
-    When "batch" is false, falls back to sequential generation.
-    Returns JSON: {"audios": [b64_1, b64_2, ...], "sample_rate": 24000, "count": N, "success": true}
-    """
-    try:
-        data = request.get_json()
-        texts = data.get("texts", [])
-        instruct = data.get("instruct") or None
-        instructs = data.get("instructs") or None
-        use_batch = data.get("batch", len(texts) > 1)
-
-        if not texts:
-            return jsonify({"error": "No texts provided"}), 400
-        if model is None:
-            return jsonify({"error": "Model not initialized"}), 500
-
-        if use_batch and len(texts) > 1:
-            print(f"Generating audio for {len(texts)} utterances (native batch)...")
-            if instructs:
-                print(f"Per-item instructs: {len(instructs)} entries")
-            elif instruct:
-                print(f"Instruct: {instruct}")
-
-            audios_b64 = generate_batch_native(texts, instruct, instructs)
-        else:
-            print(f"Generating audio for {len(texts)} utterance(s) sequentially...")
+# ── Engine ──────────────────────────────────────────────────────────
+
+MODEL_DTYPE = "bfloat16"  # serving dtype; snapshots are saved in it
+
+class Qwen3Engine(TTSEngine):
+    """Qwen3-TTS CustomVoice: preset speakers, optional natural-language instruct."""
+
+    name = "qwen3-tts"
+    cache_name = "qwen"
+    supports_instruct = True
+
+    def __init__(self, model_name: str, speaker: str, language: str):
+        super().__init__()
+        self.model_name = model_name
+        self.default_speaker = speaker
+        self.default_language = language
+        self.model = None
+        self.gpu_name = None
+        self.weights = None
+
+    def load(self):
+        """Initialize the Qwen3-TTS model."""
+        print(f"Loading Qwen3-TTS model: {self.model_name}...")
+        self.report_progress(0.0, "Importing torch and qwen_tts")
+        import torch
+        from qwen_tts import Qwen3TTSModel
+
+        if not torch.cuda.is_available():
+            raise RuntimeError("CUDA is not available. This server requires a CUDA-enabled GPU.")
+
+        # A local bfloat16 safetensors snapshot (--snapshot-dir) loads memory-mapped, without casting
+        self.weights = SnapshotSource(self.snapshot_dir, self.model_name, MODEL_DTYPE)
+        self.report_progress(0.3, f"Loading model weights from {self.weights.location}")
+        started = time.monotonic()
+        self.model = Qwen3TTSModel.from_pretrained(
+            self.weights.location,
+            torch_dtype=getattr(torch, MODEL_DTYPE),
+            use_safetensors=True if self.weights.from_snapshot else None,
+        )
+        self.weights.load_seconds = round(time.monotonic() - started, 2)
+        print(f"Weights loaded from {'snapshot' if self.weights.from_snapshot else 'hub'} "
+              f"in {self.weights.load_seconds:.1f}s")
+
+        if self.weights.should_write:
+            self.report_progress(0.8, "Writing local snapshot (first start only)")
+            try:
+                self.weights.write(self.save_snapshot)
+            except Exception as e:
+                print(f"Snapshot not written (continuing with hub weights): {e}")
+
+        self.gpu_name = torch.cuda.get_device_name(0)
+        print(f"Model loaded on CUDA")
+        print(f"GPU: {self.gpu_name}")
+        print(f"Speaker: {self.default_speaker}")
+        print(f"Language: {self.default_language}")
+
+    def save_snapshot(self, directory: str):
+        """
+        The hub repo's configs, tokenizer and sub-models (speech tokenizer), with
+        the main model saved as safetensors in MODEL_DTYPE. Raises if the wrapper
+        exposes no save_pretrained, so no snapshot is written.
+        """
+        inner = getattr(self.model, "model", None)
+        if not hasattr(inner, "save_pretrained"):
+            raise RuntimeError("the Qwen3-TTS wrapper exposes no save_pretrained; no snapshot")
+        copy_repo_files(self.model_name, directory, nested_weights=True)
+        inner.save_pretrained(directory, safe_serialization=True)
+
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    def prepare_text(self, text: str, speaker: str | None = None) -> str:
+        return clean_text(text)
+
+    def voice_spec(self, spec) -> dict:
+        """Normalize a voice config entry to {"speaker": ..., "language": ...}."""
+        if isinstance(spec, str):
+            spec = {"speaker": spec}
+        return {"speaker": spec["speaker"], "language": spec.get("language") or self.default_language}
+
+    def prepare_voice(self, voice_id: str, spec) -> dict:
+        """Preset speakers need no preparation beyond normalizing."""
+        return self.voice_spec(spec)
+
+    def cache_key(self, text: str, voice_id: str, instruct: str | None) -> str:
+        voice = self.voice_spec(self.voices.spec(voice_id))
+        return hash_key("qwen3-tts", text, voice["speaker"], voice["language"],
+                        instruct or None, self.model_name)
+
+    def generate(self, texts: list[str], voices: list[str], options: dict):
+        """Generate audio for texts sharing one voice and instruct (native batch for >1)."""
+        voice = self.voices.get(voices[0])
+        instruct = options.get("instruct")
+        n = len(texts)
+
+        if n == 1:
+            kwargs = dict(text=texts[0], language=voice["language"], speaker=voice["speaker"])
             if instruct:
-                print(f"Instruct: {instruct}")
-
-            audios_b64 = []
-            for idx, text in enumerate(texts):
-                per_instruct = instructs[idx] if instructs and idx < len(instructs) else instruct
-                audio_b64 = generate_one(text, per_instruct or None)
-                audios_b64.append(audio_b64)
-                print(f"  Generated audio {idx + 1}/{len(texts)}")
+                kwargs["instruct"] = instruct
+            wavs, sr = self.model.generate_custom_voice(**kwargs)
+            return [wavs[0] if isinstance(wavs, list) else wavs], sr
+
+        kwargs = dict(
+            text=texts,
+            language=[voice["language"]] * n,
+            speaker=[voice["speaker"]] * n,
+        )
+        if instruct:
+            kwargs["instruct"] = [instruct] * n
 
-        # Free GPU memory between batches
-        torch.cuda.empty_cache()
+        wavs, sr = self.model.generate_custom_voice(**kwargs)
+        return [wavs[i] for i in range(n)], sr
 
-        print("Batch generation completed successfully")
+    def release_memory(self):
+        cuda_release_memory()
 
-        return jsonify({
-            "audios": audios_b64,
-            "sample_rate": 24000,
-            "count": len(audios_b64),
-            "success": True,
-        })
+    def memory_pressure(self) -> float:
+        return cuda_memory_pressure()
 
-    except Exception as e:
-        print(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
+    def health(self) -> dict:
+        return {
+            "device": "cuda",
+            "gpu_name": self.gpu_name,
+            "weights": self.weights.stats() if self.weights is not None else None,
+            "speaker": self.default_speaker,
+            "language": self.default_language,
+        }
 
 
 # ── Main ────────────────────────────────────────────────────────────
@@ -241,27 +177,30 @@ def main():
         help="Language for synthesis (default: English)",
     )
     parser.add_argument(
-        "--model", type=str, default="Qwen/Qwen3-TTS-12Hz-1.7B-CustomVoice",
-        help="HuggingFace model ID (default: Qwen/Qwen3-TTS-12Hz-1.7B-CustomVoice)",
+        "--voices-config", type=str,
+        help='JSON file mapping voice ids to preset speakers, e.g. {"voices": {"vivian": {"speaker": "Vivian"}}}',
     )
     parser.add_argument(
-        "--host", type=str, default="0.0.0.0",
-        help="Host to bind to (default: 0.0.0.0)",
+        "--default-voice", type=str,
+        help="Voice id used when a request names none (default: the --speaker preset)",
     )
     parser.add_argument(
-        "--port", type=int, default=5000,
-        help="Port to bind to (default: 5000)",
+        "--model", type=str, default="Qwen/Qwen3-TTS-12Hz-1.7B-CustomVoice",
+        help="HuggingFace model ID (default: Qwen/Qwen3-TTS-12Hz-1.7B-CustomVoice)",
     )
+    add_server_arguments(parser, "qwen")
 
     args = parser.parse_args()
 
-    initialize_model(args.model, args.speaker, args.language)
-
-    print(f"\nStarting server on {args.host}:{args.port}")
-    print(f"Health check: http://{args.host}:{args.port}/health")
-    print(f"Generate endpoint: http://{args.host}:{args.port}/generate")
+    engine = Qwen3Engine(args.model, args.speaker, args.language)
+    voices = engine.create_voices()
+    voices.add(args.speaker, {"speaker": args.speaker, "language": args.language})
+    if args.voices_config:
+        print(f"Voices from {args.voices_config}: {voices.add_config(args.voices_config, paths=False)}")
+    if args.default_voice:
+        voices.default = args.default_voice
 
-    app.run(host=args.host, port=args.port, threaded=True)
+    serve(engine, args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+"""
+CPU Stub TTS Server
+
+Serves the same API as server.py / server_qwen.py with a deterministic
+synthetic engine instead of a GPU model, so batching, caching, streaming and
+load tests can run on any machine.
+
+Usage:
+    python server_stub.py --port 5000
+    python server_stub.py --voices narrator,guest --seconds-per-char 0.02
+
+The stub's latency follows the shape of a real autoregressive TTS batch. Each
+call costs a fixed overhead plus time proportional to the longest text in the
+batch (shorter items are padded), plus a small per-item cost. Its audio is a
+voiced tone whose pitch depends on the voice, with a syllable-rate envelope
+seeded by the text. The same request always produces the same samples.
+
+With ``--oom-above-chars N`` the stub simulates a memory budget: a call whose
+batch size times longest text exceeds N characters raises a synthetic CUDA
+out-of-memory error, which exercises the adaptive batch splitting.
+
+``StubWhisperModel`` does the same for server_whisperx.py (``--stub``): it
+transcribes and aligns any audio in time proportional to its duration, plus a
+fixed cost per model batch, so the WhisperX serving layer (including how well
+it fills batches) can be benchmarked without a GPU.
+"""
+
+import argparse
+import hashlib
+import time
+
+import numpy as np
+
+from cancellation import Cancelled
+from tts_engine import TTSEngine
+from tts_service import add_server_arguments, serve
+
+SAMPLE_RATE = 24000
+STEP_SECONDS = 0.05  # simulated generation step (cancellation is checked between steps)
+
+
+def _seed(*parts: str) -> int:
+    return int.from_bytes(hashlib.sha256("\x00".join(parts).encode("utf-8")).digest()[:8], "little")
+
+
+def synthesize_stub(text: str, voice_fingerprint: str, chars_per_second: float = 15.0,
+                    sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Deterministic speech-like float32 audio for text, ~chars_per_second, with short silent edges."""
+    rng = np.random.default_rng(_seed(text, voice_fingerprint))
+    voice_rng = np.random.default_rng(_seed(voice_fingerprint))
+
+    speech = max(0.5, len(text) / chars_per_second)
+    edge = int(0.2 * sample_rate)
+    n = int(speech * sample_rate)
+    t = np.arange(n, dtype=np.float32) / sample_rate
+
+    # Pitch per voice, with slow vibrato-like drift
+    f0 = voice_rng.uniform(95.0, 230.0)
+    phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.03 * np.sin(2 * np.pi * 0.7 * t))) / sample_rate
+    voiced = np.sin(phase) + 0.5 * np.sin(2 * phase) + 0.25 * np.sin(3 * phase)
+
+    # Syllable envelope: ~4 syllables/s with random loudness and short gaps
+    syllables = max(1, int(speech * 4))
+    levels = rng.uniform(0.3, 1.0, syllables) * (rng.random(syllables) > 0.1)
+    envelope = np.repeat(levels, -(-n // syllables))[:n]
+    envelope = np.convolve(envelope, np.hanning(481) / np.hanning(481).sum(), mode="same")
+
+    audio = np.zeros(n + 2 * edge, dtype=np.float32)
+    audio[edge:edge + n] = 0.25 * envelope * voiced + 0.005 * rng.standard_normal(n)
+    return audio
+
+
+class StubEngine(TTSEngine):
+    """Synthetic CPU engine with realistic batch latency."""
+
+    name = "stub"
+    cache_name = "stub"
+    supports_instruct = True
+
+    def __init__(self, overhead_seconds: float = 0.3, seconds_per_char: float = 0.01,
+                 seconds_per_item: float = 0.02, chars_per_second: float = 15.0,
+                 oom_above_chars: int | None = None, load_seconds: float = 0.0):
+        super().__init__()
+        self.overhead_seconds = overhead_seconds
+        self.seconds_per_char = seconds_per_char
+        self.seconds_per_item = seconds_per_item
+        self.chars_per_second = chars_per_second
+        self.oom_above_chars = oom_above_chars
+        self.load_seconds = load_seconds
+        self.calls = 0
+        self.memory_releases = 0
+
+    def batch_latency(self, texts: list[str]) -> float:
+        """Simulated model time: padded to the longest text, plus a per-item cost."""
+        longest = max(len(t) for t in texts)
+        return self.overhead_seconds + self.seconds_per_char * longest + self.seconds_per_item * len(texts)
+
+    def load(self):
+        """Simulated model load in ten steps, reported to /health."""
+        for step in range(10):
+            self.report_progress(step / 10, f"Loading stub weights ({step + 1}/10)")
+            time.sleep(self.load_seconds / 10)
+
+    def settings(self) -> tuple:
+        return ("stub", self.chars_per_second)
+
+    def generate(self, texts: list[str], voices: list[str], options: dict):
+        started = time.monotonic()
+        self.calls += 1
+        padded = len(texts) * max(len(t) for t in texts)
+        if self.oom_above_chars is not None and padded > self.oom_above_chars:
+            raise RuntimeError(f"CUDA out of memory (synthetic): batch of {len(texts)} pads to "
+                               f"{padded} chars, budget is {self.oom_above_chars}")
+        instruct = options.get("instruct") or ""
+        audios = [
+            synthesize_stub(text + instruct, self.voices.fingerprint(voice_id), self.chars_per_second)
+            for text, voice_id in zip(texts, voices)
+        ]
+        # Simulated generation steps, checking for cancellation between them like VibeVoice
+        should_stop = options.get("should_stop")
+        deadline = started + self.batch_latency(texts)
+        while (remaining := deadline - time.monotonic()) > 0:
+            if should_stop is not None and should_stop():
+                raise Cancelled("Generation stopped: every request for the batch was cancelled")
+            time.sleep(min(remaining, STEP_SECONDS))
+        return audios, SAMPLE_RATE
+
+    def release_memory(self):
+        self.memory_releases += 1
+
+    def health(self) -> dict:
+        return {"device": "cpu", "gpu_name": None, "model_calls": self.calls,
+                "memory_releases": self.memory_releases}
+
+
+class StubWhisperModel:
+    """Stand-in for a WhisperX pipeline and aligner with duration-proportional latency."""
+
+    def __init__(self, overhead_seconds: float = 0.05, seconds_per_audio_second: float = 0.02,
+                 sample_rate: int = 16000):
+        self.overhead_seconds = overhead_seconds
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.sample_rate = sample_rate
+        self.language = "en"
+        chars = "|abcdefghijklmnopqrstuvwxyz0123456789'"
+        self.align_metadata = {"language": "en", "type": "stub",
+                               "dictionary": {"<pad>": 0, **{c: i + 1 for i, c in enumerate(chars)}}}
+
+    def speech_segments(self, audio) -> list[dict]:
+        """Stand-in for the pipeline's VAD step: the whole clip, in pieces of at most 30 seconds."""
+        duration = len(audio) / self.sample_rate
+        starts = np.arange(0.0, duration, 30.0)
+        return [{"start": float(start), "end": float(min(start + 30.0, duration))} for start in starts]
+
+    def set_language(self, language: str):
+        self.language = language
+
+    def __call__(self, inputs, batch_size: int = 16, num_workers: int = 0):
+        """Same as the pipeline's __call__ over {"inputs": audio} dicts: one {"text": ...} per input, in order."""
+        inputs = iter(inputs)
+        while batch := [item["inputs"] for _, item in zip(range(max(1, batch_size)), inputs)]:
+            time.sleep(self.overhead_seconds
+                       + self.seconds_per_audio_second * sum(len(a) for a in batch) / self.sample_rate)
+            for audio in batch:
+                yield {"text": f"Stub transcription of {len(audio) / self.sample_rate:.2f} seconds of audio."}
+
+    def emissions(self, batch, lengths) -> list[np.ndarray]:
+        """
+        Same as a wav2vec2 emission pass: per-clip CTC log-probabilities, 50 frames
+        per second, with a character peak every 4th frame (about 12 characters per second).
+        """
+        time.sleep(self.overhead_seconds + self.seconds_per_audio_second * int(lengths.sum()) / self.sample_rate)
+        vocab = len(self.align_metadata["dictionary"])
+        out = []
+        for length in lengths:
+            frames = max(1, int(length) // 320)
+            emission = np.full((frames, vocab), np.log(0.5 / (vocab - 1)), dtype=np.float32)
+            emission[:, 0] = np.log(0.5)
+            emission[::4, 0], emission[::4, 1:] = np.log(0.1), np.log(0.9 / (vocab - 1))
+            out.append(emission)
+        return out
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--voices", type=str, default="default",
+                        help="Comma-separated voice ids to register (default: default)")
+    parser.add_argument("--overhead-seconds", type=float, default=0.3,
+                        help="Fixed simulated cost per model call (default: 0.3)")
+    parser.add_argument("--seconds-per-char", type=float, default=0.01,
+                        help="Simulated cost per character of the longest text in a batch (default: 0.01)")
+    parser.add_argument("--seconds-per-item", type=float, default=0.02,
+                        help="Simulated cost per batch item (default: 0.02)")
+    parser.add_argument("--oom-above-chars", type=int, default=None,
+                        help="Raise a synthetic out-of-memory error when batch size x longest text exceeds this")
+    parser.add_argument("--load-seconds", type=float, default=0.0,
+                        help="Simulated model load time, to exercise the loading/warming states (default: 0)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU Stub TTS Server")
+    add_stub_arguments(parser)
+    add_server_arguments(parser, "stub")
+
+    args = parser.parse_args()
+
+    engine = StubEngine(args.overhead_seconds, args.seconds_per_char, args.seconds_per_item,
+                        oom_above_chars=args.oom_above_chars, load_seconds=args.load_seconds)
+    voices = engine.create_voices()
+    for voice_id in args.voices.split(","):
+        voices.add(voice_id.strip(), {"stub_voice": voice_id.strip()})
+
+    serve(engine, args)
+
+
+if __name__ == "__main__":
+    main()
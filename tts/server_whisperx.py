@@ -4,141 +4,413 @@ WhisperX Server — Transcription + Forced Alignment
 Provides transcription (for TTS verification) and forced alignment
 (for word-level timestamps used by inline markers).
 
+The port is bound at once; the model loads and warms up on a background
+thread, /health reports its state (loading/warming/ready) and the model
+endpoints answer 503 with Retry-After until it is ready.
+
 Usage:
     python server_whisperx.py --model large-v3 --port 5001
+    python server_whisperx.py --stub --port 5001   # CPU stand-in, no model (benchmarks/CI)
 
 Endpoints:
-    GET  /health           — Health check (engine: whisperx)
+    GET  /health           — Health check and startup state (engine: whisperx)
     POST /transcribe       — Single audio → text
     POST /transcribe_batch — Batch audio → text
     POST /align            — Single audio + reference text → word timestamps
     POST /align_batch      — Batch audio + reference texts → word timestamps
+    GET  /metrics          — Prometheus metrics (latency, stages, real-time factor)
+
+Audio is accepted as base64 WAV, FLAC or Ogg Opus/Vorbis (the formats the TTS
+servers can produce); the container is detected from the data. With
+"encoding": "f32le" or "s16le", audio is headerless mono PCM at "sample_rate"
+(default 16000, which needs no resampling). Other rates are resampled with a
+cached polyphase filter (postprocess.py).
+
+Transcription runs the pipeline's steps itself so clips can share model
+batches: every clip is cut into speech segments (VAD) first, then the segments
+of all clips in a request are decoded together, --batch-size at a time, and
+the texts are joined back per clip.
+
+Alignment is batched the same way (ctc_align.py): clips are padded into
+batches for one wav2vec2 emission pass each, and the per-clip Viterbi
+backtracking runs on CPU threads while the next batch is on the GPU. Each
+request's "language" selects its alignment model from a per-language LRU pool
+(align_models.py), loaded in the background on first use or at startup with
+--preload-languages.
+
+Results are cached (result_cache.py, memory + disk LRU) by a hash of the
+payload bytes, the reference text, the language and the model, so audio that
+was already transcribed or aligned is answered without decoding it or
+touching the model; every result carries "cached": true/false.
 """
 
 import numpy as np
-import soundfile as sf
-import io
 import base64
 import argparse
-import torch
+import json
+import os
+import time
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import audio_io
+from adaptive_batch import cuda_release_memory
+from admission import AdmissionController, Overloaded, overloaded_response, estimate_samples
+from align_models import AlignModelPool
+from ctc_align import BatchAligner
+from metrics import Metrics, SampledLog, RATIO_BUCKETS, SIZE_BUCKETS, create_metrics_blueprint, instrument_requests
+from model_snapshot import load_manifest, write_manifest
+from postprocess import resample
+from result_cache import ResultCache, hash_bytes, hash_key
+from startup import LOADING, WARMING, NotReady, Startup, not_ready_response
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # Global variables
 whisperx_model = None
-align_model = None
-align_metadata = None
+align_emissions = None  # (model, metadata, padded clips, lengths) -> per-clip CTC log-probs, or the stub's equivalent
+speech_segments = None  # clip -> VAD segments as the pipeline cuts them, or the stub's equivalent
+set_language = None  # points the pipeline's tokenizer at a language, or the stub's equivalent
+batch_size = 16
 model_size = None
+align_model_id = None  # which alignment models the server loads (part of alignment cache keys)
 device_str = None
 compute_type_str = None
-
-
-def initialize_model(size, device, compute_type):
-    """Initialize the WhisperX model (used for transcription)."""
-    global whisperx_model, model_size, device_str, compute_type_str
-    import whisperx
-
+gpu_name = None
+weights = None  # where the model was loaded from and how long it took (for /health)
+startup = Startup()
+aligner = BatchAligner()
+align_load_wait = 60.0  # seconds a request waits for its language's alignment model before a 503
+admission = AdmissionController(max_cost=24000 * 60 * 30, cost_unit="samples", seconds_per_unit=2e-5)
+log = SampledLog()
+result_cache = None  # ResultCache of JSON results, or None with --no-cache
+
+metrics = Metrics("whisperx")
+stage_seconds = metrics.histogram(
+    "stage_seconds", "Time per pipeline stage (decode, resample, vad, transcribe, align)", ("stage",))
+ingest_seconds = metrics.histogram(
+    "ingest_seconds", "Decode and resample time per clip, by payload encoding (container, f32le, s16le)",
+    ("encoding",))
+segments_per_call = metrics.histogram(
+    "transcribe_segments_per_call", "Speech segments, from all clips of a request, decoded in one transcription call",
+    buckets=SIZE_BUCKETS)
+cache_lookups = metrics.counter(
+    "cache_lookups_total", "Result cache lookups by operation (transcribe, align) and result", ("op", "result"))
+audio_seconds = metrics.counter("audio_seconds_total", "Seconds of audio processed, by operation", ("op",))
+real_time_factor = metrics.histogram(
+    "real_time_factor", "Audio seconds processed per wall second, per model call", ("op",),
+    buckets=RATIO_BUCKETS + (128.0, 256.0, 512.0))
+metrics.gauge("time_to_ready_seconds", "Seconds from process start to ready (model loaded and warmed up)",
+              lambda: startup.ready_seconds)
+metrics.gauge("inflight_requests", "Admitted requests in flight", lambda: admission.in_flight)
+metrics.gauge("inflight_samples", "Audio samples of admitted requests in flight", lambda: admission.in_flight_cost)
+app.register_blueprint(create_metrics_blueprint(metrics))
+instrument_requests(app, metrics)
+
+
+def initialize_model(size, device, compute_type, snapshot_dir=None):
+    """
+    Initialize the WhisperX model (used for transcription).
+    With snapshot_dir, the CTranslate2 model files are downloaded there as
+    published and, once complete, loaded from local files only (no hub
+    lookups) on later starts. This is a local download cache, not a dtype
+    snapshot: CTranslate2 still converts the weights to compute_type on load.
+    """
+    global whisperx_model, align_emissions, speech_segments, set_language
+    global model_size, align_model_id, device_str, compute_type_str, gpu_name, weights
     model_size = size
+    align_model_id = "whisperx-default"  # whisperx.load_align_model's wav2vec2 model for each language
     device_str = device
     compute_type_str = compute_type
 
+    startup.progress(0.0, "Importing whisperx")
+    import whisperx
+
     print(f"Loading WhisperX model: {size}...")
     print(f"Device: {device}, Compute type: {compute_type}")
 
-    whisperx_model = whisperx.load_model(size, device, compute_type=compute_type)
+    cache_kwargs = {}
+    cache_path = os.path.join(snapshot_dir, f"whisperx-{size}") if snapshot_dir else None
+    from_cache = cache_path is not None and load_manifest(cache_path) is not None
+    if cache_path:
+        cache_kwargs = {"download_root": cache_path, "local_files_only": from_cache}
+
+    startup.progress(0.3, f"Loading WhisperX model {size}" + (" from local download cache" if from_cache else ""))
+    started = time.monotonic()
+    whisperx_model = whisperx.load_model(size, device, compute_type=compute_type, **cache_kwargs)
+    align_emissions = wav2vec2_emissions
+    speech_segments, set_language = pipeline_speech_segments, pipeline_set_language
+    weights = {
+        "source": "local_cache" if from_cache else "hub",
+        "location": cache_path or size,
+        "compute_type": compute_type,
+        "load_seconds": round(time.monotonic() - started, 2),
+    }
+    print(f"Weights loaded from {weights['source']} in {weights['load_seconds']:.1f}s")
+    if cache_path and not from_cache:
+        try:
+            write_manifest(cache_path, size, "as-published")  # marks the download complete
+            print(f"Local download cache recorded at {cache_path}")
+        except OSError as e:
+            print(f"Local download cache not recorded (continuing): {e}")
 
     print("Model loaded successfully")
     if device == "cuda":
-        print(f"GPU: {torch.cuda.get_device_name(0)}")
+        import torch
+        gpu_name = torch.cuda.get_device_name(0)
+        print(f"GPU: {gpu_name}")
+
+
+def initialize_stub():
+    """Serve a CPU stand-in for WhisperX (see server_stub.py) instead of loading a model."""
+    global whisperx_model, align_emissions, speech_segments, set_language
+    global model_size, align_model_id, device_str
+    from server_stub import StubWhisperModel
+
+    whisperx_model = StubWhisperModel()
+    align_models.load = lambda language: (whisperx_model, {**whisperx_model.align_metadata, "language": language})
+    align_emissions = lambda model, metadata, batch, lengths: model.emissions(batch, lengths)
+    speech_segments, set_language = whisperx_model.speech_segments, whisperx_model.set_language
+    model_size = align_model_id = "stub"
+    device_str = "cpu"
+    print("Stub model ready (no WhisperX)")
+
+
+def load_models(args):
+    """Loader thread: load the transcription model, then warm it up on a second of silence."""
+    startup.begin(LOADING, 0.0, 0.9, "Loading model")
+    if args.stub:
+        initialize_stub()
+    else:
+        initialize_model(args.model, args.device, args.compute_type, args.snapshot_dir)
+    if args.preload_languages:
+        align_models.preload(args.preload_languages)  # in the background; requests wait for their language
+
+    if not args.no_warmup:
+        startup.begin(WARMING, 0.9, 1.0, "Warm-up transcription")
+        try:
+            resample(np.zeros(2400, dtype=np.float32), 24000, WHISPERX_SAMPLE_RATE)  # designs the TTS-rate filter
+            transcribe_audio(np.zeros(WHISPERX_SAMPLE_RATE, dtype=np.float32))
+        except Exception as e:
+            print(f"Warm-up failed (continuing): {e}")
     print("Server ready!")
 
 
-def load_align_model(language="en"):
-    """Lazy-load the alignment model on first use."""
-    global align_model, align_metadata
-    if align_model is not None:
-        return
-
+def load_align_model(language):
+    """Load the wav2vec2 alignment model for a language (called by the pool's loader thread)."""
     import whisperx
-    print(f"Loading alignment model for language: {language}...")
-    align_model, align_metadata = whisperx.load_align_model(
-        language_code=language, device=device_str
-    )
-    print("Alignment model loaded.")
+    return whisperx.load_align_model(language_code=language, device=device_str)
+
+
+def release_align_memory():
+    """Return an evicted alignment model's cached device memory to the driver."""
+    if device_str == "cuda":
+        cuda_release_memory()
+
+
+align_models = AlignModelPool(load_align_model, release=release_align_memory)
 
 
 WHISPERX_SAMPLE_RATE = 16000
+VAD_CHUNK_SECONDS = 30  # longest merged speech segment (the pipeline's chunk_size)
+MIN_ALIGN_SAMPLES = 400  # shortest input the wav2vec2 feature encoder accepts
+
+
+def payload_encoding(data):
+    """A request's raw "encoding" (None for audio files) and "sample_rate". Raises UnsupportedFormat."""
+    encoding = data.get("encoding") or None
+    if encoding is not None and encoding not in audio_io.RAW_ENCODINGS:
+        raise audio_io.UnsupportedFormat(
+            f"Unsupported raw encoding: {encoding} (expected one of {', '.join(audio_io.RAW_ENCODINGS)})")
+    try:
+        sample_rate = int(data.get("sample_rate") or WHISPERX_SAMPLE_RATE)
+    except (TypeError, ValueError):
+        sample_rate = 0
+    if sample_rate <= 0:
+        raise audio_io.UnsupportedFormat(
+            f"Invalid sample_rate: {data.get('sample_rate')!r} (expected a positive integer)")
+    return encoding, sample_rate
+
+
+def payload_samples(audio_b64, encoding=None):
+    """Admission cost of one payload, in samples."""
+    if encoding is None:
+        return estimate_samples(audio_b64)
+    return estimate_samples(audio_b64, audio_io.RAW_ENCODINGS[encoding].itemsize)
 
 
-def decode_audio(audio_b64):
-    """Decode base64 WAV to float32 numpy array, resampled to 16kHz for WhisperX."""
-    audio_bytes = base64.b64decode(audio_b64)
-    buf = io.BytesIO(audio_bytes)
-    audio_np, sample_rate = sf.read(buf)
+def payload_bytes(audio_b64):
+    """The bytes of a base64 payload (what result cache keys hash). Raises UnsupportedFormat."""
+    with stage_seconds.time(stage="decode"):
+        try:
+            return base64.b64decode(audio_b64, validate=True)  # no silently dropped characters
+        except (TypeError, ValueError):  # binascii.Error is a ValueError
+            raise audio_io.UnsupportedFormat("Audio is not valid base64") from None
 
-    # Ensure float32 mono
-    if audio_np.ndim > 1:
-        audio_np = audio_np.mean(axis=1)
-    audio_np = audio_np.astype(np.float32)
 
-    # Resample to 16kHz if needed (WhisperX expects 16kHz)
+def decode_audio(data, encoding=None, sample_rate=WHISPERX_SAMPLE_RATE):
+    """
+    Decode payload bytes to float32 mono at 16 kHz for WhisperX: an audio
+    file (WAV/FLAC/Ogg), or with encoding, raw PCM at sample_rate.
+    """
+    started = time.perf_counter()
+    with stage_seconds.time(stage="decode"):
+        if encoding is None:
+            audio_np, sample_rate = audio_io.decode_audio(data)
+        else:
+            audio_np = audio_io.decode_raw(data, encoding)
+
     if sample_rate != WHISPERX_SAMPLE_RATE:
-        import librosa
-        audio_np = librosa.resample(
-            audio_np, orig_sr=sample_rate, target_sr=WHISPERX_SAMPLE_RATE
-        )
-        sample_rate = WHISPERX_SAMPLE_RATE
+        with stage_seconds.time(stage="resample"):
+            audio_np = resample(audio_np, sample_rate, WHISPERX_SAMPLE_RATE)
+    ingest_seconds.observe(time.perf_counter() - started, encoding=encoding or "container")
+    return audio_np, WHISPERX_SAMPLE_RATE
+
 
-    return audio_np, sample_rate
+def result_key(op, data, encoding, sample_rate, language, text=None):
+    """
+    Result cache key of one transcription or alignment: a hash of the payload
+    bytes (so hits need no decoding), the reference text, language and model.
+    """
+    source = (encoding, sample_rate) if encoding else None  # a container carries its own format
+    model = (model_size, compute_type_str) if op == "transcribe" else align_model_id
+    return hash_key(op, hash_bytes(data), source, text, language, model)
 
 
-def transcribe_audio(audio_np, language="en"):
-    """Transcribe audio using WhisperX, return text."""
-    result = whisperx_model.transcribe(audio_np, language=language, batch_size=16)
-    segments = result.get("segments", [])
-    text_parts = [seg["text"].strip() for seg in segments]
-    return " ".join(text_parts)
+def cached_results(op, payloads, encoding, sample_rate, language, compute, texts=None):
+    """
+    One result dict per payload, each with "cached", taken from the result
+    cache where possible. compute(indices) runs the model for the others and
+    returns their results in that order; they are cached as JSON.
+    """
+    texts = texts or [None] * len(payloads)
+    keys = [result_key(op, data, encoding, sample_rate, language, text) for data, text in zip(payloads, texts)]
+    results = [None] * len(keys)
+    if result_cache is not None:
+        for idx, key in enumerate(keys):
+            value = result_cache.get(key)
+            if value is not None:
+                results[idx] = {**json.loads(value), "cached": True}
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    cache_lookups.inc(len(keys) - len(missing), op=op, result="hit")
+    cache_lookups.inc(len(missing), op=op, result="miss")
+
+    if missing:
+        for idx, result in zip(missing, compute(missing)):
+            if result_cache is not None:
+                result_cache.put(keys[idx], json.dumps(result).encode("utf-8"))
+            results[idx] = {**result, "cached": False}
+    return results
+
+
+def observe_audio(op, samples, seconds):
+    """Record processed audio duration and real-time factor for one model call."""
+    duration = samples / WHISPERX_SAMPLE_RATE
+    audio_seconds.inc(duration, op=op)
+    if seconds > 0:
+        real_time_factor.observe(duration / seconds, op=op)
+
+
+def pipeline_speech_segments(audio_np):
+    """A clip's speech segments as FasterWhisperPipeline.transcribe cuts them (VAD, merged up to 30 s)."""
+    vad = whisperx_model.vad_model
+    params = whisperx_model._vad_params
+    if hasattr(vad, "merge_chunks"):  # whisperx >= 3.3 (pluggable VAD classes)
+        waveform, merge_chunks = vad.preprocess_audio(audio_np), vad.merge_chunks
+    else:
+        import torch
+        from whisperx.vad import merge_chunks
+        waveform = torch.from_numpy(audio_np).unsqueeze(0)
+    segments = vad({"waveform": waveform, "sample_rate": WHISPERX_SAMPLE_RATE})
+    return merge_chunks(segments, VAD_CHUNK_SECONDS, onset=params["vad_onset"], offset=params["vad_offset"])
+
+
+def pipeline_set_language(language):
+    """Point the pipeline's tokenizer at language, as transcribe(language=...) does."""
+    import faster_whisper.tokenizer
+    tokenizer = whisperx_model.tokenizer
+    if tokenizer is None or tokenizer.language_code != language:
+        whisperx_model.tokenizer = faster_whisper.tokenizer.Tokenizer(
+            whisperx_model.model.hf_tokenizer, whisperx_model.model.model.is_multilingual,
+            task="transcribe", language=language,
+        )
 
 
-def align_audio(audio_np, text, language="en"):
+def transcribe_clips(clips, language="en"):
     """
-    Forced-align audio against reference text using WhisperX.
-    Returns list of word-level timestamps.
+    Transcribe several 16 kHz clips, return one text per clip.
+    The speech segments of all clips are pooled and decoded batch_size at a
+    time, so short clips fill the model's batches instead of each making its
+    own nearly empty pass.
     """
-    import whisperx
+    with stage_seconds.time(stage="vad"):
+        pooled = [(idx, seg) for idx, clip in enumerate(clips) for seg in speech_segments(clip)]
+
+    def inputs():
+        for idx, seg in pooled:
+            start, end = int(seg["start"] * WHISPERX_SAMPLE_RATE), int(seg["end"] * WHISPERX_SAMPLE_RATE)
+            yield {"inputs": clips[idx][start:end]}
+
+    parts = [[] for _ in clips]
+    if pooled:
+        set_language(language)
+        segments_per_call.observe(len(pooled))
+        with stage_seconds.time(stage="transcribe") as timer:
+            for (idx, _), out in zip(pooled, whisperx_model(inputs(), batch_size=batch_size)):
+                text = out["text"]
+                parts[idx].append((text[0] if isinstance(text, list) else text).strip())
+        observe_audio("transcribe", sum(len(clip) for clip in clips), timer.elapsed)
+    return [" ".join(p for p in texts if p) for texts in parts]
 
-    load_align_model(language)
 
-    # WhisperX align expects a transcription result with segments.
-    # We create a synthetic result from the reference text.
-    segments = [{"text": text, "start": 0.0, "end": float(len(audio_np)) / 16000.0}]
-    transcript = {"segments": segments, "language": language}
+def transcribe_audio(audio_np, language="en"):
+    """Transcribe audio using WhisperX, return text."""
+    return transcribe_clips([audio_np], language)[0]
+
+
+def wav2vec2_emissions(model, metadata, batch, lengths):
+    """Per-clip CTC log-probabilities from one wav2vec2 pass over zero-padded clips."""
+    import torch
+    if batch.shape[1] < MIN_ALIGN_SAMPLES:
+        batch = np.pad(batch, ((0, 0), (0, MIN_ALIGN_SAMPLES - batch.shape[1])))
+    waveforms = torch.from_numpy(batch).to(device_str)
+    sample_lengths = torch.from_numpy(np.maximum(lengths, MIN_ALIGN_SAMPLES)).to(device_str)
+    with torch.inference_mode():
+        if metadata["type"] == "torchaudio":
+            emissions, frames = model(waveforms, lengths=sample_lengths)
+        else:
+            mask = None
+            if getattr(model.config, "feat_extract_norm", None) == "layer":  # trained with attention masks
+                positions = torch.arange(waveforms.shape[1], device=waveforms.device)
+                mask = (positions[None, :] < sample_lengths[:, None]).long()
+            emissions = model(waveforms, attention_mask=mask).logits
+            frames = model._get_feat_extract_output_lengths(sample_lengths)
+        emissions = torch.log_softmax(emissions, dim=-1).float().cpu().numpy()
+    return [emission[:int(n)] for emission, n in zip(emissions, frames.tolist())]
+
+
+def align_clips(clips, texts, language="en"):
+    """
+    Forced-align 16 kHz clips against their reference texts.
+    Returns each clip's word-level timestamps.
+    """
+    model, metadata = align_models.get(language, align_load_wait)
 
-    result = whisperx.align(
-        transcript["segments"],
-        align_model,
-        align_metadata,
-        audio_np,
-        device_str,
-        return_char_alignments=False,
-    )
+    def emit(batch, lengths):
+        with stage_seconds.time(stage="align") as timer:
+            emissions = align_emissions(model, metadata, batch, lengths)
+        observe_audio("align", int(lengths.sum()), timer.elapsed)
+        return emissions
 
-    # Extract word-level timestamps
-    words = []
-    for seg in result.get("segments", []):
-        for w in seg.get("words", []):
-            word_entry = {
-                "word": w.get("word", ""),
-                "start": round(w.get("start", 0.0), 4),
-                "end": round(w.get("end", 0.0), 4),
-                "score": round(w.get("score", 0.0), 4),
-            }
-            words.append(word_entry)
+    return aligner.align(emit, clips, texts, metadata["dictionary"], language, WHISPERX_SAMPLE_RATE)
 
-    return words
+
+def align_audio(audio_np, text, language="en"):
+    """
+    Forced-align audio against reference text.
+    Returns list of word-level timestamps.
+    """
+    return align_clips([audio_np], [text], language)[0]
 
 
 # ── Endpoints ───────────────────────────────────────────────────────
@@ -147,20 +419,20 @@ def align_audio(audio_np, text, language="en"):
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint."""
-    gpu_name = None
-    try:
-        if torch.cuda.is_available():
-            gpu_name = torch.cuda.get_device_name(0)
-    except Exception:
-        pass
-
     return jsonify(
         {
             "status": "ok",
+            "state": startup.state,
+            "startup": startup.stats(),
             "model_loaded": whisperx_model is not None,
             "engine": "whisperx",
             "model_size": model_size,
+            "weights": weights,
             "gpu_name": gpu_name,
+            "admission": admission.stats(),
+            "alignment": aligner.stats(),
+            "align_models": align_models.stats(),
+            "cache": result_cache.stats() if result_cache is not None else None,
         }
     )
 
@@ -169,8 +441,10 @@ def health():
 def transcribe():
     """
     Transcribe audio to text.
-    Expects JSON: {"audio": base64_wav, "language": "en"}
-    Returns JSON: {"text": "transcribed text", "success": true}
+    Expects JSON: {"audio": base64_audio, "language": "en"} (WAV, FLAC or Ogg Opus)
+    With "encoding": "f32le"/"s16le" (and "sample_rate", default 16000), audio is raw mono PCM;
+    every endpoint accepts these.
+    Returns JSON: {"text": "transcribed text", "cached": false, "success": true}
     """
     try:
         data = request.get_json()
@@ -179,17 +453,26 @@ def transcribe():
 
         if not audio_b64:
             return jsonify({"error": "No audio provided"}), 400
-        if whisperx_model is None:
-            return jsonify({"error": "Model not initialized"}), 500
-
-        audio_np, _ = decode_audio(audio_b64)
-        print(f"Transcribing audio ({len(audio_np)} samples)...")
-
-        text = transcribe_audio(audio_np, language)
-        print(f"Transcribed: {text[:80]}...")
-
-        return jsonify({"text": text, "success": True})
-
+        encoding, sample_rate = payload_encoding(data)
+        startup.check()
+
+        def transcribe_missing(_):
+            with admission.admit(payload_samples(audio_b64, encoding)):
+                audio_np, _ = decode_audio(payload, encoding, sample_rate)
+                log.event("transcribe", samples=len(audio_np), language=language)
+                return [{"text": transcribe_audio(audio_np, language)}]
+
+        payload = payload_bytes(audio_b64)
+        result = cached_results("transcribe", [payload], encoding, sample_rate, language, transcribe_missing)[0]
+
+        return jsonify({**result, "success": True})
+
+    except audio_io.UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 400
+    except Overloaded as e:
+        return overloaded_response(e)
+    except NotReady as e:
+        return not_ready_response(e)
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -198,9 +481,11 @@ def transcribe():
 @app.route("/transcribe_batch", methods=["POST"])
 def transcribe_batch():
     """
-    Transcribe multiple audio files.
-    Expects JSON: {"audios": [b64_1, b64_2, ...], "language": "en"}
-    Returns JSON: {"transcriptions": [{"text": "..."}, ...], "count": N, "success": true}
+    Transcribe multiple audio files, with the speech segments of all of them
+    decoded together in shared model batches.
+    Expects JSON: {"audios": [b64_1, b64_2, ...], "language": "en"} (WAV, FLAC or Ogg Opus)
+    Only clips without a cached result are decoded and transcribed.
+    Returns JSON: {"transcriptions": [{"text": "...", "cached": false}, ...], "count": N, "success": true}
     """
     try:
         data = request.get_json()
@@ -209,19 +494,21 @@ def transcribe_batch():
 
         if not audios:
             return jsonify({"error": "No audios provided"}), 400
-        if whisperx_model is None:
-            return jsonify({"error": "Model not initialized"}), 500
-
-        print(f"Transcribing batch of {len(audios)} audio files...")
-
-        transcriptions = []
-        for idx, audio_b64 in enumerate(audios):
-            audio_np, _ = decode_audio(audio_b64)
-            text = transcribe_audio(audio_np, language)
-            transcriptions.append({"text": text})
-            print(f"  Transcribed {idx + 1}/{len(audios)}: {text[:60]}...")
-
-        print("Batch transcription completed successfully")
+        encoding, sample_rate = payload_encoding(data)
+        startup.check()
+
+        def transcribe_missing(indices):
+            with admission.admit(sum(payload_samples(audios[idx], encoding) for idx in indices)):
+                log.event("transcribe_batch", count=len(indices), cached=len(audios) - len(indices),
+                          language=language)
+                clips = [decode_audio(payloads[idx], encoding, sample_rate)[0] for idx in indices]
+                return [{"text": text} for text in transcribe_clips(clips, language)]
+
+        payloads = [payload_bytes(audio_b64) for audio_b64 in audios]
+        transcriptions = cached_results("transcribe", payloads, encoding, sample_rate, language, transcribe_missing)
+        for idx, result in enumerate(transcriptions):
+            log.event("transcribe_item", index=idx, total=len(audios), text=result["text"][:60],
+                      cached=result["cached"])
 
         return jsonify(
             {
@@ -231,6 +518,12 @@ def transcribe_batch():
             }
         )
 
+    except audio_io.UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 400
+    except Overloaded as e:
+        return overloaded_response(e)
+    except NotReady as e:
+        return not_ready_response(e)
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -240,9 +533,10 @@ def transcribe_batch():
 def align():
     """
     Forced alignment: audio + reference text → word-level timestamps.
-    Expects JSON: {"audio": base64_wav, "text": "reference text", "language": "en"}
+    Expects JSON: {"audio": base64_audio, "text": "reference text", "language": "en"} (WAV, FLAC or Ogg Opus)
     Returns JSON: {
         "words": [{"word": "hello", "start": 0.0, "end": 0.32, "score": 0.95}, ...],
+        "cached": false,
         "success": true
     }
     """
@@ -256,17 +550,26 @@ def align():
             return jsonify({"error": "No audio provided"}), 400
         if not text:
             return jsonify({"error": "No text provided"}), 400
-        if whisperx_model is None:
-            return jsonify({"error": "Model not initialized"}), 500
-
-        audio_np, _ = decode_audio(audio_b64)
-        print(f"Aligning audio ({len(audio_np)} samples) against text: {text[:60]}...")
-
-        words = align_audio(audio_np, text, language)
-        print(f"Aligned {len(words)} words")
-
-        return jsonify({"words": words, "success": True})
-
+        encoding, sample_rate = payload_encoding(data)
+        startup.check()
+
+        def align_missing(_):
+            with admission.admit(payload_samples(audio_b64, encoding)):
+                audio_np, _ = decode_audio(payload, encoding, sample_rate)
+                log.event("align", samples=len(audio_np), text=text[:60])
+                return [{"words": align_audio(audio_np, text, language)}]
+
+        payload = payload_bytes(audio_b64)
+        result = cached_results("align", [payload], encoding, sample_rate, language, align_missing, [text])[0]
+
+        return jsonify({**result, "success": True})
+
+    except audio_io.UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 400
+    except Overloaded as e:
+        return overloaded_response(e)
+    except NotReady as e:
+        return not_ready_response(e)
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -276,16 +579,18 @@ def align():
 def align_batch():
     """
     Batch forced alignment: multiple audio + reference texts → word-level timestamps.
+    Clips share padded wav2vec2 emission passes (--align-batch-size per pass);
+    only items without a cached result are decoded and aligned.
     Expects JSON: {
         "items": [
-            {"audio": base64_wav, "text": "reference text"},
+            {"audio": base64_audio, "text": "reference text"},
             ...
         ],
         "language": "en"
     }
     Returns JSON: {
         "alignments": [
-            {"words": [{"word": "hello", "start": 0.0, "end": 0.32, "score": 0.95}, ...]},
+            {"words": [{"word": "hello", "start": 0.0, "end": 0.32, "score": 0.95}, ...], "cached": false},
             ...
         ],
         "count": N,
@@ -299,31 +604,36 @@ def align_batch():
 
         if not items:
             return jsonify({"error": "No items provided"}), 400
-        if whisperx_model is None:
-            return jsonify({"error": "Model not initialized"}), 500
-
-        print(f"Aligning batch of {len(items)} items...")
-
-        alignments = []
-        for idx, item in enumerate(items):
-            audio_b64 = item.get("audio", "")
-            text = item.get("text", "")
-
-            if not audio_b64 or not text:
-                alignments.append({"words": [], "error": "Missing audio or text"})
-                continue
-
-            audio_np, _ = decode_audio(audio_b64)
-            words = align_audio(audio_np, text, language)
-            alignments.append({"words": words})
-            print(f"  Aligned {idx + 1}/{len(items)}: {len(words)} words")
-
-        print("Batch alignment completed successfully")
+        encoding, sample_rate = payload_encoding(data)
+        startup.check()
+
+        alignments = [{"words": [], "error": "Missing audio or text"} for _ in items]
+        valid = [idx for idx, item in enumerate(items) if item.get("audio") and item.get("text")]
+        texts = [items[idx]["text"] for idx in valid]
+
+        def align_missing(indices):
+            with admission.admit(sum(payload_samples(items[valid[i]]["audio"], encoding) for i in indices)):
+                log.event("align_batch", count=len(indices), cached=len(valid) - len(indices), language=language)
+                clips = [decode_audio(payloads[i], encoding, sample_rate)[0] for i in indices]
+                return [{"words": words} for words in align_clips(clips, [texts[i] for i in indices], language)]
+
+        payloads = [payload_bytes(items[idx]["audio"]) for idx in valid]
+        results = cached_results("align", payloads, encoding, sample_rate, language, align_missing, texts)
+        for idx, result in zip(valid, results):
+            alignments[idx] = result
+            log.event("align_item", index=idx, total=len(items), words=len(result["words"]),
+                      cached=result["cached"])
 
         return jsonify(
             {"alignments": alignments, "count": len(alignments), "success": True}
         )
 
+    except audio_io.UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 400
+    except Overloaded as e:
+        return overloaded_response(e)
+    except NotReady as e:
+        return not_ready_response(e)
     except Exception as e:
         print(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -354,6 +664,65 @@ def main():
         default="cuda",
         help="Device to run on (default: cuda). Options: cuda, cpu",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=16,
+        help="Speech segments decoded per transcription batch, pooled across the clips of a request (default: 16)",
+    )
+    parser.add_argument(
+        "--align-batch-size",
+        type=int,
+        default=8,
+        help="Clips per padded wav2vec2 emission pass in /align_batch (default: 8)",
+    )
+    parser.add_argument(
+        "--align-workers",
+        type=int,
+        default=4,
+        help="CPU threads backtracking alignments while the next batch runs (default: 4)",
+    )
+    parser.add_argument(
+        "--preload-languages",
+        type=lambda value: [code.strip() for code in value.split(",") if code.strip()],
+        default=[],
+        help="Comma-separated language codes whose alignment models are loaded at startup, e.g. en,de",
+    )
+    parser.add_argument(
+        "--align-memory-gb",
+        type=float,
+        default=4.0,
+        help="Memory cap for loaded alignment models, least recently used evicted first (default: 4.0)",
+    )
+    parser.add_argument(
+        "--align-load-wait",
+        type=float,
+        default=60,
+        help="Seconds a request waits for its language's alignment model to load before a 503 (default: 60)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default="cache/whisperx",
+        help="Directory for the on-disk transcription/alignment cache (default: cache/whisperx)",
+    )
+    parser.add_argument(
+        "--cache-max-gb",
+        type=float,
+        default=0.5,
+        help="Disk cap for the result cache in GB, LRU-evicted (default: 0.5)",
+    )
+    parser.add_argument(
+        "--cache-memory-items",
+        type=int,
+        default=1024,
+        help="Number of recent results kept in memory (default: 1024)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the result cache (always decode and run the model)",
+    )
     parser.add_argument(
         "--host",
         type=str,
@@ -366,10 +735,61 @@ def main():
         default=5001,
         help="Port to bind to (default: 5001)",
     )
+    parser.add_argument(
+        "--max-queue-requests",
+        type=int,
+        default=64,
+        help="Max in-flight requests before answering 429 (default: 64)",
+    )
+    parser.add_argument(
+        "--max-queue-seconds",
+        type=float,
+        default=1800,
+        help="Max seconds of 24 kHz audio in flight before answering 429 (default: 1800)",
+    )
+    parser.add_argument(
+        "--stub",
+        action="store_true",
+        help="Serve a CPU stand-in instead of WhisperX (benchmarks and CI without a GPU)",
+    )
+    parser.add_argument(
+        "--snapshot-dir",
+        type=str,
+        default=None,
+        help="Local download cache: keep the model files here and load them from local files only on later starts",
+    )
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="Skip the warm-up transcription after loading (ready sooner, slower first request)",
+    )
+    parser.add_argument(
+        "--log-every",
+        type=int,
+        default=50,
+        help="Log one in every N per-item/per-request events, as JSON lines (default: 50)",
+    )
 
     args = parser.parse_args()
 
-    initialize_model(args.model, args.device, args.compute_type)
+    global batch_size, aligner, align_load_wait, result_cache
+    batch_size = max(1, args.batch_size)
+    aligner = BatchAligner(args.align_batch_size, args.align_workers)
+    align_models.max_bytes = int(args.align_memory_gb * 1024 ** 3)
+    align_load_wait = args.align_load_wait
+    admission.max_requests = max(1, args.max_queue_requests)
+    admission.max_cost = int(args.max_queue_seconds * 24000)
+    log.every = max(1, args.log_every)
+    if not args.no_cache:
+        result_cache = ResultCache(
+            args.cache_dir,
+            memory_items=args.cache_memory_items,
+            max_disk_bytes=int(args.cache_max_gb * 1024 ** 3),
+            suffix=".json",
+        )
+        print(f"Result cache: {args.cache_dir} ({result_cache.stats()['disk_items']} entries on disk)")
+
+    startup.run(lambda _: load_models(args))
 
     print(f"\nStarting server on {args.host}:{args.port}")
     print(f"Health check: http://{args.host}:{args.port}/health")
@@ -377,6 +797,7 @@ def main():
     print(f"Batch transcribe: http://{args.host}:{args.port}/transcribe_batch")
     print(f"Align endpoint: http://{args.host}:{args.port}/align")
     print(f"Batch align: http://{args.host}:{args.port}/align_batch")
+    print(f"Metrics: http://{args.host}:{args.port}/metrics")
 
     app.run(host=args.host, port=args.port, threaded=True)
 
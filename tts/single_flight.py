@@ -0,0 +1,93 @@
+"""
+In-flight request coalescing ("single flight") for the model servers.
+
+When the narration editor and a generation script ask for the same segment
+at the same time, only the first request (the leader) computes it; later
+requests for the same key join the leader's computation and receive the same
+result (or the same error) when it finishes. A key is in flight only from
+``join`` until ``resolve``, so this never serves stale results and needs no
+result cache; with a cache, finished results are found there instead.
+
+Duplicates inside one request are collapsed by the caller before joining, so
+a key is joined at most once per request.
+
+A leader whose request is cancelled can ``abandon`` its keys, and so stop its
+computation, only while no other request waits on them. Abandoned keys leave
+the registry at once, so later requests lead a fresh computation.
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Registry of computations in flight, by key."""
+
+    def __init__(self):
+        self._calls: dict[str, Future] = {}
+        self._waiters: dict[Future, int] = {}  # followers per flight
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def join(self, key: str) -> tuple[Future, bool]:
+        """
+        The future for key and whether the caller leads it. The leader must
+        call resolve(key, future, ...) when its computation finishes or fails
+        (or abandon it); everyone else just waits on the future.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                self._waiters[future] += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self._waiters[future] = 0
+            self.leaders += 1
+            return future, True
+
+    def leave(self, key: str, future: Future):
+        """A follower stops waiting on a flight (its own request was cancelled)."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                self._waiters[future] -= 1
+
+    def abandon(self, flights: list[tuple[str, Future]]) -> bool:
+        """
+        Drop a leader's (key, future) flights if no follower waits on any of them,
+        and return whether they are all gone (so the leader's work can stop).
+        """
+        with self._lock:
+            live = [(key, future) for key, future in flights if self._calls.get(key) is future]
+            if any(self._waiters[future] for _, future in live):
+                return False
+            for key, future in live:
+                del self._calls[key]
+                del self._waiters[future]
+            return True
+
+    def resolve(self, key: str, future: Future, result=None, error: BaseException | None = None):
+        """Finish a flight, handing result (or error) to every waiter."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+                del self._waiters[future]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+            }
@@ -0,0 +1,154 @@
+"""
+Background model loading and readiness states for the model servers.
+
+The HTTP listener starts immediately and the model is loaded and warmed up by
+a background thread, so clients see "loading"/"warming" on ``/health`` instead
+of connection refused. Model endpoints raise ``NotReady`` until startup
+finishes, and the server answers ``503`` with a ``Retry-After`` hint.
+
+Startup goes through phases (``begin(state, start, end, detail)``). Each phase
+covers a slice of the overall 0–1 progress, and code running inside a phase
+reports its own 0–1 progress with ``progress(fraction, detail)``. The wall time
+of every phase and the total time to ready are kept for /health, so load-path
+changes can be measured.
+"""
+
+import math
+import threading
+import time
+import traceback
+
+from flask import jsonify
+
+LOADING = "loading"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+PROCESS_STARTED = time.monotonic()  # approximately process start: imported before any model code
+
+
+class NotReady(Exception):
+    """Raised by model endpoints while the server is still starting (or failed to start)."""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Startup:
+    """Readiness state of one server: loading → warming → ready (or failed)."""
+
+    def __init__(self):
+        self.state = LOADING
+        self.detail = "Starting"
+        self.error = None
+        self.started_at = PROCESS_STARTED
+        self.ready_seconds = None
+        self._start, self._end, self._fraction = 0.0, 0.0, 0.0
+        self.phases: dict[str, float] = {}  # phase detail -> seconds
+        self._phase = None
+        self._phase_started = time.monotonic()
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    # ── Reporting (loader thread) ───────────────────────────────────
+
+    def begin(self, state: str, start: float, end: float, detail: str):
+        """Enter a phase that covers overall progress start..end."""
+        with self._lock:
+            self._end_phase()
+            self._phase, self._phase_started = detail, time.monotonic()
+            self.state, self.detail = state, detail
+            self._start, self._end, self._fraction = start, end, 0.0
+        print(f"[{state} {start:.0%}] {detail}")
+
+    def progress(self, fraction: float, detail: str | None = None):
+        """Progress within the current phase (0-1)."""
+        with self._lock:
+            self._fraction = min(1.0, max(0.0, fraction))
+            if detail:
+                self.detail = detail
+        if detail:
+            print(f"[{self.state} {self.overall_progress():.0%}] {detail}")
+
+    def _end_phase(self):
+        if self._phase is not None:
+            self.phases[self._phase] = round(time.monotonic() - self._phase_started, 2)
+            self._phase = None
+
+    def overall_progress(self) -> float:
+        if self.state == READY:
+            return 1.0
+        return self._start + (self._end - self._start) * self._fraction
+
+    def ready(self):
+        with self._lock:
+            self._end_phase()
+            self.state, self.detail = READY, "Ready"
+            self.ready_seconds = round(time.monotonic() - self.started_at, 2)
+        self._ready.set()
+        phases = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.phases.items())
+        print(f"Time to ready: {self.ready_seconds:.1f}s ({phases})")
+
+    def fail(self, exc: BaseException):
+        with self._lock:
+            self._end_phase()
+            self.state, self.detail, self.error = FAILED, "Startup failed", str(exc)
+        print(f"Startup failed: {exc}")
+
+    def run(self, load):
+        """Run load(self) on a daemon thread; it ends in ready() or, on an exception, fail()."""
+        def target():
+            try:
+                load(self)
+                self.ready()
+            except Exception as e:
+                traceback.print_exc()
+                self.fail(e)
+
+        thread = threading.Thread(target=target, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    # ── Checking (request threads) ──────────────────────────────────
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def check(self):
+        """Raise NotReady unless startup has finished."""
+        if self._ready.is_set():
+            return
+        if self.state == FAILED:
+            raise NotReady(60, f"Model failed to load: {self.error}")
+        elapsed = time.monotonic() - self.started_at
+        progress = self.overall_progress()
+        # Remaining time extrapolated from progress so far, within 1-60 seconds
+        remaining = elapsed * (1 - progress) / progress if progress > 0 else 10
+        raise NotReady(min(60, max(1, math.ceil(remaining))),
+                       f"Server is {self.state} ({progress:.0%}): {self.detail}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "progress": round(self.overall_progress(), 3),
+                "detail": self.detail,
+                "seconds": round(time.monotonic() - self.started_at, 1),
+                "ready_seconds": self.ready_seconds,
+                "phases": dict(self.phases),
+                "error": self.error,
+            }
+
+
+def not_ready_response(e: NotReady):
+    """503 response for a request that arrived before the model was ready."""
+    response = jsonify({"error": str(e), "retry_after": e.retry_after, "success": False})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
@@ -0,0 +1,100 @@
+"""
+Engine interface between the shared TTS serving layer and one model backend.
+
+The serving layer (``tts_service.py``) owns everything that is the same for
+every backend: routes, validation, voices, caching, batching, admission,
+streaming and WAV encoding. An engine only turns prepared texts into audio:
+
+    generate(texts, voices, options) -> (arrays, sample_rate)
+
+``texts`` are already prepared by ``prepare_text``. ``voices`` holds one
+registered voice id per text, and ``options`` holds per-batch settings such
+as ``{"instruct": ...}``. The serving layer only sends sub-batches that share
+a voice and options. An engine signals out-of-memory by raising (as torch
+does); the serving layer then splits the sub-batch (see adaptive_batch.py).
+"""
+
+from result_cache import hash_key
+from voice_registry import VoiceRegistry
+
+
+class TTSEngine:
+    """Base class for TTS backends; subclasses implement load() and generate()."""
+
+    name = "tts"               # reported as "engine" on /health, first part of cache keys
+    cache_name = "tts"         # default cache/<cache_name> and jobs-<cache_name>.sqlite3
+    supports_instruct = False  # whether "instruct" reaches the model (else it is ignored)
+
+    def __init__(self):
+        self.voices: VoiceRegistry | None = None
+        self.startup = None       # startup.Startup while serve() loads the engine
+        self.snapshot_dir = None  # --snapshot-dir: local weight snapshots (see model_snapshot.py)
+
+    def create_voices(self, max_loaded: int = 4) -> VoiceRegistry:
+        """Voice registry wired to this engine's prepare/release callbacks."""
+        self.voices = VoiceRegistry(self.prepare_voice, self.release_voice,
+                                    fingerprint=self.voice_fingerprint, max_loaded=max_loaded)
+        return self.voices
+
+    # ── Model ───────────────────────────────────────────────────────
+
+    def load(self):
+        """Load the model. Called once on a background thread while the server answers 503."""
+
+    def report_progress(self, fraction: float, detail: str | None = None):
+        """Report load progress (0-1) to /health; a no-op outside serve()."""
+        if self.startup is not None:
+            self.startup.progress(fraction, detail)
+
+    def warm_up(self):
+        """Run one short synthesis so the first real request doesn't pay for lazy initialization."""
+        voice_id = self.voices.default
+        self.generate([self.prepare_text("Hello.")], [voice_id], {"instruct": None})
+
+    def is_loaded(self) -> bool:
+        return True
+
+    def generate(self, texts: list[str], voices: list[str], options: dict) -> tuple[list, int]:
+        """
+        Synthesize prepared texts; returns (one float array or tensor per text, sample_rate).
+        options["should_stop"]() turns true once every request for the batch has been
+        cancelled; engines that can stop between generation steps raise Cancelled then.
+        """
+        raise NotImplementedError
+
+    def release_memory(self):
+        """Return cached device memory to the driver (called after OOM or under memory pressure)."""
+
+    def memory_pressure(self) -> float:
+        """Fraction of device memory currently held (0.0 = none); above --memory-pressure, memory is released."""
+        return 0.0
+
+    # ── Text and voices ─────────────────────────────────────────────
+
+    def prepare_text(self, text: str, speaker: str | None = None) -> str:
+        """Normalize request text into what the model (and the cache key) sees."""
+        return text.strip()
+
+    def prepare_voice(self, voice_id: str, spec):
+        """Turn a registered voice spec into a ready-to-use voice (see voice_registry.py)."""
+        return spec
+
+    def release_voice(self, voice_id: str, voice):
+        """Free whatever prepare_voice allocated."""
+
+    def voice_fingerprint(self, spec) -> str:
+        return hash_key(spec)
+
+    # ── Identity ────────────────────────────────────────────────────
+
+    def settings(self) -> tuple:
+        """Model name and sampling settings that change the output (part of cache keys)."""
+        return ()
+
+    def cache_key(self, text: str, voice_id: str, instruct: str | None) -> str:
+        """Content address of one synthesis result."""
+        return hash_key(self.name, text, self.voices.fingerprint(voice_id), instruct, *self.settings())
+
+    def health(self) -> dict:
+        """Engine-specific fields for /health."""
+        return {}
@@ -0,0 +1,839 @@
+"""
+Shared serving layer for the TTS servers.
+
+``server.py`` (VibeVoice), ``server_qwen.py`` (Qwen3-TTS) and ``server_stub.py``
+(CPU stub) each define a ``TTSEngine`` and hand it to ``serve()``. Everything
+else lives here once, for every backend:
+
+    GET  /health          — Startup state (loading/warming/ready), engine info, cache/scheduler/admission/voice stats
+    GET  /voices          — Registered voice ids and the default
+    GET  /metrics         — Prometheus metrics (latency, stages, RTF, batches, cache)
+    POST /generate        — Single text → WAV (JSON base64, or raw audio/wav); long texts are
+                            split at sentences, batched and stitched (long_text.py)
+    POST /generate_batch  — Many texts → WAVs (JSON, NDJSON stream or binary frames)
+    POST /estimate        — Batch plan and ETA without running it
+    DELETE /requests/<id> — Cancel an in-flight generate request by its X-Request-Id
+         /jobs...         — Durable batch jobs (see job_queue.py)
+
+Every endpoint takes "format" ("wav", "flac" or "opus", with "bitrate" in kbps
+for Opus); audio is generated and cached as WAV and transcoded on a small
+encoder thread pool (--encode-workers).
+
+Request items are prepared by the engine, served from the synthesis cache
+where possible, and otherwise planned into per-(voice, instruct) sub-batches
+that the inference worker (batch_scheduler.py) runs one at a time. Sub-batches
+that run out of memory are split and retried (adaptive_batch.py). Each model
+call's outputs are resampled, silence-trimmed and loudness-normalized together
+(postprocess.py) before they are encoded and cached. Identical items, within a
+request or across concurrent requests, share one computation (single_flight.py).
+A request whose client disconnects or that is cancelled by id stops its
+queued and, where the engine allows, running model work (cancellation.py).
+
+``serve()`` binds the port first and loads the model on a background thread
+(startup.py); model endpoints answer 503 until it is ready.
+"""
+
+import base64
+import json
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+
+from flask import Blueprint, Flask, Response, g, jsonify, request
+from flask_cors import CORS
+
+import audio_io
+from adaptive_batch import AdaptiveBatchExecutor
+from admission import AdmissionController, Overloaded, overloaded_response
+from batch_planner import BatchPlanner, estimate_cost
+from batch_scheduler import MicroBatcher
+from cancellation import ABANDONED, CancelRegistry, CancelToken, Cancelled, cancelled_response
+from job_queue import JobRunner, JobStore, create_jobs_blueprint
+from long_text import chunk_text, stitch
+from metrics import (Metrics, SampledLog, RATIO_BUCKETS, SIZE_BUCKETS,
+                     create_metrics_blueprint, instrument_requests)
+from postprocess import PostProcessor
+from result_cache import ResultCache, hash_key
+from single_flight import SingleFlight
+from startup import LOADING, WARMING, NotReady, Startup, not_ready_response
+from voice_registry import UnknownVoice
+
+SAMPLE_RATE = 24000  # every engine's output is served at 24 kHz
+CANCEL_POLL_SECONDS = 0.25  # how often a waiting request checks its client connection
+
+
+class TTSService:
+    """One engine plus the cache, planner, inference worker, admission and jobs around it."""
+
+    def __init__(self, engine, args):
+        self.engine = engine
+        self.voices = engine.voices
+        self.startup = Startup()
+        self.log = SampledLog(args.log_every)
+        self.chunk_chars = args.chunk_chars
+        self.stitch_options = {
+            "pause_ms": args.chunk_pause_ms,
+            "paragraph_pause_ms": args.paragraph_pause_ms,
+            "crossfade_ms": args.crossfade_ms,
+        }
+        self._init_metrics()
+
+        self.postprocess = PostProcessor(
+            SAMPLE_RATE,
+            trim_db=None if args.no_trim else args.trim_db,
+            pad_ms=args.trim_pad_ms,
+            target_dbfs=None if args.no_normalize else args.loudness_dbfs,
+        )
+        self.planner = BatchPlanner(max_batch_size=args.max_sub_batch, bucket_ratio=args.bucket_ratio,
+                                    min_gap_chars=args.bucket_min_chars, log=self.log)
+        self.executor = AdaptiveBatchExecutor(engine.release_memory, engine.memory_pressure,
+                                              pressure_threshold=args.memory_pressure)
+        self.admission = AdmissionController(max_requests=args.max_queue_requests,
+                                             max_cost=args.max_queue_chars, cost_unit="chars")
+        # libsndfile releases the GIL, so Opus/FLAC encoding runs in parallel off the request threads
+        self.encoder = ThreadPoolExecutor(max_workers=max(1, args.encode_workers), thread_name_prefix="encode")
+        self.flights = SingleFlight()
+        self.requests = CancelRegistry()
+        self.scheduler = MicroBatcher(self.run_model_batch, max_wait_ms=args.batch_window_ms,
+                                      max_batch_size=args.max_batch_size, on_batch=self._observe_batch)
+
+        self.cache = None
+        if not args.no_cache:
+            self.cache = ResultCache(
+                args.cache_dir,
+                memory_items=args.cache_memory_items,
+                max_disk_bytes=int(args.cache_max_gb * 1024 ** 3),
+                suffix=".wav",
+            )
+            print(f"Synthesis cache: {args.cache_dir} ({self.cache.stats()['disk_items']} entries on disk)")
+
+        self.job_runner = JobRunner(JobStore(args.jobs_db), self.synthesize_job_chunk,
+                                    chunk_size=args.job_chunk_size, wait_ready=self.startup.wait,
+                                    encode=self.transcode)
+
+    # ── Metrics ─────────────────────────────────────────────────────
+
+    def _init_metrics(self):
+        m = self.metrics = Metrics("tts")
+        self.stage_seconds = m.histogram(
+            "stage_seconds",
+            "Time per pipeline stage (preprocess, model, postprocess, wav_encode, stitch, transcode, base64)",
+            ("stage",))
+        self.batch_size = m.histogram("batch_size", "Items per merged inference-worker batch", buckets=SIZE_BUCKETS)
+        self.queue_wait = m.histogram("queue_wait_seconds", "Time a request waited for the inference worker")
+        self.audio_seconds = m.counter("audio_seconds_total", "Seconds of audio generated by the model, after trimming")
+        self.trimmed_seconds = m.counter("trimmed_silence_seconds_total",
+                                         "Seconds of leading/trailing silence trimmed from model output")
+        self.real_time_factor = m.histogram(
+            "real_time_factor", "Audio seconds produced per wall second of model time, per model call",
+            buckets=RATIO_BUCKETS)
+        self.cache_lookups = m.counter("cache_lookups_total", "Synthesis cache lookups by result", ("result",))
+        self.coalesced = m.counter(
+            "coalesced_items_total",
+            "Items that shared another item's synthesis instead of running the model, by scope (batch, concurrent)",
+            ("scope",))
+        self.response_bytes = m.counter("response_audio_bytes_total", "Audio bytes sent, by format", ("format",))
+        self.cancelled_compute = m.counter(
+            "cancelled_compute_seconds_total",
+            "Model seconds spent on sub-batches whose requests were all cancelled (stopped early or discarded)")
+        self.chunks_per_text = m.histogram("chunks_per_text", "Sentence chunks per long /generate text",
+                                           buckets=SIZE_BUCKETS)
+        m.gauge("queue_depth", "Jobs waiting for the inference worker", lambda: self.scheduler.queue_depth())
+        m.gauge("inflight_requests", "Admitted requests in flight", lambda: self.admission.in_flight)
+        m.gauge("inflight_chars", "Text characters of admitted requests in flight",
+                lambda: self.admission.in_flight_cost)
+        m.gauge("time_to_ready_seconds", "Seconds from process start to ready (model loaded and warmed up)",
+                lambda: self.startup.ready_seconds)
+        m.counter_from("cancelled_items_total", "Queued items dropped because their requests were cancelled",
+                       lambda: self.scheduler.items_cancelled)
+        m.counter_from("out_of_memory_errors_total", "Sub-batches that ran out of memory and were split",
+                       lambda: self.executor.ooms)
+
+    def _observe_batch(self, size: int, queue_waits: list[float], seconds: float):
+        self.batch_size.observe(size)
+        for queue_wait in queue_waits:
+            self.queue_wait.observe(queue_wait)
+
+    def b64(self, wav: bytes) -> str:
+        with self.stage_seconds.time(stage="base64"):
+            return base64.b64encode(wav).decode("utf-8")
+
+    # ── Output formats ──────────────────────────────────────────────
+
+    def _transcode(self, wav: bytes, fmt: audio_io.AudioFormat) -> bytes:
+        with self.stage_seconds.time(stage="transcode"):
+            data = audio_io.transcode_wav(wav, fmt)
+        self.response_bytes.inc(len(data), format=fmt.name)
+        return data
+
+    def transcode(self, wav: bytes, fmt: audio_io.AudioFormat) -> bytes:
+        """One WAV in fmt, encoded on the encoder pool."""
+        if fmt.name == "wav":
+            return self._transcode(wav, fmt)
+        return self.encoder.submit(self._transcode, wav, fmt).result()
+
+    def transcode_all(self, wavs: list[bytes], fmt: audio_io.AudioFormat) -> list[bytes]:
+        """Every WAV in fmt, encoded in parallel on the encoder pool."""
+        if fmt.name == "wav":
+            return [self._transcode(wav, fmt) for wav in wavs]
+        return list(self.encoder.map(lambda wav: self._transcode(wav, fmt), wavs))
+
+    def iter_encoded(self, texts, voice_ids, instructs, use_batch: bool, fmt: audio_io.AudioFormat,
+                     token: CancelToken | None = None):
+        """
+        iter_cached as (index, audio, cached, duration) with each result in fmt,
+        encoded on the pool while later items generate.
+        """
+        if fmt.name == "wav":
+            for idx, wav, cached in self.iter_cached(texts, voice_ids, instructs, use_batch, token):
+                yield idx, self._transcode(wav, fmt), cached, audio_io.wav_duration(wav)
+            return
+        pending = {}
+        for idx, wav, cached in self.iter_cached(texts, voice_ids, instructs, use_batch, token):
+            pending[self.encoder.submit(self._transcode, wav, fmt)] = (idx, cached, audio_io.wav_duration(wav))
+            for future in [f for f in pending if f.done()]:
+                idx, cached, duration = pending.pop(future)
+                yield idx, future.result(), cached, duration
+        for future in as_completed(pending):
+            idx, cached, duration = pending[future]
+            yield idx, future.result(), cached, duration
+
+    # ── Request parsing ─────────────────────────────────────────────
+
+    @staticmethod
+    def parse_format(data: dict) -> audio_io.AudioFormat:
+        """The request's output format. Raises audio_io.UnsupportedFormat."""
+        return audio_io.parse_format(data.get("format"), data.get("bitrate"))
+
+    def parse_items(self, data: dict, texts: list[str]):
+        """
+        Prepared texts, voice ids and instructs for a request's items.
+        Per-item "voices"/"instructs" take priority over "voice"/"instruct".
+        Raises UnknownVoice for an unregistered voice.
+        """
+        count = len(texts)
+        speaker = data.get("speaker")
+        with self.stage_seconds.time(stage="preprocess"):
+            prepared = [self.engine.prepare_text(t, speaker) for t in texts]
+
+        item_voices = data.get("voices")
+        if item_voices and len(item_voices) == count:
+            voice_ids = [self.voices.resolve(v) for v in item_voices]
+        else:
+            voice_ids = [self.voices.resolve(data.get("voice"))] * count
+
+        instruct = data.get("instruct") or None
+        instructs = data.get("instructs") or None
+        if not self.engine.supports_instruct:
+            item_instructs = [None] * count
+        elif instructs and len(instructs) == count:
+            item_instructs = [inst or None for inst in instructs]
+        else:
+            item_instructs = [instruct] * count
+
+        return prepared, voice_ids, item_instructs
+
+    # ── Model calls (inference worker thread) ───────────────────────
+
+    def run_sub_batch(self, items: list[tuple[str, str, str | None]]) -> list[bytes]:
+        """Run one planned sub-batch of (text, voice_id, instruct) items sharing a voice and instruct."""
+        texts = [text for text, _, _ in items]
+        voice_ids = [voice_id for _, voice_id, _ in items]
+        if self.scheduler.batch_cancelled():
+            raise Cancelled("Batch cancelled before its model call")
+        # Engines with a per-step hook poll should_stop and raise Cancelled once every request has gone
+        options = {"instruct": items[0][2], "should_stop": self.scheduler.batch_cancelled}
+        try:
+            with self.stage_seconds.time(stage="model") as model_call:
+                audios, sample_rate = self.engine.generate(texts, voice_ids, options)
+        except Cancelled:
+            self.cancelled_compute.inc(model_call.elapsed)
+            self.log.event("model_call_cancelled", size=len(items), seconds=round(model_call.elapsed, 3))
+            raise
+        if self.scheduler.batch_cancelled():
+            self.cancelled_compute.inc(model_call.elapsed)  # finished, but nobody is waiting for it
+        audios = [audio_io.to_float32(audio) for audio in audios]
+        with self.stage_seconds.time(stage="postprocess"):
+            clips, durations = self.postprocess.process(audios, sample_rate)
+        with self.stage_seconds.time(stage="wav_encode"):
+            wavs = [audio_io.encode_wav(clip, SAMPLE_RATE) for clip in clips]
+
+        audio_seconds = sum(durations)
+        self.audio_seconds.inc(audio_seconds)
+        self.trimmed_seconds.inc(max(0.0, sum(len(a) for a in audios) / sample_rate - audio_seconds))
+        rtf = audio_seconds / model_call.elapsed if model_call.elapsed > 0 else 0.0
+        self.real_time_factor.observe(rtf)
+        self.log.event("model_call", size=len(items), seconds=round(model_call.elapsed, 3),
+                       audio_seconds=round(audio_seconds, 2), rtf=round(rtf, 2))
+        return wavs
+
+    def run_planned_batch(self, items: list[tuple[str, str, str | None]]) -> list[bytes]:
+        """Run one planned sub-batch, split to the learned safe size and halved on OOM."""
+        costs = [estimate_cost(text) for text, _, _ in items]
+        return self.executor.run(items, costs, self.run_sub_batch)
+
+    def run_model_batch(self, items: list[tuple[str, str, str | None]]) -> list[bytes]:
+        """Inference worker entry point: plan merged items by (voice, instruct) and length."""
+        costs = [estimate_cost(text) for text, _, _ in items]
+        groups = [(voice_id, instruct) for _, voice_id, instruct in items]
+        return self.planner.run(items, self.run_planned_batch, costs, groups)
+
+    # ── Cached generation ───────────────────────────────────────────
+
+    def cache_key(self, text: str, voice_id: str, instruct: str | None) -> str:
+        """The engine's key for one synthesis, plus the post-processing settings applied to it."""
+        return hash_key(self.engine.cache_key(text, voice_id, instruct), *self.postprocess.settings())
+
+    def iter_cached(self, texts: list[str], voice_ids: list[str], instructs: list[str | None],
+                    use_batch: bool = True, token: CancelToken | None = None):
+        """
+        Yield (index, wav_bytes, cached) for each prepared text as soon as it is available.
+        Cache hits come first. Duplicate misses are collapsed to one item, and items
+        another request is already generating are awaited rather than generated
+        again. The rest are planned into per-(voice, instruct) sub-batches (or
+        queued one by one when use_batch is false), queued on the inference
+        worker, and yielded as each one finishes.
+
+        Raises Cancelled once token is cancelled (or its client disconnects);
+        the request's queued sub-batches are then dropped unless another
+        request waits on them. Closing the generator early cancels it too.
+        """
+        token = token or CancelToken()
+        keys = [self.cache_key(t, v, inst) for t, v, inst in zip(texts, voice_ids, instructs)]
+        missing = []
+        for idx, key in enumerate(keys):
+            wav = self.cache.get(key) if self.cache is not None else None
+            if wav is None:
+                missing.append(idx)
+            else:
+                yield idx, wav, True
+        self.cache_lookups.inc(len(texts) - len(missing), result="hit")
+        self.cache_lookups.inc(len(missing), result="miss")
+
+        if len(missing) < len(texts):
+            self.log.event("cache", hits=len(texts) - len(missing), misses=len(missing))
+        if not missing:
+            return
+
+        # Duplicates within the request share one item
+        copies: dict[str, list[int]] = {}
+        for idx in missing:
+            copies.setdefault(keys[idx], []).append(idx)
+        if len(copies) < len(missing):
+            self.coalesced.inc(len(missing) - len(copies), scope="batch")
+
+        # Keys already in flight for another request are awaited; this request leads the rest
+        lead, waiting, flights = [], {}, {}
+        for key, indices in copies.items():
+            future, leader = self.flights.join(key)
+            if leader:
+                lead.append(indices[0])
+                flights[indices[0]] = future
+            else:
+                waiting[future] = indices[0]
+        if waiting:
+            self.coalesced.inc(len(waiting), scope="concurrent")
+            self.log.event("coalesced", waiting=len(waiting), leading=len(lead))
+
+        if use_batch:
+            costs = [estimate_cost(texts[idx]) for idx in lead]
+            groups = [(voice_ids[idx], instructs[idx]) for idx in lead]
+            sub_batches = [[lead[j] for j in sub] for sub in self.planner.plan(costs, groups)] if lead else []
+        else:
+            sub_batches = [[idx] for idx in lead]
+
+        futures = {}
+        for indices in sub_batches:
+            items = [(texts[idx], voice_ids[idx], instructs[idx]) for idx in indices]
+            batch_flights = [(keys[idx], flights[idx]) for idx in indices]
+            # Once this request is cancelled the job is dropped, unless another request waits on its items
+            future = self.scheduler.submit_async(
+                items, merge=use_batch,
+                cancelled=lambda batch_flights=batch_flights: token.cancelled and self.flights.abandon(batch_flights))
+            # Resolved on the worker, so waiters get the result even if this request goes away
+            future.add_done_callback(lambda f, batch_flights=batch_flights: self._resolve_flights(batch_flights, f))
+            futures[future] = indices
+
+        pending = {*futures, *waiting}
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                token.check()
+                for future in done:
+                    if future in waiting:
+                        finished = [(waiting.pop(future), future.result())]  # another request's result
+                    else:
+                        finished = list(zip(futures.pop(future), future.result()))
+                        if self.cache is not None:
+                            for idx, wav in finished:
+                                self.cache.put(keys[idx], wav)
+                    for idx, wav in finished:
+                        for copy in copies[keys[idx]]:
+                            yield copy, wav, False
+        finally:
+            if pending:
+                token.cancel(ABANDONED)  # no-op if already cancelled
+                for future in pending & waiting.keys():
+                    self.flights.leave(keys[waiting[future]], future)
+
+    def _resolve_flights(self, flights: list[tuple[str, Future]], future):
+        """Hand a finished sub-batch's results (or error) to requests waiting on its keys."""
+        error = future.exception()
+        for i, (key, flight) in enumerate(flights):
+            self.flights.resolve(key, flight, None if error else future.result()[i], error)
+
+    def generate_cached(self, texts, voice_ids, instructs, use_batch: bool = True,
+                        token: CancelToken | None = None) -> tuple[list[bytes], int]:
+        """
+        Return WAV bytes for each prepared text, serving repeats from the synthesis cache.
+        Only the cache misses reach the model. Returns (wavs, generated_count).
+        """
+        results: list[bytes | None] = [None] * len(texts)
+        generated_count = 0
+        for idx, wav, cached in self.iter_cached(texts, voice_ids, instructs, use_batch, token):
+            results[idx] = wav
+            generated_count += not cached
+        return results, generated_count
+
+    # ── Long texts ──────────────────────────────────────────────────
+
+    def chunk_request(self, data: dict, text: str):
+        """The request's text split into sentence chunks, or None to synthesize it in one piece."""
+        max_chars = int(data.get("max_chunk_chars") or self.chunk_chars)
+        if not data.get("chunk", True) or max_chars <= 0 or len(text) <= max_chars:
+            return None
+        chunks = chunk_text(text, max_chars)
+        return chunks if len(chunks) > 1 else None
+
+    def generate_chunked(self, data: dict, chunks, texts, voice_ids, instructs, token: CancelToken | None = None):
+        """
+        Synthesize prepared chunk texts as one planned batch and stitch them into
+        one WAV. Returns (wav, [(start, end), ...] per chunk, generated_count).
+        """
+        self.chunks_per_text.observe(len(chunks))
+        wavs, generated_count = self.generate_cached(texts, voice_ids, instructs, token=token)
+        options = {name: float(data.get(name, default)) for name, default in self.stitch_options.items()}
+        with self.stage_seconds.time(stage="stitch"):
+            clip, bounds = stitch([audio_io.decode_wav(wav) for wav in wavs], SAMPLE_RATE, chunks, **options)
+        with self.stage_seconds.time(stage="wav_encode"):
+            wav = audio_io.encode_wav(clip, SAMPLE_RATE)
+        return wav, bounds, generated_count
+
+    def synthesize_job_chunk(self, texts: list[str], instructs: list[str | None], voices: list[str | None],
+                             cancelled=None):
+        """Job runner entry point; cancelled() polls the job's status."""
+        prepared = [self.engine.prepare_text(t) for t in texts]
+        voice_ids = [self.voices.resolve(v) for v in voices]
+        if not self.engine.supports_instruct:
+            instructs = [None] * len(texts)
+        for idx, wav, _ in self.iter_cached(prepared, voice_ids, instructs, token=CancelToken(probe=cancelled)):
+            yield idx, wav
+
+    # ── Streaming bodies ────────────────────────────────────────────
+
+    def stream_frames(self, texts, voice_ids, instructs, use_batch: bool, fmt: audio_io.AudioFormat,
+                      token: CancelToken | None = None):
+        """Binary body for /generate_batch: length-prefixed audio frames in completion order."""
+        count = 0
+        try:
+            for idx, wav, _, _ in self.iter_encoded(texts, voice_ids, instructs, use_batch, fmt, token):
+                count += 1
+                self.log.event("stream_item", index=idx, count=count, total=len(texts), bytes=len(wav))
+                yield audio_io.frame_header(idx, len(wav))
+                yield wav
+            self.log.event("stream_done", count=count)
+        except Exception as e:
+            print(f"Error: {e}")
+            yield audio_io.error_frame(str(e))
+
+    def stream_batch(self, texts, voice_ids, instructs, use_batch: bool, fmt: audio_io.AudioFormat,
+                     token: CancelToken | None = None):
+        """NDJSON body for a streamed /generate_batch: one record per item, then a summary."""
+        count = 0
+        try:
+            for idx, wav, cached, duration in self.iter_encoded(texts, voice_ids, instructs, use_batch, fmt, token):
+                count += 1
+                self.log.event("stream_item", index=idx, count=count, total=len(texts), bytes=len(wav))
+                yield json.dumps({
+                    "index": idx,
+                    "audio": self.b64(wav),
+                    "sample_rate": SAMPLE_RATE,
+                    "format": fmt.name,
+                    "duration": duration,
+                    "cached": cached,
+                }) + "\n"
+            self.log.event("stream_done", count=count)
+            yield json.dumps({"done": True, "count": count, "success": True}) + "\n"
+        except Exception as e:
+            print(f"Error: {e}")
+            yield json.dumps({"error": str(e), "count": count, "success": False}) + "\n"
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "state": self.startup.state,
+            "startup": self.startup.stats(),
+            "model_loaded": self.engine.is_loaded(),
+            "engine": self.engine.name,
+            **self.engine.health(),
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "scheduler": self.scheduler.stats(),
+            "coalescing": self.flights.stats(),
+            "cancellation": self.requests.stats(),
+            "memory": self.executor.stats(),
+            "jobs_enabled": True,
+            "admission": self.admission.stats(),
+            "voices": self.voices.stats(),
+        }
+
+
+def create_tts_blueprint(service: TTSService) -> Blueprint:
+    """Flask routes shared by every TTS engine, bound to one service."""
+    tts = Blueprint("tts", __name__)
+
+    def open_token():
+        g.cancel_token = service.requests.open(request)
+        return g.cancel_token
+
+    @tts.after_request
+    def add_request_id(response):
+        token = g.get("cancel_token")
+        if token is not None:
+            response.headers["X-Request-Id"] = token.request_id
+        return response
+
+    @tts.route("/health", methods=["GET"])
+    def health():
+        """Health check endpoint."""
+        return jsonify(service.health())
+
+    @tts.route("/voices", methods=["GET"])
+    def list_voices():
+        """Registered voice ids, the default, and which voices are currently prepared."""
+        stats = service.voices.stats()
+        return jsonify({
+            "voices": service.voices.ids(),
+            "default": stats["default"],
+            "loaded": stats["loaded"],
+            "success": True,
+        })
+
+    @tts.route("/generate", methods=["POST"])
+    def generate_audio():
+        """
+        Generate audio from text.
+        Expects JSON: {"text": "Hello!"}, optionally with "speaker" (VibeVoice prefix,
+        default "Speaker 0"), "voice" (registered voice id) and "instruct" (Qwen3-TTS).
+        Returns JSON: {"audio": base64_wav, "sample_rate": 24000, "duration": seconds, "success": true}
+        With Accept: audio/wav (or the format's own type), returns the raw audio body instead
+        (duration in X-Duration).
+        "format": "flac" or "opus" (with "bitrate" in kbps, default 32) returns compressed
+        audio instead of WAV.
+
+        Texts longer than --chunk-chars are split at sentence boundaries, synthesized
+        as one batch and stitched into one clip ("chunk": false turns this off;
+        "max_chunk_chars", "pause_ms", "paragraph_pause_ms" and "crossfade_ms"
+        override the server defaults). The JSON response then also has
+        "chunks": [{"text": ..., "line": i, "start": s, "end": s}, ...]; the WAV
+        response has the start/end seconds in an X-Chunk-Boundaries header.
+
+        The request is cancelled (499) if the client disconnects or
+        DELETE /requests/<X-Request-Id> is called before it finishes.
+        """
+        token = open_token()
+        try:
+            data = request.get_json()
+            text = data.get("text", "")
+
+            if not text:
+                return jsonify({"error": "No text provided"}), 400
+            fmt = service.parse_format(data)
+            service.startup.check()
+
+            chunks = service.chunk_request(data, text)
+            texts, voice_ids, instructs = service.parse_items(data, [c.text for c in chunks] if chunks else [text])
+
+            service.log.event("generate", text=texts[0][:80], voice=voice_ids[0], instruct=instructs[0],
+                              chunks=len(texts))
+            with service.admission.admit(sum(len(t) for t in texts)):
+                if chunks:
+                    wav, bounds, generated_count = service.generate_chunked(data, chunks, texts, voice_ids, instructs,
+                                                                            token)
+                else:
+                    wavs, generated_count = service.generate_cached(texts, voice_ids, instructs, token=token)
+                    wav, bounds = wavs[0], None
+            audio = service.transcode(wav, fmt)
+            duration = audio_io.wav_duration(wav)
+
+            if audio_io.wants(request, audio_io.WAV_MIMETYPE, fmt.mimetype):
+                headers = {
+                    "X-Sample-Rate": str(SAMPLE_RATE),
+                    "X-Duration": f"{duration:.3f}",
+                    "X-Cache": "miss" if generated_count else "hit",
+                }
+                if bounds:
+                    headers["X-Chunk-Boundaries"] = ";".join(f"{start:.3f}-{end:.3f}" for start, end in bounds)
+                return Response(audio, mimetype=fmt.mimetype, headers=headers)
+
+            result = {
+                "audio": service.b64(audio),
+                "sample_rate": SAMPLE_RATE,
+                "format": fmt.name,
+                "duration": duration,
+                "success": True,
+            }
+            if bounds:
+                result["chunks"] = [
+                    {"text": chunk.text, "line": chunk.line, "start": start, "end": end}
+                    for chunk, (start, end) in zip(chunks, bounds)
+                ]
+            return jsonify(result)
+
+        except (UnknownVoice, audio_io.UnsupportedFormat) as e:
+            return jsonify({"error": str(e)}), 400
+        except Overloaded as e:
+            return overloaded_response(e)
+        except NotReady as e:
+            return not_ready_response(e)
+        except Cancelled as e:
+            return cancelled_response(e)
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({"error": str(e)}), 500
+        finally:
+            service.requests.close(token)
+
+    @tts.route("/generate_batch", methods=["POST"])
+    def generate_audio_batch():
+        """
+        Generate audio for multiple texts.
+        Expects JSON: {"texts": ["Speaker 0: Hello!", "Speaker 0: Hi!"]}, optionally with
+        "voice"/"voices" and "instruct"/"instructs" (one value for all items, or one per item).
+        Mixed batches are split into one model batch per (voice, instruct).
+        "batch": false queues items one by one instead of as native batches.
+        Returns JSON: {"audios": [b64_1, b64_2, ...], "sample_rate": 24000, "durations": [...],
+                       "count": N, "success": true}
+        With "stream": true (or Accept: application/x-ndjson), returns NDJSON instead:
+        one {"index": i, "audio": b64, "sample_rate": 24000, "duration": s, "cached": bool} line per item
+        as soon as it is ready (in completion order), then {"done": true, "count": N}.
+        With Accept: application/x-wav-frames, returns length-prefixed binary audio frames
+        (see audio_io.py) in completion order instead of base64.
+        "format"/"bitrate" select compressed audio as for /generate.
+        Cancellation (client disconnect, DELETE /requests/<id>) works as for /generate;
+        a streamed response is cancelled when the client stops reading it.
+        """
+        token = open_token()
+        streaming = False
+        try:
+            data = request.get_json()
+            texts = data.get("texts", [])
+            use_batch = data.get("batch", len(texts) > 1)
+            stream = data.get("stream", False) or "application/x-ndjson" in request.headers.get("Accept", "")
+
+            if not texts:
+                return jsonify({"error": "No texts provided"}), 400
+            fmt = service.parse_format(data)
+            service.startup.check()
+
+            texts, voice_ids, instructs = service.parse_items(data, texts)
+
+            ticket = service.admission.acquire(sum(len(t) for t in texts))
+            service.log.event("generate_batch", count=len(texts), batch=use_batch,
+                              voices=len(set(voice_ids)), instructs=len(set(instructs)))
+
+            # Streaming bodies release their admission ticket and cancel token when the stream ends
+            if audio_io.wants(request, audio_io.FRAMES_MIMETYPE):
+                body = service.stream_frames(texts, voice_ids, instructs, use_batch, fmt, token)
+                streaming = True
+                return Response(service.requests.hold(token, service.admission.hold(ticket, body)),
+                                mimetype=audio_io.FRAMES_MIMETYPE, headers={
+                    "X-Sample-Rate": str(SAMPLE_RATE),
+                    "X-Format": fmt.name,
+                    "X-Count": str(len(texts)),
+                })
+            if stream:
+                body = service.stream_batch(texts, voice_ids, instructs, use_batch, fmt, token)
+                streaming = True
+                return Response(service.requests.hold(token, service.admission.hold(ticket, body)),
+                                mimetype="application/x-ndjson")
+
+            try:
+                wavs, _ = service.generate_cached(texts, voice_ids, instructs, use_batch, token)
+                audios = service.transcode_all(wavs, fmt)
+            finally:
+                service.admission.release(ticket)
+            audios_b64 = [service.b64(audio) for audio in audios]
+
+            return jsonify({
+                "audios": audios_b64,
+                "sample_rate": SAMPLE_RATE,
+                "format": fmt.name,
+                "durations": [audio_io.wav_duration(wav) for wav in wavs],
+                "count": len(audios_b64),
+                "success": True,
+            })
+
+        except (UnknownVoice, audio_io.UnsupportedFormat) as e:
+            return jsonify({"error": str(e)}), 400
+        except Overloaded as e:
+            return overloaded_response(e)
+        except NotReady as e:
+            return not_ready_response(e)
+        except Cancelled as e:
+            return cancelled_response(e)
+        except Exception as e:
+            print(f"Error: {e}")
+            return jsonify({"error": str(e)}), 500
+        finally:
+            if not streaming:
+                service.requests.close(token)
+
+    @tts.route("/requests/<request_id>", methods=["DELETE"])
+    def cancel_request(request_id):
+        """
+        Cancel an in-flight /generate or /generate_batch request by its X-Request-Id.
+        Its queued work is dropped and running work stops at the next safe point.
+        """
+        found = service.requests.cancel(request_id)
+        if not found:
+            return jsonify({"error": f"No request {request_id} in flight", "success": False}), 404
+        return jsonify({"request_id": request_id, "status": "cancelled", "success": True})
+
+    @tts.route("/estimate", methods=["POST"])
+    def estimate():
+        """
+        Plan a batch without running it.
+        Expects the same JSON as /generate_batch.
+        Returns JSON: {"sub_batches": [{"size": N, "max_chars": M}, ...], "padding_waste": 0.05,
+                       "unplanned_padding_waste": 0.4, "eta_seconds": 120.0, ...}
+        """
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        texts = data.get("texts", [])
+
+        if not texts:
+            return jsonify({"error": "No texts provided"}), 400
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return jsonify({"error": "texts must be a list of strings"}), 400
+
+        try:
+            texts, voice_ids, instructs = service.parse_items(data, texts)
+        except UnknownVoice as e:
+            return jsonify({"error": str(e)}), 400
+
+        result = service.planner.estimate([estimate_cost(t) for t in texts], list(zip(voice_ids, instructs)))
+        result["success"] = True
+        return jsonify(result)
+
+    return tts
+
+
+def create_app(service: TTSService) -> Flask:
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {"origins": "*"}})
+    app.register_blueprint(create_tts_blueprint(service))
+    app.register_blueprint(create_metrics_blueprint(service.metrics))
+    instrument_requests(app, service.metrics)
+    app.register_blueprint(create_jobs_blueprint(service.job_runner, service.voices.resolve))
+    return app
+
+
+# ── Command line ────────────────────────────────────────────────────
+
+def add_server_arguments(parser, cache_name: str):
+    """Options shared by every TTS server (host/port, cache, batching, admission, jobs)."""
+    parser.add_argument("--host", type=str, default="0.0.0.0",
+                        help="Host to bind to (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=5000,
+                        help="Port to bind to (default: 5000)")
+    parser.add_argument("--cache-dir", type=str, default=f"cache/{cache_name}",
+                        help=f"Directory for the on-disk synthesis cache (default: cache/{cache_name})")
+    parser.add_argument("--cache-max-gb", type=float, default=2.0,
+                        help="Disk cap for the synthesis cache in GB, LRU-evicted (default: 2.0)")
+    parser.add_argument("--cache-memory-items", type=int, default=256,
+                        help="Number of recent results kept in memory (default: 256)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Disable the synthesis cache (always run the model)")
+    parser.add_argument("--max-sub-batch", type=int, default=16,
+                        help="Largest sub-batch the planner sends to the model in one call (default: 16)")
+    parser.add_argument("--bucket-ratio", type=float, default=1.5,
+                        help="Max ratio between longest and shortest text in a sub-batch (default: 1.5)")
+    parser.add_argument("--bucket-min-chars", type=int, default=40,
+                        help="Texts at most this many characters apart always share a sub-batch (default: 40)")
+    parser.add_argument("--jobs-db", type=str, default=f"cache/jobs-{cache_name}.sqlite3",
+                        help=f"SQLite file backing the /jobs API (default: cache/jobs-{cache_name}.sqlite3)")
+    parser.add_argument("--job-chunk-size", type=int, default=16,
+                        help="Items per job chunk, planned and queued together (default: 16)")
+    parser.add_argument("--max-queue-requests", type=int, default=64,
+                        help="Max in-flight generate requests before answering 429 (default: 64)")
+    parser.add_argument("--max-queue-chars", type=int, default=200000,
+                        help="Max summed text characters in flight before answering 429 (default: 200000)")
+    parser.add_argument("--batch-window-ms", type=float, default=25,
+                        help="How long the inference worker waits to merge concurrent requests (default: 25)")
+    parser.add_argument("--max-batch-size", type=int, default=8,
+                        help="Largest merged batch of concurrent /generate requests (default: 8)")
+    parser.add_argument("--chunk-chars", type=int, default=400,
+                        help="Split /generate texts longer than this at sentence boundaries, synthesize the "
+                             "chunks as one batch and stitch them (0 = never split, default: 400)")
+    parser.add_argument("--chunk-pause-ms", type=float, default=150,
+                        help="Silence between stitched chunks of the same line (default: 150)")
+    parser.add_argument("--paragraph-pause-ms", type=float, default=400,
+                        help="Silence between stitched chunks of different lines (default: 400)")
+    parser.add_argument("--crossfade-ms", type=float, default=20,
+                        help="Fade length at each stitched chunk boundary (default: 20)")
+    parser.add_argument("--trim-db", type=float, default=40,
+                        help="Trim leading/trailing audio this many dB below the clip's loudest frame (default: 40)")
+    parser.add_argument("--trim-pad-ms", type=float, default=40,
+                        help="Audio kept before the first and after the last non-silent frame (default: 40)")
+    parser.add_argument("--no-trim", action="store_true",
+                        help="Keep the model's leading/trailing silence")
+    parser.add_argument("--loudness-dbfs", type=float, default=-20,
+                        help="Normalize each clip's speech loudness (RMS) to this level (default: -20)")
+    parser.add_argument("--no-normalize", action="store_true",
+                        help="Keep the model's output level")
+    parser.add_argument("--encode-workers", type=int, default=4,
+                        help="Threads encoding FLAC/Opus responses (default: 4)")
+    parser.add_argument("--memory-pressure", type=float, default=0.9,
+                        help="Release cached GPU memory after a batch only above this reserved fraction (default: 0.9)")
+    parser.add_argument("--snapshot-dir", type=str, default=None,
+                        help="Write the model here as safetensors in its serving dtype on first start "
+                             "and load it memory-mapped from there on later starts")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="Skip the warm-up synthesis after loading (ready sooner, slower first request)")
+    parser.add_argument("--log-every", type=int, default=50,
+                        help="Log one in every N per-item/per-request events, as JSON lines (default: 50)")
+
+
+def load_engine(engine, args, startup: Startup):
+    """Loader thread: load the model, prepare voices and run one warm-up synthesis."""
+    engine.startup = startup
+    engine.snapshot_dir = args.snapshot_dir
+    startup.begin(LOADING, 0.0, 0.7, f"Loading {engine.name} model")
+    engine.load()
+
+    startup.begin(WARMING, 0.7, 0.9, "Preparing voices")
+    engine.voices.preload()
+    print(f"Voices: {', '.join(engine.voices.ids())} (default: {engine.voices.default})")
+
+    if not args.no_warmup:
+        startup.begin(WARMING, 0.9, 1.0, "Warm-up synthesis")
+        try:
+            engine.warm_up()
+        except Exception as e:
+            print(f"Warm-up failed (continuing): {e}")
+    print("Server ready!")
+
+
+def serve(engine, args):
+    """Start the HTTP server at once and load the engine in the background until ready."""
+    engine.voices.resolve(None)  # fail fast on a bad default voice
+
+    service = TTSService(engine, args)
+    app = create_app(service)
+    service.startup.run(lambda startup: load_engine(engine, args, startup))
+
+    print(f"\nStarting server on {args.host}:{args.port}")
+    print(f"Health check: http://{args.host}:{args.port}/health")
+    print(f"Generate endpoint: http://{args.host}:{args.port}/generate")
+    print(f"Jobs endpoint: http://{args.host}:{args.port}/jobs")
+
+    app.run(host=args.host, port=args.port, threaded=True)
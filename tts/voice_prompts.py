@@ -0,0 +1,147 @@
+"""
+Voice-prompt conditioning cache for VibeVoice.
+
+Every VibeVoice request is conditioned on the reference voice clip. Left alone,
+the processor re-normalizes and re-tokenizes that clip for every batch item,
+and the model re-runs the acoustic tokenizer encoder + connector over
+``[[voice_sample]] * N`` on every prefill, although the result never changes
+while the voice stays the same.
+
+``VoicePromptCache`` computes both once per voice, when the voice is
+registered, and keeps them on the model's device:
+
+* the processor's voice prompt (tokens, normalized speech input and masks);
+* the speech tensor and its acoustic encoding (latent features and the
+  connector's embeddings that replace the voice placeholder tokens).
+
+Entries are keyed by the voice-sample hash. Several voice ids can point at
+the same clip, so entries are reference-counted: each ``register`` takes a
+reference, each ``forget`` drops one, and the entry is freed at zero. Inside
+``use(voice_hash)`` the processor and model read the cached entry instead of
+recomputing it. Outside that block, or if the shapes don't match, they run
+their original code.
+"""
+
+import threading
+
+import torch
+
+
+class _VoicePrompt:
+    __slots__ = ("prompt", "speech_tensor", "speech_masks", "features", "embeds")
+
+    def __init__(self, prompt, speech_tensor, speech_masks, features, embeds):
+        self.prompt = prompt                # (tokens, speech_inputs, speech_masks) from the processor
+        self.speech_tensor = speech_tensor  # [1, samples] on device, model dtype
+        self.speech_masks = speech_masks    # [1, frames] bool, on device
+        self.features = features            # [1, frames, latent_dim]
+        self.embeds = embeds                # [frames, hidden] (already masked)
+
+
+class VoicePromptCache:
+    """Per-voice processor outputs and acoustic encodings, reused across requests."""
+
+    def __init__(self, processor, model):
+        self.processor = processor
+        self.model = model
+        self._prompts: dict[str, _VoicePrompt] = {}
+        self._refs: dict[str, int] = {}  # voice ids holding each entry
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+        self._create_voice_prompt = processor._create_voice_prompt
+        self._process_speech_inputs = model._process_speech_inputs
+        processor._create_voice_prompt = self._cached_voice_prompt
+        model._process_speech_inputs = self._cached_speech_inputs
+
+    # ── Registration ────────────────────────────────────────────────
+
+    def register(self, voice_hash: str, voice_sample):
+        """Process and encode a voice once; later calls for the same hash only take a reference."""
+        with self._lock:
+            if voice_hash in self._prompts:
+                self._refs[voice_hash] += 1
+                return
+        prompt = self._create_voice_prompt([voice_sample])
+
+        # Run the processor once on a placeholder line to get the padded speech
+        # tensor and masks exactly as generate() would receive them.
+        inputs = self.processor(text=["Speaker 0: ."], voice_samples=[[voice_sample]], return_tensors="pt")
+        device = next(self.model.parameters()).device
+        speech_tensor = inputs["speech_tensors"].to(device=device, dtype=self.model.dtype)
+        speech_masks = inputs["speech_masks"].to(device)
+
+        with torch.no_grad():
+            features, embeds = self._process_speech_inputs(speech_tensor, speech_masks)
+
+        with self._lock:
+            if voice_hash in self._prompts:  # registered by another thread meanwhile
+                self._refs[voice_hash] += 1
+                return
+            self._prompts[voice_hash] = _VoicePrompt(prompt, speech_tensor, speech_masks, features, embeds)
+            self._refs[voice_hash] = 1
+        print(f"Voice prompt cached: {voice_hash[:12]} ({speech_masks.shape[1]} acoustic frames)")
+
+    def forget(self, voice_hash: str):
+        """Release one reference; the last one drops the cached conditioning (frees its device tensors)."""
+        with self._lock:
+            refs = self._refs.get(voice_hash, 0) - 1
+            if refs > 0:
+                self._refs[voice_hash] = refs
+                return
+            self._refs.pop(voice_hash, None)
+            self._prompts.pop(voice_hash, None)
+
+    def __contains__(self, voice_hash: str) -> bool:
+        return voice_hash in self._prompts
+
+    # ── Use ─────────────────────────────────────────────────────────
+
+    def use(self, voice_hash: str):
+        """Context manager: processor/model calls in this block reuse the voice's cached conditioning."""
+        return _Active(self, self._prompts.get(voice_hash))
+
+    def speech_tensors(self, voice_hash: str, count: int):
+        """The cached speech tensor broadcast to a batch of count (a view, no copy)."""
+        speech_tensor = self._prompts[voice_hash].speech_tensor
+        return speech_tensor.expand(count, -1)
+
+    def _cached_voice_prompt(self, speaker_samples, *args, **kwargs):
+        entry = getattr(self._local, "entry", None)
+        if entry is None or len(speaker_samples) != 1:
+            return self._create_voice_prompt(speaker_samples, *args, **kwargs)
+        tokens, speech_inputs, speech_masks = entry.prompt
+        return list(tokens), list(speech_inputs), list(speech_masks)
+
+    def _cached_speech_inputs(self, speech_tensors, speech_masks, *args, **kwargs):
+        entry = getattr(self._local, "entry", None)
+        if entry is None or speech_masks.shape[1] != entry.speech_masks.shape[1]:
+            self.misses += 1
+            return self._process_speech_inputs(speech_tensors, speech_masks, *args, **kwargs)
+        self.hits += 1
+        count = speech_masks.shape[0]
+        return entry.features.expand(count, -1, -1), entry.embeds.repeat(count, 1)
+
+    def stats(self) -> dict:
+        return {
+            "voices": len(self._prompts),
+            "encoder_hits": self.hits,
+            "encoder_misses": self.misses,
+        }
+
+
+class _Active:
+    def __init__(self, cache: VoicePromptCache, entry: _VoicePrompt | None):
+        self.cache = cache
+        self.entry = entry
+
+    def __enter__(self):
+        self.previous = getattr(self.cache._local, "entry", None)
+        self.cache._local.entry = self.entry
+        return self.entry
+
+    def __exit__(self, *exc):
+        self.cache._local.entry = self.previous
+        return False
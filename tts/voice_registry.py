@@ -0,0 +1,167 @@
+"""
+Registry of named voices for the TTS servers.
+
+One loaded model can serve several narrator voices. Voices are registered by
+id from a directory of reference clips (id = file stem) and/or a JSON config::
+
+    {
+      "default": "narrator",
+      "voices": {
+        "narrator": "voices/narrator.wav",
+        "guest":    {"path": "voices/guest.flac"},
+        "aiden":    {"speaker": "Aiden", "language": "English"}
+      }
+    }
+
+A voice's spec is whatever the server needs to prepare it (a clip path for
+VibeVoice, a preset speaker for Qwen3-TTS). ``prepare(voice_id, spec)`` turns
+it into the ready-to-use voice (e.g. a loaded clip with its conditioning on
+the GPU). At most ``max_loaded`` prepared voices are kept, and the least
+recently used one is released when another has to be prepared.
+
+Every voice also has a ``fingerprint``. It is computed when the voice is
+registered and identifies its content for cache keys, so a cache hit never
+needs the voice to be loaded.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from result_cache import hash_key
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg", ".m4a", ".mp4", ".mkv", ".avi", ".mov", ".webm")
+
+
+def file_fingerprint(path: str, chunk_size: int = 1 << 20) -> str:
+    """Content hash of a reference clip."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UnknownVoice(KeyError):
+    """Raised for a voice id that isn't registered."""
+
+    def __str__(self):
+        return f"Unknown voice: {self.args[0]}"
+
+
+class VoiceRegistry:
+    """Named voice specs plus an LRU of prepared voices."""
+
+    def __init__(self, prepare, release=None, fingerprint=None, max_loaded: int = 4):
+        self.prepare = prepare
+        self.release = release
+        self.fingerprint_spec = fingerprint or (lambda spec: hash_key(spec))
+        self.max_loaded = max(1, max_loaded)
+        self.default: str | None = None
+
+        self._specs: dict[str, object] = {}
+        self._fingerprints: dict[str, str] = {}
+        self._loaded: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+
+    # ── Registration ────────────────────────────────────────────────
+
+    def add(self, voice_id: str, spec):
+        with self._lock:
+            self._unload(voice_id)
+            self._specs[voice_id] = spec
+            self._fingerprints[voice_id] = self.fingerprint_spec(spec)
+            if self.default is None:
+                self.default = voice_id
+
+    def add_directory(self, directory: str) -> int:
+        """Register every audio/video clip in a directory under its file stem."""
+        count = 0
+        for name in sorted(os.listdir(directory)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in AUDIO_EXTENSIONS:
+                self.add(stem, os.path.join(directory, name))
+                count += 1
+        return count
+
+    def add_config(self, path: str, paths: bool = True) -> int:
+        """
+        Register the voices of a JSON config. With paths (clip-based voices),
+        string specs are clip paths resolved against the config's directory.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        voices = config.get("voices", {})
+        for voice_id, spec in voices.items():
+            if paths and isinstance(spec, dict) and "path" in spec:
+                spec = spec["path"]
+            if paths and isinstance(spec, str):
+                spec = os.path.join(base, spec)
+            self.add(voice_id, spec)
+        if config.get("default"):
+            self.default = config["default"]
+        return len(voices)
+
+    # ── Lookup ──────────────────────────────────────────────────────
+
+    def resolve(self, voice_id: str | None) -> str:
+        """Voice id to use for a request (None means the default). Raises UnknownVoice."""
+        voice_id = voice_id or self.default
+        if voice_id not in self._specs:
+            raise UnknownVoice(voice_id)
+        return voice_id
+
+    def fingerprint(self, voice_id: str) -> str:
+        return self._fingerprints[voice_id]
+
+    def spec(self, voice_id: str):
+        return self._specs[voice_id]
+
+    def get(self, voice_id: str):
+        """The prepared voice, preparing it (and evicting the LRU voice) if needed."""
+        with self._lock:
+            voice = self._loaded.get(voice_id)
+            if voice is not None:
+                self._loaded.move_to_end(voice_id)
+                return voice
+
+            spec = self._specs[voice_id]
+            while len(self._loaded) >= self.max_loaded:
+                self._unload(next(iter(self._loaded)))
+                self.evictions += 1
+            print(f"Preparing voice '{voice_id}'...")
+            voice = self.prepare(voice_id, spec)
+            self._loaded[voice_id] = voice
+            self.loads += 1
+            return voice
+
+    def preload(self):
+        """Prepare the default voice and then others, up to max_loaded."""
+        ordered = [self.default] + [v for v in self._specs if v != self.default]
+        for voice_id in ordered[:self.max_loaded]:
+            if voice_id is not None:
+                self.get(voice_id)
+
+    def _unload(self, voice_id: str):
+        voice = self._loaded.pop(voice_id, None)
+        if voice is not None and self.release is not None:
+            self.release(voice_id, voice)
+
+    def ids(self) -> list[str]:
+        return list(self._specs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "default": self.default,
+                "registered": len(self._specs),
+                "loaded": list(self._loaded),
+                "max_loaded": self.max_loaded,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }